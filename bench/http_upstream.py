@@ -0,0 +1,114 @@
+"""HttpClient against a local fake upstream: pooling, retries and the breaker.
+
+    python bench/http_upstream.py [--requests 200] [--tls]
+
+Starts a threaded HTTP/1.1 stub server on localhost (with --tls, over
+HTTPS with a throwaway self-signed certificate made by the openssl CLI)
+and measures:
+
+- per-request latency of a fresh connection per call (plain
+  ``requests.get``) against the pooled HttpClient;
+- how many calls still succeed when half the responses are 503s;
+- after how many calls a host that always answers 500 gets its circuit
+  opened.
+"""
+import argparse
+import http.server
+import os
+import random
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import urllib3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from httpclient import CircuitOpenError, HttpClient  # noqa: E402
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        if self.path.startswith("/flaky"):
+            with self.lock:
+                status = 503 if self.rng.random() < 0.5 else 200
+        elif self.path.startswith("/down"):
+            status = 500
+        else:
+            status = 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def self_signed_context(directory):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                   check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def per_request(get, url, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        get(url).close()
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+    urllib3.disable_warnings()
+    with tempfile.TemporaryDirectory() as cert_dir:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        if args.tls:
+            server.socket = self_signed_context(cert_dir).wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"{'https' if args.tls else 'http'}://localhost:{server.server_address[1]}"
+
+        fresh = per_request(lambda url: requests.get(url, verify=False, timeout=5), f"{base}/ok", args.requests)
+        client = HttpClient(backoff=0.01)
+        pooled = per_request(lambda url: client.get(url, upstream="ok", verify=False), f"{base}/ok", args.requests)
+        print(f"fresh connection per call: {fresh * 1e3:.2f} ms/request")
+        print(f"pooled HttpClient:         {pooled * 1e3:.2f} ms/request ({fresh / pooled:.1f}x)")
+
+        ok = sum(client.get(f"{base}/flaky", upstream="flaky", verify=False).status_code == 200 for _ in range(100))
+        print(f"50% 503s, {client.retries} retries: {ok}/100 calls succeeded")
+
+        for calls in range(1, 100):
+            try:
+                client.get(f"{base}/down", upstream="down", verify=False)
+            except CircuitOpenError:
+                break
+        print(f"always 500: circuit open after {calls - 1} calls "
+              f"(breaker state: {client.breaker('down').state})")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Payload and prep time for an uploaded photo sent to Gemini inline.
+
+    python bench/image_prep.py [--width 4032] [--height 3024] [--sides 1536 1024]
+
+Makes a synthetic 12 MP phone-style JPEG (smooth gradients plus sensor
+noise, quality 92) and reports, for each longest side:
+- the bytes prepare_image sends and how long it takes (best of 5);
+- the same resize without JPEG draft decoding;
+- the temp-file round trip the old image path did;
+- the estimated upload time with base64 overhead.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from images import IMAGE_QUALITY, prepare_image  # noqa: E402
+
+
+def make_photo(width, height):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], -1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype('uint8')
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, 'JPEG', quality=92)
+    return out.getvalue()
+
+
+def prepare_without_draft(data, max_side):
+    """prepare_image's resize, decoding the full-size image first"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        image.convert("RGB").save(out, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+def temp_file_round_trip(data):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "temp_photo.jpg")
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path, 'rb') as f:
+            f.read()
+
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def upload_seconds(size, mbps):
+    # Inline blobs travel base64-encoded
+    return size * 4 / 3 * 8 / (mbps * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--sides", type=int, nargs="+", default=[1536, 1024])
+    args = parser.parse_args()
+    data = make_photo(args.width, args.height)
+    print(f"original: {args.width}x{args.height}, {len(data) / 1e6:.1f} MB")
+    seconds, _ = best_of(lambda: temp_file_round_trip(data))
+    print(f"temp file round trip: {seconds * 1e3:.1f} ms")
+    for side in args.sides:
+        seconds, (sent, _) = best_of(lambda: prepare_image(data, "image/jpeg", side))
+        no_draft, _ = best_of(lambda: prepare_without_draft(data, side))
+        print(f"{side} px: {len(sent) / 1e3:.0f} KB sent, prep {seconds * 1e3:.0f} ms "
+              f"({no_draft * 1e3:.0f} ms without draft decoding)")
+    sent, _ = prepare_image(data, "image/jpeg", args.sides[0])
+    for mbps in (10, 50):
+        print(f"upload at {mbps} Mbit/s: original {upload_seconds(len(data), mbps):.2f} s, "
+              f"{args.sides[0]} px {upload_seconds(len(sent), mbps):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
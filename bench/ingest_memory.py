@@ -0,0 +1,60 @@
+"""Peak memory and time of ingesting a large text upload, term index included.
+
+    python bench/ingest_memory.py [--mb 50]
+
+Writes a generated text document of roughly ``--mb`` megabytes to a
+temporary file, then ingests it from disk in a fresh child process and
+reports the chunk count, wall time and how much the child's peak RSS grew
+over its peak after imports. Running in a child keeps the generated text
+out of the measurement. Peak RSS is read from VmHWM in /proc/self/status,
+because ru_maxrss carries the parent's peak over across exec.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+from relevant_chunks import make_text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import re, sys, time
+sys.path.insert(0, sys.argv[1])
+from ingest import ingest
+def peak_kb():
+    with open("/proc/self/status") as f:
+        return int(re.search(r"VmHWM:\\s+(\\d+)", f.read()).group(1))
+before = peak_kb()
+start = time.perf_counter()
+with open(sys.argv[2], 'rb') as f:
+    document = ingest(f, "bench.txt", sys.argv[3])
+seconds = time.perf_counter() - start
+after = peak_kb()
+print(document['chunks'], seconds, (after - before) / 1024)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, default=50)
+    args = parser.parse_args()
+    text, _ = make_text(args.mb, random.Random(0))
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "bench.txt")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write(text)
+        del text
+        store_dir = os.path.join(directory, "uploads")
+        result = subprocess.run([sys.executable, "-c", CHILD, ROOT, source, store_dir],
+                                check=True, capture_output=True, text=True)
+        chunks, seconds, grown = result.stdout.split()
+        size = os.path.getsize(source) / 2 ** 20
+        print(f"{size:.0f} MB upload: {int(chunks):,} chunks in {float(seconds):.1f}s, "
+              f"peak RSS grew {float(grown):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Sign-in lookup latency: username index vs scanning every user.
+
+    python bench/login_latency.py [--users 1000 10000 100000] [--lookups 200]
+
+Writes a users.json of each size into a temporary directory and times
+warm JsonRepository.get_user_by_username calls for random existing
+usernames, against the linear scan over users.json it replaced. Password
+hashing is not included; only the user lookup is measured.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import JsonRepository  # noqa: E402
+from storage import save_json  # noqa: E402
+
+
+def scan_user_by_username(repo, username):
+    """The lookup before the index: walk every user in users.json"""
+    return next(((uid, user) for uid, user in repo._users().items()
+                 if user.get('username') == username), None)
+
+
+def make_users(count):
+    return {f"id-{n}": {'username': f"user{n}", 'password': "hash", 'email': "",
+                        'created_at': "2024-01-01T00:00:00"} for n in range(count)}
+
+
+def per_call(lookup, names):
+    start = time.perf_counter()
+    for name in names:
+        assert lookup(name) is not None
+    return (time.perf_counter() - start) / len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    print(f"{'users':>8} {'index':>10} {'scan':>10}")
+    for count in args.users:
+        with tempfile.TemporaryDirectory() as data_dir:
+            users_file = os.path.join(data_dir, "users.json")
+            save_json(users_file, make_users(count))
+            repo = JsonRepository(users_file, os.path.join(data_dir, "chats"))
+            names = [f"user{rng.randrange(count)}" for _ in range(args.lookups)]
+            # Warm the parsed-file cache and build the index before timing
+            repo.get_user_by_username(names[0])
+            indexed = per_call(repo.get_user_by_username, names)
+            scanned = per_call(lambda name: scan_user_by_username(repo, name), names)
+            print(f"{count:>8} {indexed * 1e6:>8.0f}us {scanned * 1e3:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Server cost of an idle quiz taker, before and after the client-side countdown.
+
+    python bench/quiz_load.py --before REF [--seconds 10] [--settle 5]
+
+``REF`` is any git ref for a tree whose quiz timer still reran the script
+every second (time.sleep(1); st.rerun()), e.g. the parent of the commit
+that moved the countdown to the client. It has no default, since the
+right commit depends on the branch being measured.
+
+A quiz taker is an AppTest session with a running quiz that nobody
+touches. The session runs in a fresh interpreter with its own data
+directory, once for the tree at ``--before`` (exported with ``git
+archive``) and once for the working tree. After ``--settle`` seconds for
+the first render, the script's reruns and the CPU time of its script
+thread are counted for ``--seconds``. Dividing one core by that CPU cost
+estimates how many idle quizzes one process sustains.
+
+AppTest sessions share one mock runtime per process, so concurrent
+sessions can't be simulated in-process; the per-quiz cost is what scales.
+Thread CPU time is read from /proc, so this runs on Linux only.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [{'question': f"question {n}?", 'options': [{'text': text} for text in "abcd"], 'correct': "A"}
+             for n in range(5)]
+
+
+def script_cpu_time():
+    """CPU seconds used so far by the live Streamlit script threads"""
+    ticks = 0
+    for thread in threading.enumerate():
+        if thread.name.startswith("ScriptRunner"):
+            try:
+                with open(f"/proc/self/task/{thread.native_id}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            # utime and stime are fields 14 and 15 of the stat line
+            ticks += int(fields[11]) + int(fields[12])
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def measure(tree, seconds, settle):
+    """Runs in the child: one idle quiz session of ``tree``"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    reruns = []
+    rerun = st.rerun
+
+    def counting_rerun():
+        reruns.append(time.monotonic())
+        rerun()
+    st.rerun = counting_rerun
+
+    def start_quiz():
+        app = AppTest.from_file(os.path.join(tree, "sigmabot.py"), default_timeout=settle + seconds)
+        app.session_state.user = {'id': "u1", 'username': "user1"}
+        app.session_state.quiz_questions = QUESTIONS
+        app.session_state.quiz_start_time = time.time()
+        app.session_state.quiz_duration = 60
+        try:
+            app.run()
+        except RuntimeError:
+            # The old timer never lets the script run finish
+            pass
+
+    threading.Thread(target=start_quiz, daemon=True).start()
+    time.sleep(settle)
+    reruns.clear()
+    cpu = script_cpu_time()
+    time.sleep(seconds)
+    cpu = script_cpu_time() - cpu
+    return {'reruns': len(reruns), 'cpu': cpu}
+
+
+def export(ref, into):
+    archive = subprocess.run(["git", "archive", ref], cwd=ROOT, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(into)
+    return into
+
+
+def run_child(tree, seconds, settle):
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ, SIGMABOT_MOCK_LLM="1", SIGMABOT_QUIZ_BANK="0", PYTHONPATH=tree)
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", tree, str(seconds), str(settle)],
+            cwd=data_dir, env=env, check=True, capture_output=True, text=True).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--settle", type=float, default=5)
+    parser.add_argument("--before", metavar="REF", help="git ref of the tree to compare against")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        tree, seconds, settle = args.child
+        sys.path.insert(0, tree)
+        print(json.dumps(measure(tree, float(seconds), float(settle))), flush=True)
+        # The old timer's script thread loops forever; don't wait for it
+        os._exit(0)
+    if not args.before:
+        parser.error("--before REF is required")
+
+    with tempfile.TemporaryDirectory() as before_dir:
+        trees = [(f"before ({args.before})", export(args.before, before_dir)), ("after", ROOT)]
+        print(f"{'tree':<22} {'reruns/s':>9} {'cpu s/s':>8} {'idle quizzes/core':>18}")
+        for name, tree in trees:
+            result = run_child(tree, args.seconds, args.settle)
+            cpu = result['cpu'] / args.seconds
+            capacity = f"{1 / cpu:.0f}" if cpu else "unbounded"
+            print(f"{name:<22} {result['reruns'] / args.seconds:>9.1f} {cpu:>8.3f} {capacity:>18}")
+
+
+if __name__ == "__main__":
+    main()
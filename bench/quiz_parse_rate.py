@@ -0,0 +1,159 @@
+"""Quiz responses that end up usable: the old line parser vs structured.py.
+
+    python bench/quiz_parse_rate.py [--fixtures bench/fixtures/quiz_responses.jsonl]
+    python bench/quiz_parse_rate.py --write-fixtures
+
+The fixture corpus is self-generated: no real Gemini outputs are
+available, so --write-fixtures writes it from a fixed seed. Each line is
+{"style", "text"}, a 5-question quiz response in one of the drift styles
+below (fences, prose, wrappers, truncation, legacy line variants). These
+styles are the cases the parser is built to handle, not a sample of what
+Gemini actually returns, so the rates only compare the two parsers on them.
+
+A response is usable when it yields 5 questions, each with 4 options and
+a correct letter. The old parser gets one try; anything else needs a full
+re-generation. The new path runs generate_items with a stand-in model
+that answers a repair prompt with exactly the missing questions, and
+counts how many responses needed that one targeted repair.
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured import generate_items, parse_questions  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "quiz_responses.jsonl")
+LETTERS = "ABCD"
+
+
+def legacy_parse(response_text):
+    """The quiz parser before structured.py, as it was in generate_quiz"""
+    questions = []
+    current_question = None
+    for line in response_text.split('\n'):
+        line = line.strip()
+        if line.startswith('Q:'):
+            if current_question:
+                questions.append(current_question)
+            current_question = {'question': line[2:].strip(), 'options': [], 'correct': None}
+        elif line.startswith(('A)', 'B)', 'C)', 'D)')):
+            current_question['options'].append({'letter': line[0], 'text': line[2:].strip()})
+        elif line.startswith('Correct:'):
+            current_question['correct'] = line[8:].strip()
+    if current_question:
+        questions.append(current_question)
+    return questions
+
+
+def usable(questions, count=5):
+    return len(questions) >= count and all(
+        question['question'] and len(question['options']) == 4 and question['correct'] in set(LETTERS)
+        for question in questions[:count])
+
+
+def make_questions(rng, count=5, start=0):
+    questions = []
+    for n in range(start, start + count):
+        options = [f"option {n}{letter.lower()}" for letter in LETTERS]
+        questions.append({'question': f"what is fact number {n}?", 'options': options,
+                          'correct': rng.choice(LETTERS)})
+    return questions
+
+
+def as_json(questions):
+    return json.dumps(questions, indent=2)
+
+
+def as_lines(questions, question="Q: {}", option="{letter}) {text}", correct="Correct: {}"):
+    lines = []
+    for item in questions:
+        lines.append(question.format(item['question']))
+        lines += [option.format(letter=letter, text=text) for letter, text in zip(LETTERS, item['options'])]
+        lines.append(correct.format(item['correct']))
+        lines.append("")
+    return "\n".join(lines)
+
+
+STYLES = {
+    # JSON requested via response_schema, with drift around it
+    "json": lambda q, rng: as_json(q),
+    "json_fenced": lambda q, rng: f"```json\n{as_json(q)}\n```",
+    "json_prose": lambda q, rng: f"here's your quiz bro!\n{as_json(q)}\nhope that helps",
+    "json_wrapped": lambda q, rng: json.dumps({'questions': q}),
+    "json_truncated": lambda q, rng: as_json(q)[:-rng.randrange(20, 120)],
+    "json_three_options": lambda q, rng: as_json([dict(item, options=item['options'][:3]) if n == 2 else item
+                                                  for n, item in enumerate(q)]),
+    # The legacy line format and its variants
+    "lines": lambda q, rng: as_lines(q),
+    "lines_numbered": lambda q, rng: "\n".join(as_lines([item], question=f"{n}. Q: {{}}")
+                                              for n, item in enumerate(q, 1)),
+    "lines_bold": lambda q, rng: as_lines(q, question="**Q:** {}", correct="**Correct:** {}"),
+    "lines_lowercase": lambda q, rng: re.sub(r"(?m)^([A-D])\)", lambda m: m.group(1).lower() + ")", as_lines(q)),
+    "lines_answer": lambda q, rng: as_lines(q, correct="Answer: {}"),
+    "lines_preamble": lambda q, rng: "A) quick note: answers are below each question\n" + as_lines(q),
+}
+# Responses per style: 120 JSON, 80 legacy
+COUNTS = {"json": 40, "json_fenced": 12, "json_prose": 12, "json_wrapped": 10, "json_truncated": 26,
+          "json_three_options": 20, "lines": 24, "lines_numbered": 10, "lines_bold": 10,
+          "lines_lowercase": 12, "lines_answer": 12, "lines_preamble": 12}
+
+
+def write_fixtures(path, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for style, count in COUNTS.items():
+            for _ in range(count):
+                f.write(json.dumps({'style': style, 'text': STYLES[style](make_questions(rng), rng)}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--write-fixtures", action="store_true")
+    args = parser.parse_args()
+    if args.write_fixtures:
+        write_fixtures(args.fixtures)
+        print(f"wrote {args.fixtures}")
+        return
+    with open(args.fixtures, encoding="utf-8") as f:
+        fixtures = [json.loads(line) for line in f]
+
+    rng = random.Random(1)
+    old = collections.Counter()
+    new = collections.Counter()
+    for fixture in fixtures:
+        family = "legacy" if fixture['style'].startswith("lines") else "json"
+        try:
+            old[family, "usable" if usable(legacy_parse(fixture['text'])) else "unusable"] += 1
+        except (AttributeError, TypeError):
+            old[family, "crashed"] += 1
+
+        calls = []
+
+        def generate(prompt):
+            calls.append(prompt)
+            if len(calls) == 1:
+                return fixture['text']
+            missing = int(re.search(r"return exactly (\d+) more", prompt).group(1))
+            return as_json(make_questions(rng, missing, start=100))
+        questions = generate_items(generate, "quiz prompt", parse_questions, 5, "quiz")
+        new["usable" if usable(questions) else "unusable"] += 1
+        new["repaired"] += len(calls) > 1
+
+    for family in ("json", "legacy"):
+        total = sum(count for (name, _), count in old.items() if name == family)
+        print(f"old parser, {family:<6} {total:>3} responses: {old[family, 'usable']} usable, "
+              f"{old[family, 'unusable']} unusable, {old[family, 'crashed']} crashed")
+    print(f"new path, all {len(fixtures)} responses: {new['usable']} usable, {new['unusable']} unusable; "
+          f"{new['repaired']} needed one targeted repair ({new['repaired'] / len(fixtures):.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Per-turn cost of picking document excerpts: full chunk-file scan vs term index.
+
+    python bench/relevant_chunks.py [--mb 25] [--turns 20]
+
+Generates a text document of roughly ``--mb`` megabytes, ingests it into a
+temporary directory and times ``relevant_chunks`` for a set of queries,
+against a reference that streams and scores the whole chunk file the way
+every turn used to.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import _terms, ingest, iter_document_chunks, relevant_chunks  # noqa: E402
+
+
+def scan_relevant_chunks(document, query, budget):
+    terms = _terms(query)
+    keep = max(1, budget // 100)
+    scored = sorted(((len(terms & _terms(chunk['text'])), -chunk['i'], chunk)
+                     for chunk in iter_document_chunks(document)),
+                    key=lambda item: item[:2], reverse=True)[:keep]
+    return [chunk for _, _, chunk in scored]
+
+
+def make_text(megabytes, rng):
+    vocabulary = [f"{rng.choice('bcdfghjklmnpst')}{rng.choice('aeiou')}{rng.randrange(10 ** 4)}"
+                  for _ in range(20000)]
+    paragraphs, size = [], 0
+    while size < megabytes * 2 ** 20:
+        paragraph = " ".join(rng.choice(vocabulary) for _ in range(120))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs), vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, default=25)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    text, vocabulary = make_text(args.mb, rng)
+    queries = [" ".join(rng.choice(vocabulary) for _ in range(8)) for _ in range(args.turns)]
+    with tempfile.TemporaryDirectory() as store_dir:
+        start = time.perf_counter()
+        document = ingest(io.BytesIO(text.encode()), "bench.txt", store_dir)
+        print(f"ingest ({document['chunks']} chunks, incl. index): {time.perf_counter() - start:.2f}s")
+        for name, pick in (("full scan", scan_relevant_chunks), ("term index", relevant_chunks)):
+            start = time.perf_counter()
+            for query in queries:
+                pick(document, query, 2000)
+            print(f"{name}: {(time.perf_counter() - start) / len(queries) * 1000:.1f} ms/turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Bytes sent to the browser while a reply streams in.
+
+    python bench/render_bytes.py [--chars 5000] [--token 5] [--every 0.02]
+
+Replays a generated reply of ``--chars`` characters as ``--token``-sized
+chunks arriving every ``--every`` seconds (on a simulated clock, so the
+script runs instantly) and counts the message bytes each strategy
+re-sends: the original per-character typing loop, re-rendering on every
+chunk, and FrameRenderer. Only the reply text is counted, not the
+surrounding message HTML. Also checks that genz_style matches the chain
+of str.replace calls it replaced.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rendering import SLANG, FrameRenderer, genz_style  # noqa: E402
+
+WORDS = ["the", "model", "okay", "so", "thank you", "by the way", "I am", "right now", "you are",
+         "honestly", "to be honest", "brother", "answer", "for real", "what's up", "in my opinion"]
+
+
+def replace_chain(text):
+    """genz_style as it was: one str.replace per phrase, in table order"""
+    text = text.lower()
+    for phrase, short in SLANG.items():
+        text = text.replace(phrase, short)
+    return text
+
+
+def make_reply(chars, rng):
+    words = []
+    while sum(len(word) + 1 for word in words) < chars:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)[:chars]
+
+
+def size(text):
+    return len(text.encode('utf-8'))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars", type=int, default=5000)
+    parser.add_argument("--token", type=int, default=5)
+    parser.add_argument("--every", type=float, default=0.02)
+    args = parser.parse_args()
+    reply = make_reply(args.chars, random.Random(0))
+    chunks = [reply[i:i + args.token] for i in range(0, len(reply), args.token)]
+
+    styled = replace_chain(reply)
+    per_character = sum(size(styled[:n]) for n in range(1, len(styled) + 1))
+    per_chunk = sum(size(genz_style(reply[:n])) for n in range(args.token, len(reply) + args.token, args.token))
+
+    clock = Clock()
+    renderer = FrameRenderer(lambda text: None, clock=clock)
+    for chunk in chunks:
+        renderer.feed(chunk)
+        clock.now += args.every
+    renderer.close()
+
+    print(f"reply: {size(reply)} bytes raw, {size(styled)} styled, {len(chunks)} chunks")
+    print(f"per-character loop: {per_character:>12,} bytes in {len(styled):,} frames")
+    print(f"render every chunk: {per_chunk:>12,} bytes in {len(chunks):,} frames")
+    print(f"FrameRenderer:      {renderer.bytes_emitted:>12,} bytes in {renderer.frames:,} frames "
+          f"({renderer.bytes_emitted / size(reply):.1f}x the raw reply)")
+    print(f"genz_style matches the replace chain: {genz_style(reply) == styled}")
+
+
+if __name__ == "__main__":
+    main()
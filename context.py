@@ -0,0 +1,94 @@
+import metrics
+
+# Rough token estimate for Gemini-style tokenizers; avoids a count_tokens call per turn
+CHARS_PER_TOKEN = 4
+
+# Histogram buckets for prompt sizes, in tokens
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_turn(message, max_chars=None):
+    speaker = "user" if message.get('role') == 'user' else "sigmabot"
+    content = message.get('content', '')
+    if max_chars is not None and len(content) > max_chars:
+        content = content[:max_chars] + " ...(truncated)"
+    return f"{speaker}: {content}"
+
+
+class ContextWindow:
+    """Token-budgeted conversation context: a running summary plus recent turns.
+
+    The most recent turns are sent verbatim as long as they fit in
+    ``budget`` tokens. Once older turns no longer fit, they are folded into
+    a running summary by ``summarize(summary, messages)``; the window is then
+    trimmed down to ``low_water`` of the budget so the summary is updated in
+    batches rather than on every turn.
+
+    Progress is kept in a caller-owned ``state`` dict ({'upto', 'summary'}),
+    where ``upto`` is the number of history messages already summarized.
+    A single fold covers at most ``fold_budget`` tokens (4x the budget by
+    default) of the newest turns leaving the window; anything older that
+    was never summarized, such as a long chat opened without saved state,
+    is skipped rather than sent in one oversized summary prompt.
+    """
+
+    def __init__(self, summarize, budget=1500, low_water=0.5, fold_budget=None):
+        self.summarize = summarize
+        self.budget = budget
+        self.low_water = low_water
+        self.fold_budget = fold_budget or budget * 4
+
+    def window(self, history, state):
+        """Return (summary, recent messages) for ``history``, summarizing if needed"""
+        upto = min(state.get('upto', 0), len(history))
+        start, used = len(history), 0
+        while start > upto:
+            cost = estimate_tokens(format_turn(history[start - 1]))
+            if used + cost > self.budget:
+                break
+            start -= 1
+            used += cost
+
+        if start > upto:
+            # Some unsummarized turns no longer fit; leave headroom before the next fold
+            while start < len(history) and used > self.budget * self.low_water:
+                used -= estimate_tokens(format_turn(history[start]))
+                start += 1
+            first, folded = start, 0
+            while first > upto:
+                cost = estimate_tokens(format_turn(history[first - 1]))
+                if first < start and folded + cost > self.fold_budget:
+                    break
+                first -= 1
+                folded += cost
+            if first > upto:
+                metrics.incr("chat_turns_skipped_total", first - upto)
+            state['summary'] = self.summarize(state.get('summary', ''), history[first:start])
+            state['upto'] = upto = start
+            metrics.incr("chat_summaries_total")
+        return state.get('summary', ''), history[upto:]
+
+    def build_prompt(self, instruction, history, question, state):
+        """Assemble the prompt for ``question`` and return (prompt, token counts)"""
+        summary, recent = self.window(history, state)
+        parts = [instruction]
+        if summary:
+            parts.append(f"summary of the earlier conversation:\n{summary}")
+        if recent:
+            parts.append("recent messages:\n" + "\n".join(format_turn(message) for message in recent))
+        parts.append(f"user: {question}")
+        prompt = "\n\n".join(parts)
+
+        tokens = {
+            'summary': estimate_tokens(summary),
+            'recent': sum(estimate_tokens(format_turn(message)) for message in recent),
+            'question': estimate_tokens(question),
+            'total': estimate_tokens(prompt),
+            'recent_turns': len(recent),
+        }
+        metrics.observe("chat_prompt_tokens", tokens['total'], buckets=TOKEN_BUCKETS)
+        return prompt, tokens
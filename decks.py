@@ -0,0 +1,286 @@
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import metrics
+from storage import atomic_write, file_lock, file_signature, json_cache, update_json
+
+DAY = 24 * 3600
+
+# A card counts as mastered once its review interval reaches this many days
+MASTERED_INTERVAL = 21
+
+# Review grades offered in the UI (SM-2 quality, 0-5)
+GRADES = {"Again": 1, "Hard": 3, "Good": 4, "Easy": 5}
+
+
+def source_key(kind, content):
+    """Identify what a deck was generated from, so it can be reused"""
+    if kind == "document":
+        return f"document:{content}"
+    normalized = " ".join(content.split()).casefold()
+    return f"text:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+
+def schedule(card, quality, now):
+    """Return the SM-2 scheduling fields after reviewing ``card`` with ``quality``.
+
+    A failed review (quality < 3) restarts the repetitions and brings the
+    card back in a minute; otherwise the interval goes 1 day, 6 days, then
+    grows by the card's ease factor.
+    """
+    ease = card.get('ease', 2.5)
+    reps = card.get('reps', 0)
+    interval = card.get('interval', 0)
+    if quality < 3:
+        reps = 0
+        interval = 0
+        due = now + 60
+    else:
+        reps += 1
+        if reps == 1:
+            interval = 1
+        elif reps == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+        due = now + interval * DAY
+    ease = max(1.3, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {
+        'ease': round(ease, 3),
+        'interval': interval,
+        'reps': reps,
+        'due': due,
+        'last_reviewed': datetime.fromtimestamp(now).isoformat(),
+        'mastered': interval >= MASTERED_INTERVAL
+    }
+
+
+class Deck:
+    """A flashcard deck with a due-date priority queue.
+
+    Cards are kept in a list (card id = position) and a min-heap of
+    (due, card id, version) entries. Reviewing a card pushes a new entry
+    and bumps the card's version, so stale entries are skipped lazily when
+    they reach the top; next_due() is O(log n) amortized.
+    """
+
+    def __init__(self, meta, cards):
+        self.meta = meta
+        self.cards = cards
+        self.mastered = sum(1 for card in cards if card.get('mastered'))
+        self._versions = [0] * len(cards)
+        self._heap = [(card.get('due', 0), i, 0) for i, card in enumerate(cards)]
+        heapq.heapify(self._heap)
+
+    @property
+    def id(self):
+        return self.meta['id']
+
+    def next_due(self):
+        """Return (card id, card) with the earliest due time, or None"""
+        while self._heap:
+            due, card_id, version = self._heap[0]
+            if version == self._versions[card_id]:
+                return card_id, self.cards[card_id]
+            heapq.heappop(self._heap)
+        return None
+
+    def apply(self, card_id, fields):
+        card = self.cards[card_id]
+        self.mastered += int(bool(fields.get('mastered'))) - int(bool(card.get('mastered')))
+        card.update(fields)
+        self._versions[card_id] += 1
+        heapq.heappush(self._heap, (card['due'], card_id, self._versions[card_id]))
+        # Keep stale entries from piling up
+        if len(self._heap) > 2 * len(self.cards) + 64:
+            self._heap = [(c.get('due', 0), i, self._versions[i]) for i, c in enumerate(self.cards)]
+            heapq.heapify(self._heap)
+
+    def summary(self):
+        return {
+            'title': self.meta.get('title'),
+            'source': self.meta.get('source'),
+            'created_at': self.meta.get('created_at'),
+            'cards': len(self.cards)
+        }
+
+
+class DeckStore:
+    """Per-user flashcard decks, one append-only log per deck.
+
+    ``<root>/<user_id>/<deck_id>.jsonl`` starts with a deck record and one
+    record per card; each review appends a record with the card's new
+    scheduling fields. Once reviews outnumber cards the log is rewritten
+    with the current state. Each user's ``index.json`` maps deck ids to
+    summaries (title, source, card count) for listing and reuse.
+
+    Parsed decks are shared by every session in the process and reloaded
+    when the log changes underneath (another process appended to it). Each
+    deck has its own lock, so parsing or reviewing one deck doesn't hold up
+    sessions working with other decks.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        # Guards _deck_locks only
+        self._lock = threading.Lock()
+        self._deck_locks = {}
+        self._decks = {}
+
+    def _deck_lock(self, deck_id):
+        with self._lock:
+            lock = self._deck_locks.get(deck_id)
+            if lock is None:
+                lock = self._deck_locks[deck_id] = threading.RLock()
+            return lock
+
+    def _user_dir(self, user_id):
+        if not user_id or os.sep in user_id or user_id.startswith('.'):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.root, user_id)
+
+    def _path(self, user_id, deck_id):
+        if os.sep in deck_id or deck_id.startswith('.'):
+            raise ValueError(f"Invalid deck id: {deck_id!r}")
+        return os.path.join(self._user_dir(user_id), f"{deck_id}.jsonl")
+
+    def _index_path(self, user_id):
+        return os.path.join(self._user_dir(user_id), "index.json")
+
+    @staticmethod
+    def _parse(path):
+        meta, cards, reviews = None, [], 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record['t'] == 'deck':
+                    meta = {k: v for k, v in record.items() if k != 't'}
+                elif record['t'] == 'card':
+                    cards.append(record['c'])
+                elif record['t'] == 'review':
+                    cards[record['id']].update(record['s'])
+                    reviews += 1
+        return meta, cards, reviews
+
+    def _write(self, path, meta, cards):
+        lines = [json.dumps({'t': 'deck', **meta})]
+        lines.extend(json.dumps({'t': 'card', 'c': card}) for card in cards)
+        atomic_write(path, '\n'.join(lines) + '\n')
+
+    def list_decks(self, user_id):
+        """Return {deck_id: summary} for the user's decks"""
+        try:
+            return dict(json_cache.get(self._index_path(user_id)))
+        except (OSError, ValueError):
+            return {}
+
+    def find_by_source(self, user_id, source):
+        for deck_id, summary in self.list_decks(user_id).items():
+            if summary.get('source') == source:
+                return deck_id
+        return None
+
+    def create_deck(self, user_id, title, cards, source=None):
+        """Persist a new deck of ``cards`` (dicts with term/definition) and return it"""
+        now = time.time()
+        meta = {'id': str(uuid.uuid4()), 'user_id': user_id, 'title': title,
+                'source': source, 'created_at': datetime.now().isoformat()}
+        cards = [{'term': card['term'], 'definition': card['definition'],
+                  'ease': 2.5, 'interval': 0, 'reps': 0, 'due': now,
+                  'last_reviewed': None, 'mastered': False} for card in cards]
+        os.makedirs(self._user_dir(user_id), exist_ok=True)
+        path = self._path(user_id, meta['id'])
+        with self._deck_lock(meta['id']), file_lock(path):
+            self._write(path, meta, cards)
+            deck = Deck(meta, cards)
+            self._decks[meta['id']] = (deck, 0, file_signature(path))
+
+        def add(index):
+            index[meta['id']] = deck.summary()
+        update_json(self._index_path(user_id), add)
+        metrics.incr("decks_created_total")
+        return deck
+
+    def load_deck(self, user_id, deck_id):
+        """Return the deck, or None if it doesn't exist"""
+        path = self._path(user_id, deck_id)
+        with self._deck_lock(deck_id):
+            try:
+                signature = file_signature(path)
+            except OSError:
+                return None
+            cached = self._decks.get(deck_id)
+            if cached is not None and cached[2] == signature:
+                return cached[0]
+            meta, cards, reviews = self._parse(path)
+            deck = Deck(meta, cards)
+            self._decks[deck_id] = (deck, reviews, signature)
+            return deck
+
+    def next_due(self, user_id, deck_id):
+        """Return (deck, card id, card) for the deck's most-due card, or None"""
+        with self._deck_lock(deck_id):
+            deck = self.load_deck(user_id, deck_id)
+            if deck is None:
+                return None
+            due = deck.next_due()
+            return (deck,) + due if due is not None else None
+
+    def review(self, user_id, deck_id, card_id, quality, now=None):
+        """Grade a card and append the review; returns its new schedule, or None if the deck is gone"""
+        path = self._path(user_id, deck_id)
+        with self._deck_lock(deck_id), file_lock(path):
+            deck = self.load_deck(user_id, deck_id)
+            if deck is None:
+                # Deleted while we waited for the lock; don't recreate the file
+                return None
+            fields = schedule(deck.cards[card_id], quality, now or time.time())
+            deck.apply(card_id, fields)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'t': 'review', 'id': card_id, 's': fields}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            reviews = self._decks[deck_id][1] + 1
+            if reviews > max(64, len(deck.cards)):
+                self._write(path, deck.meta, deck.cards)
+                reviews = 0
+            self._decks[deck_id] = (deck, reviews, file_signature(path))
+        metrics.incr("flashcard_reviews_total", grade=str(quality))
+        return fields
+
+    def delete_deck(self, user_id, deck_id):
+        path = self._path(user_id, deck_id)
+        with self._deck_lock(deck_id), file_lock(path):
+            # file_lock notices the removed lock file in writers waiting on it
+            for leftover in (path, f"{path}.lock"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            self._decks.pop(deck_id, None)
+        with self._lock:
+            self._deck_locks.pop(deck_id, None)
+
+        def remove(index):
+            if deck_id not in index:
+                return False
+            del index[deck_id]
+        update_json(self._index_path(user_id), remove)
+
+
+_deck_stores = {}
+_deck_stores_lock = threading.Lock()
+
+
+def get_deck_store(root):
+    with _deck_stores_lock:
+        store = _deck_stores.get(root)
+        if store is None:
+            store = _deck_stores[root] = DeckStore(root)
+        return store
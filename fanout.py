@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+# Shared pool for I/O-bound helper calls; threads outlive individual reruns
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="sigmabot-io")
+
+
+def submit(fn, *args, **kwargs):
+    """Start ``fn`` in the background and return its future"""
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def fan_out(tasks, timeout):
+    """Run independent calls concurrently and collect what finishes in time.
+
+    ``tasks`` maps a key to ``(fn, args, fallback)``. All calls start at
+    once and share one deadline ``timeout`` seconds away; a call that raises
+    or misses the deadline yields its fallback instead, so the caller always
+    gets a complete (if partly degraded) result dict.
+    """
+    futures = {key: _executor.submit(fn, *args) for key, (fn, args, _) in tasks.items()}
+    deadline = time.monotonic() + timeout
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception:
+            future.cancel()
+            metrics.incr("fanout_fallbacks_total")
+            results[key] = tasks[key][2]
+    return results
+
+
+def map_bounded(fn, items, limit, fallback=None):
+    """Return ``[fn(item) for item in items]`` with at most ``limit`` calls running.
+
+    Calls share the module's pool; a call that raises yields ``fallback``.
+    """
+    items = list(items)
+    results = [fallback] * len(items)
+    running = {}
+    position = 0
+    while position < len(items) or running:
+        while position < len(items) and len(running) < limit:
+            running[_executor.submit(fn, items[position])] = position
+            position += 1
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = running.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception:
+                metrics.incr("fanout_fallbacks_total")
+    return results
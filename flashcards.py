@@ -0,0 +1,125 @@
+import itertools
+import json
+import re
+
+import metrics
+from context import estimate_tokens
+from fanout import map_bounded
+from ingest import iter_chunks
+
+# Content up to this size is sent in one prompt; larger content is map-reduced
+MAP_TOKENS = 3000
+# Bounds on the map step: concurrent Gemini calls and calls per document
+MAP_CONCURRENCY = 8
+MAX_MAP_CALLS = 32
+MAX_CARDS = 200
+
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def parse_cards(text):
+    """Parse "term: definition" lines from a model response"""
+    cards = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if ':' in line:
+            term, definition = line.split(':', 1)
+            term = _LIST_MARKER.sub("", term).strip(" *_")
+            definition = definition.strip(" *_")
+            if not term or not definition:
+                continue
+            cards.append({
+                'term': term,
+                'definition': definition,
+                'mastered': False,
+                'last_reviewed': None
+            })
+    return cards
+
+
+def normalize_term(term):
+    return " ".join(re.sub(r"[^\w\s]", " ", term).split()).casefold()
+
+
+def merge_cards(card_lists, limit=MAX_CARDS):
+    """Deduplicate cards from several chunks and rank them.
+
+    Cards with the same normalized term are merged, keeping the longest
+    definition. Terms produced by more chunks rank first (they are central
+    to the document); ties keep document order.
+    """
+    merged = {}
+    for cards in card_lists:
+        for card in cards or []:
+            key = normalize_term(card['term'])
+            if not key:
+                continue
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = entry = {'card': card, 'count': 0, 'order': len(merged)}
+            elif len(card['definition']) > len(entry['card']['definition']):
+                entry['card'] = card
+            entry['count'] += 1
+    ranked = sorted(merged.values(), key=lambda entry: (-entry['count'], entry['order']))
+    return [entry['card'] for entry in ranked[:limit]]
+
+
+def _map_units(chunks):
+    """Group consecutive chunks into units of about MAP_TOKENS tokens"""
+    unit, used = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if unit and used + tokens > MAP_TOKENS:
+            yield "\n\n".join(unit)
+            unit, used = [], 0
+        unit.append(chunk)
+        used += tokens
+    if unit:
+        yield "\n\n".join(unit)
+
+
+def _spread(units, limit):
+    """At most ``limit`` units, evenly spaced through the document"""
+    if len(units) <= limit:
+        return units
+    step = len(units) / limit
+    return [units[int(i * step)] for i in range(limit)]
+
+
+def map_reduce_cards(units, generate_chunk, concurrency=MAP_CONCURRENCY):
+    """Generate cards for each of ``units`` concurrently, then merge.
+
+    ``generate_chunk(text)`` returns the cards for one unit; text_units and
+    document_units cap the units at MAX_MAP_CALLS, so the number of map
+    calls grows with the document up to that bound. At most
+    ``concurrency`` run at once.
+    """
+    units = list(units)
+    metrics.incr("flashcard_map_calls_total", len(units))
+    return merge_cards(map_bounded(generate_chunk, units, concurrency, fallback=[]))
+
+
+def text_units(content, limit=MAX_MAP_CALLS):
+    """Map units for typed content (already in memory), at most ``limit``"""
+    return _spread(list(_map_units(iter_chunks([content]))), limit)
+
+
+def document_units(document, limit=MAX_MAP_CALLS):
+    """Map units for an ingested document, at most ``limit``, spread through it.
+
+    Chunks per unit come from the manifest's chunk and token counts, so the
+    units to use are picked before reading anything; only their chunks are
+    decoded, and only one unit's text is held at a time.
+    """
+    chunks, tokens = document['chunks'], document['tokens']
+    if not chunks:
+        return
+    per_unit = max(1, MAP_TOKENS * chunks // max(tokens, 1))
+    selected = _spread(range(-(-chunks // per_unit)), limit)
+    wanted, last = set(selected), selected[-1]
+    with open(document['path'], 'rb') as f:
+        for index, lines in itertools.groupby(enumerate(f), key=lambda item: item[0] // per_unit):
+            if index > last:
+                break
+            if index in wanted:
+                yield "\n\n".join(json.loads(line)['text'] for _, line in lines)
@@ -0,0 +1,185 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Defaults for every outbound call; individual calls may override them
+CONNECT_TIMEOUT = float(os.getenv("SIGMABOT_HTTP_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("SIGMABOT_HTTP_READ_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("SIGMABOT_HTTP_RETRIES", "2"))
+MAX_PER_HOST = int(os.getenv("SIGMABOT_HTTP_MAX_PER_HOST", "8"))
+
+# Responses worth retrying; anything else is returned to the caller as is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. The first call after that
+    is let through as a probe: success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self.clock() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self.clock() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._probing = False
+
+
+class HttpClient:
+    """Shared HTTP client for all outbound calls.
+
+    One pooled ``requests.Session`` keeps connections (and TLS sessions)
+    alive across Streamlit reruns and sessions. Each call has connect/read
+    timeouts, is retried with jittered exponential backoff on connection
+    errors and RETRY_STATUSES, and goes through a per-upstream circuit
+    breaker. A semaphore per host caps concurrent requests so a fan-out
+    can't open dozens of sockets to one API. Latency is recorded per
+    upstream in the ``http_request_seconds`` histogram.
+    """
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=MAX_RETRIES, backoff=0.25, max_per_host=MAX_PER_HOST):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max_per_host)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._host_limits = {}
+        self._breakers = {}
+
+    def _host_limit(self, host):
+        with self._lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return limit
+
+    def breaker(self, upstream):
+        with self._lock:
+            breaker = self._breakers.get(upstream)
+            if breaker is None:
+                breaker = self._breakers[upstream] = CircuitBreaker()
+            return breaker
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: uniform in [0, backoff * 2^attempt]
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method, url, upstream=None, timeout=None, retries=None, **kwargs):
+        """Send a request and return the ``requests.Response``.
+
+        ``upstream`` names the service for metrics and the circuit breaker
+        (defaults to the host). Raises CircuitOpenError when the circuit is
+        open, or the last requests exception once retries are used up.
+        """
+        host = urlsplit(url).netloc
+        upstream = upstream or host
+        retries = self.retries if retries is None else retries
+        breaker = self.breaker(upstream)
+        if not breaker.allow():
+            metrics.incr("http_requests_total", upstream=upstream, outcome="circuit_open")
+            raise CircuitOpenError(f"circuit open for {upstream}")
+        for attempt in range(retries + 1):
+            start = time.monotonic()
+            try:
+                with self._host_limit(host):
+                    response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.observe("http_request_seconds", time.monotonic() - start, upstream=upstream)
+                metrics.incr("http_requests_total", upstream=upstream, outcome="error")
+                if attempt == retries:
+                    # Only a call that failed after all its retries counts against the circuit
+                    breaker.record_failure()
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+            except Exception:
+                # Not worth retrying (e.g. TooManyRedirects, a broken chunked
+                # body), but the breaker must still hear about it: a half-open
+                # probe that never reports back would keep the circuit shut
+                metrics.observe("http_request_seconds", time.monotonic() - start, upstream=upstream)
+                metrics.incr("http_requests_total", upstream=upstream, outcome="error")
+                breaker.record_failure()
+                raise
+            metrics.observe("http_request_seconds", time.monotonic() - start, upstream=upstream)
+            if response.status_code in RETRY_STATUSES:
+                metrics.incr("http_requests_total", upstream=upstream, outcome="retryable_status")
+                if attempt == retries:
+                    breaker.record_failure()
+                    return response
+                response.close()
+                self._sleep_before_retry(attempt)
+                continue
+            metrics.incr("http_requests_total", upstream=upstream, outcome="ok")
+            breaker.record_success()
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,90 @@
+import hashlib
+import io
+import os
+
+import metrics
+from llm import ResponseCache, stream_content
+
+# Longest side sent to Gemini; larger photos are downscaled first (0 disables)
+IMAGE_MAX_SIDE = int(os.getenv("SIGMABOT_IMAGE_MAX_SIDE", "1536"))
+IMAGE_QUALITY = 85
+
+# Formats Gemini accepts inline; anything else is re-encoded as JPEG
+INLINE_TYPES = {"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"}
+
+
+def prepare_image(data, mime_type, max_side=IMAGE_MAX_SIDE):
+    """Return (bytes, mime type) to send for an uploaded image.
+
+    With Pillow installed, images whose longest side exceeds ``max_side``
+    (or whose format Gemini won't take inline, e.g. GIF) are rotated per
+    their EXIF orientation, downscaled and re-encoded in memory. Without
+    Pillow, or if the image can't be decoded, the upload is sent as is.
+    """
+    metrics.incr("image_bytes_in_total", len(data))
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        Image = None
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                too_large = max_side and max(image.size) > max_side
+                if too_large or mime_type not in INLINE_TYPES:
+                    if too_large:
+                        # Let the JPEG decoder scale down by 1/2..1/8 while decoding
+                        scale = max_side / max(image.size)
+                        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+                    image = ImageOps.exif_transpose(image)
+                    if too_large:
+                        image.thumbnail((max_side, max_side), Image.LANCZOS)
+                    out = io.BytesIO()
+                    if image.mode in ("RGBA", "LA", "P") and mime_type != "image/jpeg":
+                        image.save(out, format="PNG", optimize=True)
+                        mime_type = "image/png"
+                    else:
+                        image.convert("RGB").save(out, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+                        mime_type = "image/jpeg"
+                    data = out.getvalue()
+                    metrics.incr("images_resized_total")
+        except Exception:
+            metrics.incr("image_decode_errors_total")
+    metrics.incr("image_bytes_sent_total", len(data))
+    return data, mime_type
+
+
+def image_part(data, mime_type, max_side=IMAGE_MAX_SIDE):
+    """Inline blob for ``generate_content``, built from the upload bytes in memory"""
+    data, mime_type = prepare_image(data, mime_type, max_side)
+    return {"mime_type": mime_type, "data": data}
+
+
+def analysis_key(model_name, data, prompt):
+    """Cache key for an image analysis: SHA-256 of the image bytes plus the prompt"""
+    return ResponseCache.make_key(model_name, f"{hashlib.sha256(data).hexdigest()}\n{prompt}")
+
+
+def cached_image_analysis(model, data, mime_type, prompt, cache, emit=None):
+    """Stream the model's reply to ``prompt`` about an image, through the cache.
+
+    The same bytes with the same prompt are only ever sent once; later
+    uploads (by anyone) get the stored reply, passed to ``emit`` in one
+    piece. Returns the full reply.
+    """
+    key = analysis_key(getattr(model, "model_name", "unknown"), data, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        metrics.incr("image_cache_hits_total", feature="image")
+        if emit is not None:
+            emit(cached)
+        return cached
+    metrics.incr("image_cache_misses_total", feature="image")
+    chunks = []
+    for chunk in stream_content(model, [prompt, image_part(data, mime_type)]):
+        chunks.append(chunk)
+        if emit is not None:
+            emit(chunk)
+    text = "".join(chunks)
+    if text:
+        cache.put(key, "image", text)
+    return text
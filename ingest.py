@@ -0,0 +1,341 @@
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import zipfile
+from array import array
+from collections import Counter, defaultdict
+from xml.etree import ElementTree
+
+import metrics
+from context import CHARS_PER_TOKEN, estimate_tokens
+from storage import atomic_write
+
+# Size of the blocks read from uploads; memory use is bounded by this, not the file
+READ_BLOCK = 1 << 20
+
+# Default chunk size sent to Gemini, in (estimated) tokens
+CHUNK_TOKENS = 800
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_WORD_RE = re.compile(r"\w{3,}")
+# Chunk ids in the term index are stored as packed unsigned ints
+POSTING_TYPE = "I"
+# Chunks whose postings are held in memory before being flushed to the index
+INDEX_BATCH_CHUNKS = 1024
+
+
+class IngestError(Exception):
+    """Raised for uploads that can't be turned into text"""
+
+
+def detect_type(name, head):
+    """File type from magic bytes, falling back to the extension"""
+    extension = os.path.splitext(name)[1].lower().lstrip('.')
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        if extension == "docx":
+            return "docx"
+        raise IngestError(f"{name} looks like a zip archive, not a supported document")
+    if extension == "csv":
+        return "csv"
+    return "txt"
+
+
+def _iter_plain_text(file):
+    reader = io.TextIOWrapper(file, encoding='utf-8', errors='replace', newline='')
+    try:
+        while True:
+            block = reader.read(READ_BLOCK)
+            if not block:
+                break
+            yield block
+    finally:
+        # Don't let the wrapper close the caller's file
+        reader.detach()
+
+
+def _iter_docx_text(file):
+    try:
+        archive = zipfile.ZipFile(file)
+        document = archive.open("word/document.xml")
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise IngestError(f"not a valid docx file: {e}")
+    with archive, document:
+        paragraph = []
+        for event, element in ElementTree.iterparse(document, events=("end",)):
+            if element.tag == f"{_WORD_NS}t" and element.text:
+                paragraph.append(element.text)
+            elif element.tag == f"{_WORD_NS}tab":
+                paragraph.append("\t")
+            elif element.tag == f"{_WORD_NS}p":
+                if paragraph:
+                    yield "".join(paragraph) + "\n"
+                    paragraph = []
+                # Drop parsed paragraphs so the tree never holds the whole document
+                element.clear()
+
+
+def _iter_pdf_text(file):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise IngestError("pdf uploads need the pypdf package")
+    try:
+        reader = PdfReader(file)
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            if text:
+                yield text + "\n"
+    except Exception as e:
+        raise IngestError(f"could not read pdf: {e}")
+
+
+_EXTRACTORS = {
+    "txt": _iter_plain_text,
+    "csv": _iter_plain_text,
+    "docx": _iter_docx_text,
+    "pdf": _iter_pdf_text,
+}
+
+
+def iter_text(file, kind):
+    """Yield the text of ``file`` in bounded pieces"""
+    return _EXTRACTORS[kind](file)
+
+
+def iter_chunks(pieces, max_tokens=CHUNK_TOKENS):
+    """Regroup text pieces into chunks of at most ``max_tokens``.
+
+    Chunks end at a paragraph, line or word break where possible.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= max_chars:
+            window = buffer[:max_chars]
+            cut = max(window.rfind("\n\n"), window.rfind("\n"), window.rfind(" "))
+            if cut < max_chars // 2:
+                cut = max_chars
+            yield buffer[:cut].strip()
+            buffer = buffer[cut:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def file_digest(file):
+    """SHA-256 of a seekable file, read in blocks; leaves it rewound"""
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(READ_BLOCK), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _terms(text):
+    return set(_WORD_RE.findall(text.casefold()))
+
+
+def index_path(document):
+    return f"{os.path.splitext(document['path'])[0]}.index.db"
+
+
+def _write_index(path, chunks):
+    """Build the term index for ``chunks`` ((i, offset, length, tokens, text) tuples).
+
+    The index is a small SQLite file next to the chunk file: where each
+    chunk sits in the .jsonl, and for each term the ids of the chunks that
+    contain it, packed into one row per term. Postings are collected for
+    ``INDEX_BATCH_CHUNKS`` chunks at a time and flushed to a temporary table,
+    which is merged into the per-term rows at the end, so memory use is
+    bounded by the batch and not the document. It is built under a
+    temporary name and moved into place when complete.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".index.", suffix='.tmp', dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""CREATE TABLE chunks (
+                i INTEGER PRIMARY KEY, offset INTEGER, length INTEGER, tokens INTEGER)""")
+            conn.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, chunks BLOB) WITHOUT ROWID")
+            conn.execute("CREATE TEMP TABLE staged (term TEXT, chunks BLOB)")
+            postings = defaultdict(lambda: array(POSTING_TYPE))
+
+            def flush():
+                conn.executemany("INSERT INTO staged VALUES (?, ?)",
+                                 ((term, ids.tobytes()) for term, ids in postings.items()))
+                postings.clear()
+
+            for i, offset, length, tokens, text in chunks:
+                conn.execute("INSERT INTO chunks VALUES (?, ?, ?, ?)", (i, offset, length, tokens))
+                for term in _terms(text):
+                    postings[term].append(i)
+                if (i + 1) % INDEX_BATCH_CHUNKS == 0:
+                    flush()
+            flush()
+            conn.executemany("INSERT INTO terms VALUES (?, ?)", _merge_staged(conn))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _merge_staged(conn):
+    """Yield (term, packed ids) with each term's batches joined in chunk order"""
+    rows = conn.cursor().execute("SELECT term, chunks FROM staged ORDER BY term, rowid")
+    for term, batches in itertools.groupby(rows, key=lambda row: row[0]):
+        yield term, b"".join(packed for _, packed in batches)
+
+
+def build_index(document):
+    """(Re)build the term index of an ingested document from its chunk file"""
+    def chunks():
+        offset = 0
+        with open(document['path'], 'rb') as f:
+            for line in f:
+                chunk = json.loads(line)
+                yield chunk['i'], offset, len(line), chunk['tokens'], chunk['text']
+                offset += len(line)
+    _write_index(index_path(document), chunks())
+    metrics.incr("ingest_index_builds_total")
+
+
+def ingest(file, name, store_dir, max_tokens=CHUNK_TOKENS):
+    """Extract and chunk an upload, spooling the chunks to disk.
+
+    Returns a small JSON-serializable manifest; the chunk text lives in
+    ``<store_dir>/<sha256>.jsonl`` (one {'i', 'digest', 'tokens', 'text'}
+    record per line) so it never has to be held in memory, next to a term
+    index (``<sha256>.index.db``) used to pick relevant chunks. Uploading
+    the same file again reuses the existing chunks.
+    """
+    digest = file_digest(file)
+    path = os.path.join(store_dir, f"{digest}.jsonl")
+    manifest_path = os.path.join(store_dir, f"{digest}.json")
+    if os.path.exists(manifest_path):
+        metrics.incr("ingest_reused_total")
+        with open(manifest_path, encoding='utf-8') as f:
+            return dict(json.load(f), name=name)
+
+    kind = detect_type(name, file.read(8))
+    file.seek(0)
+    os.makedirs(store_dir, exist_ok=True)
+    count = tokens = offset = 0
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{digest}.", suffix='.tmp', dir=store_dir)
+
+    def chunks(out):
+        nonlocal count, tokens, offset
+        for text in iter_chunks(iter_text(file, kind), max_tokens):
+            chunk_tokens = estimate_tokens(text)
+            line = (json.dumps({
+                'i': count,
+                'digest': hashlib.sha256(text.encode('utf-8')).hexdigest()[:16],
+                'tokens': chunk_tokens,
+                'text': text
+            }) + "\n").encode('utf-8')
+            out.write(line)
+            yield count, offset, len(line), chunk_tokens, text
+            count += 1
+            tokens += chunk_tokens
+            offset += len(line)
+
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            _write_index(index_path({'path': path}), chunks(out))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    manifest = {'name': name, 'type': kind, 'sha256': digest, 'chunks': count,
+                'tokens': tokens, 'path': path}
+    atomic_write(manifest_path, json.dumps(manifest))
+    metrics.incr("ingest_files_total", type=kind)
+    metrics.incr("ingest_chunks_total", count)
+    return manifest
+
+
+def iter_document_chunks(document):
+    """Stream the chunk records of an ingested document"""
+    with open(document['path'], encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _ranked_chunks(conn, terms, keep):
+    """(i, offset, length, tokens) of the ``keep`` best chunks, best first.
+
+    Chunks are scored by how many query terms they contain; ties, and the
+    chunks with no overlap at all, favour earlier chunks.
+    """
+    scores = Counter()
+    if terms:
+        for (packed,) in conn.execute(
+                f"SELECT chunks FROM terms WHERE term IN ({', '.join('?' * len(terms))})", tuple(terms)):
+            chunk_ids = array(POSTING_TYPE)
+            chunk_ids.frombytes(packed)
+            scores.update(chunk_ids)
+    best = heapq.nsmallest(keep, scores, key=lambda i: (-scores[i], i))
+    if len(best) < keep:
+        opening = conn.execute("SELECT i FROM chunks ORDER BY i LIMIT ?", (keep + len(best),))
+        best += [i for (i,) in opening if i not in scores][:keep - len(best)]
+    rows = {row[0]: row for row in conn.execute(
+        f"SELECT i, offset, length, tokens FROM chunks WHERE i IN ({', '.join('?' * len(best))})", best)}
+    return [rows[i] for i in best]
+
+
+def relevant_chunks(document, query=None, budget=2000):
+    """Chunks most relevant to ``query`` that fit in ``budget`` tokens.
+
+    Chunks are picked from the term index built at ingest time (built on
+    first use for documents ingested before it existed), and only the
+    selected ones are read from the chunk file. Without a query (or with
+    no overlap at all) the document's opening chunks are used. The result
+    is in document order.
+    """
+    path = index_path(document)
+    if not os.path.exists(path):
+        build_index(document)
+    terms = _terms(query) if query else set()
+    keep = max(1, budget // 100)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        ranked = _ranked_chunks(conn, terms, keep)
+    finally:
+        conn.close()
+    selected, used = [], 0
+    for i, offset, length, tokens in ranked:
+        if used + tokens > budget:
+            continue
+        selected.append((i, offset, length))
+        used += tokens
+    # Budget smaller than a chunk: send the start of the best one
+    truncate = not selected and bool(ranked)
+    if truncate:
+        selected.append(ranked[0][:3])
+    chunks = []
+    with open(document['path'], 'rb') as f:
+        for i, offset, length in sorted(selected):
+            f.seek(offset)
+            chunks.append(json.loads(f.read(length)))
+    metrics.incr("document_chunks_read_total", len(chunks))
+    if truncate:
+        chunks = [dict(chunks[0], text=chunks[0]['text'][:budget * CHARS_PER_TOKEN], tokens=budget)]
+    return chunks
+
+def document_text(document, query=None, budget=2000):
+    return "\n\n".join(chunk['text'] for chunk in relevant_chunks(document, query, budget))
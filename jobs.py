@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Concurrent long-running jobs (Gemini calls) per process
+JOB_WORKERS = int(os.getenv("SIGMABOT_JOB_WORKERS", "4"))
+# Finished jobs are kept this long so a rerun can still pick up the result
+JOB_RETENTION = 15 * 60
+
+
+class Job:
+    """One unit of background work and its outcome.
+
+    ``fn`` receives the job as its first argument and may call emit() to
+    publish partial text (e.g. a streamed reply) while it runs.
+    """
+
+    def __init__(self, kind, key):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.key = key
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.partial = []
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def emit(self, text):
+        self.partial.append(text)
+
+    @property
+    def text(self):
+        return "".join(self.partial)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or ``timeout`` passes; True if finished"""
+        return self._done.wait(timeout)
+
+
+class JobRunner:
+    """Process-level job queue: a thread pool plus a table of jobs by id.
+
+    Jobs outlive the Streamlit script run that started them, so a rerun
+    (any widget interaction) no longer aborts and re-issues a Gemini call;
+    the session keeps the job id and resumes waiting on it. Submitting a
+    job whose (kind, key) is already queued, running or recently finished
+    returns the existing job instead of starting a duplicate.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sigmabot-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_key = {}
+
+    def _update_depth(self):
+        queued = sum(1 for job in self._jobs.values() if job.status == "queued")
+        running = sum(1 for job in self._jobs.values() if job.status == "running")
+        metrics.gauge("jobs_queued", queued)
+        metrics.gauge("jobs_running", running)
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.done and now - job.finished_at > self.retention:
+                del self._jobs[job_id]
+                if self._by_key.get((job.kind, job.key)) is job:
+                    del self._by_key[(job.kind, job.key)]
+
+    def submit(self, kind, key, fn, *args, **kwargs):
+        """Start ``fn(job, *args, **kwargs)`` unless an equivalent job exists; returns the job"""
+        with self._lock:
+            self._prune()
+            existing = self._by_key.get((kind, key))
+            # A failed job may be retried; anything else is reused
+            if existing is not None and existing.status != "failed":
+                metrics.incr("jobs_duplicates_suppressed_total", kind=kind)
+                return existing
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            self._by_key[(kind, key)] = job
+            self._update_depth()
+        metrics.incr("jobs_submitted_total", kind=kind)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            job.status = "running"
+            job.started_at = time.monotonic()
+            self._update_depth()
+        metrics.observe("job_wait_seconds", job.started_at - job.submitted_at, kind=job.kind)
+        try:
+            job.result = fn(job, *args, **kwargs)
+            status = "done"
+        except Exception as e:
+            job.error = e
+            status = "failed"
+        with self._lock:
+            job.status = status
+            job.finished_at = time.monotonic()
+            self._update_depth()
+        metrics.observe("job_run_seconds", job.finished_at - job.started_at, kind=job.kind)
+        metrics.incr("jobs_finished_total", kind=job.kind, status=status)
+        job._done.set()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def forget(self, job):
+        """Drop a finished job so the same key can be submitted afresh"""
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            if self._by_key.get((job.kind, job.key)) is job:
+                del self._by_key[(job.kind, job.key)]
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# Features whose Gemini responses may be served from the response cache
+CACHED_FEATURES = {"flashcards", "quiz", "itinerary", "summary"}
+
+
+def iter_text(response, started=None):
+    """Yield the text of each chunk of a streamed generate_content response.
+
+    Chunks without text (e.g. a trailing safety-only chunk) are skipped.
+    ``started`` is the time.monotonic() at which the request was sent; the
+    wait until the first text chunk goes to the llm_first_chunk_seconds
+    histogram.
+    """
+    first = True
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            continue
+        if not text:
+            continue
+        if first:
+            if started is not None:
+                metrics.observe("llm_first_chunk_seconds", time.monotonic() - started)
+            metrics.incr("llm_streams_total")
+            first = False
+        metrics.incr("llm_stream_chunks_total")
+        yield text
+
+
+def stream_content(model, contents):
+    """Call ``model.generate_content`` in streaming mode and yield text chunks"""
+    # Timed from before the call: the request (and often the first chunk) happens inside it
+    started = time.monotonic()
+    return iter_text(model.generate_content(contents, stream=True), started)
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so re-indented f-string prompts share a cache key"""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+class ResponseCache:
+    """On-disk cache of model responses with TTL and LRU eviction.
+
+    Entries are keyed by model name plus a SHA-256 of the normalized prompt
+    and kept in a small SQLite file shared by every session in the process.
+    Entries older than ``ttl`` seconds are ignored, and once there are more
+    than ``max_entries`` the least recently used ones are dropped.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            feature TEXT,
+            response TEXT,
+            created_at REAL,
+            last_used REAL
+        )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        digest = hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+        return f"{model_name}:{digest}"
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, feature, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, feature, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", (key, feature, response, now, now))
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self, features=CACHED_FEATURES, prefix="llm_cache"):
+        """Hit/miss counts and hit rate per feature"""
+        hits = metrics.snapshot().get(f"{prefix}_hits_total", {})
+        misses = metrics.snapshot().get(f"{prefix}_misses_total", {})
+        stats = {}
+        for feature in features:
+            h = hits.get((("feature", feature),), 0)
+            m = misses.get((("feature", feature),), 0)
+            stats[feature] = {'hits': h, 'misses': m, 'hit_rate': h / (h + m) if h + m else 0.0}
+        return stats
+
+
+_response_caches = {}
+_response_caches_lock = threading.Lock()
+
+
+def get_response_cache(path, **kwargs):
+    with _response_caches_lock:
+        cache = _response_caches.get(path)
+        if cache is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            cache = _response_caches[path] = ResponseCache(path, **kwargs)
+        return cache
+
+
+def generate_text(model, prompt, feature, cache=None, bypass=False, generation_config=None):
+    """Return ``model.generate_content(prompt).text``, through the cache if allowed.
+
+    Caching applies only to features listed in CACHED_FEATURES and when a
+    cache is given. ``bypass`` skips the lookup (e.g. for "Regenerate") but
+    still stores the fresh response. A ``generation_config`` (e.g. JSON
+    mode) is passed to the model and is part of the cache key.
+    """
+    kwargs = {'generation_config': generation_config} if generation_config else {}
+    if cache is None or feature not in CACHED_FEATURES:
+        return model.generate_content(prompt, **kwargs).text
+    key_source = prompt if not generation_config else f"{prompt}\n{json.dumps(generation_config, sort_keys=True)}"
+    key = ResponseCache.make_key(getattr(model, "model_name", "unknown"), key_source)
+    if not bypass:
+        text = cache.get(key)
+        if text is not None:
+            metrics.incr("llm_cache_hits_total", feature=feature)
+            return text
+    metrics.incr("llm_cache_misses_total", feature=feature)
+    text = model.generate_content(prompt, **kwargs).text
+    cache.put(key, feature, text)
+    return text
+
+
+class MockChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockResponse:
+    """Stands in for a GenerateContentResponse; iterable when streamed"""
+
+    def __init__(self, chunks, chunk_delay=0.0, first_chunk_delay=0.0):
+        self._chunks = chunks
+        self._chunk_delay = chunk_delay
+        self._first_chunk_delay = first_chunk_delay
+        self.text = "".join(chunks)
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            time.sleep(self._first_chunk_delay if i == 0 else self._chunk_delay)
+            yield MockChunk(chunk)
+
+
+class MockModel:
+    """Offline replacement for genai.GenerativeModel.
+
+    ``reply`` is either a fixed string or a callable taking the prompt and
+    returning the reply. Streaming splits the reply into ``chunk_size``
+    character chunks with optional delays, so rendering and latency can be
+    exercised without an API key (set SIGMABOT_MOCK_LLM=1).
+    """
+
+    def __init__(self, reply=None, chunk_size=32, first_chunk_delay=0.0, chunk_delay=0.0,
+                 model_name="mock"):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.model_name = model_name
+        self.calls = []
+
+    def _reply_for(self, contents):
+        prompt = contents if isinstance(contents, str) else " ".join(
+            part for part in contents if isinstance(part, str))
+        if callable(self.reply):
+            return self.reply(prompt)
+        if self.reply is not None:
+            return self.reply
+        return f"aight bro, mock reply to: {prompt[:200]}"
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls.append(contents)
+        text = self._reply_for(contents)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        if stream:
+            return MockResponse(chunks, self.chunk_delay, self.first_chunk_delay)
+        time.sleep(self.first_chunk_delay + self.chunk_delay * (len(chunks) - 1))
+        return MockResponse(chunks)
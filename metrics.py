@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+# Process-wide counters and gauges shared by every Streamlit session
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_last_write = 0.0
+
+# Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def incr(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge(name, value, **labels):
+    """Set a value that can go down as well as up (e.g. a queue depth)"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = value
+
+
+def get(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record ``value`` in a cumulative histogram (Prometheus style)"""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': tuple(buckets), 'counts': [0] * len(buckets),
+                                       'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(hist['buckets']):
+            if value <= bound:
+                hist['counts'][i] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+def histogram(name, **labels):
+    """Return a copy of a histogram ({'buckets', 'counts', 'sum', 'count'}) or None"""
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        return None if hist is None else dict(hist, counts=list(hist['counts']))
+
+
+def quantile(name, q, **labels):
+    """Estimate the ``q`` quantile of a histogram (upper bound of its bucket)"""
+    hist = histogram(name, **labels)
+    if not hist or not hist['count']:
+        return None
+    target = q * hist['count']
+    for bound, count in zip(hist['buckets'], hist['counts']):
+        if count >= target:
+            return bound
+    return float('inf')
+
+
+def snapshot():
+    """Return {name: {labels: value}} for every counter"""
+    with _lock:
+        items = list(_counters.items())
+    result = {}
+    for (name, labels), value in items:
+        result.setdefault(name, {})[labels] = value
+    return result
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render_text():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, series in sorted(snapshot().items()):
+        for labels, value in sorted(series.items()):
+            lines.append(f"sigmabot_{name}{_format_labels(labels)} {value}")
+    with _lock:
+        histograms = sorted((key, dict(hist, counts=list(hist['counts'])))
+                            for key, hist in _histograms.items())
+    for (name, labels), hist in histograms:
+        for bound, count in zip(hist['buckets'], hist['counts']):
+            lines.append(f"sigmabot_{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+        lines.append(f"sigmabot_{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+        lines.append(f"sigmabot_{name}_sum{_format_labels(labels)} {hist['sum']}")
+        lines.append(f"sigmabot_{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def maybe_write_textfile(path=None, interval=15):
+    """Dump metrics to a textfile-collector file at most every ``interval`` seconds.
+
+    The path comes from SIGMABOT_METRICS_FILE when not given; nothing is
+    written if neither is set.
+    """
+    global _last_write
+    path = path or os.getenv("SIGMABOT_METRICS_FILE")
+    if not path:
+        return
+    now = time.time()
+    with _lock:
+        if now - _last_write < interval:
+            return
+        _last_write = now
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(render_text())
+    os.replace(tmp_path, path)
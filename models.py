@@ -1,9 +1,12 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, Table, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Boolean, ForeignKey, Table, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
+import threading
 import os
 
+DATABASE_URL = os.getenv("SIGMABOT_DATABASE_URL", "sqlite:///app.db")
+
 Base = declarative_base()
 
 # Association tables
@@ -16,7 +19,9 @@ class User(Base):
     __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True)
-    username = Column(String, unique=True)
+    # Public id used by the Streamlit app (a uuid string)
+    uid = Column(String, unique=True, index=True)
+    username = Column(String, unique=True, index=True)
     email = Column(String, unique=True)
     password_hash = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -86,10 +91,84 @@ class CodeFile(Base):
     # Relationships
     owner = relationship("User", back_populates="code_files")
 
+class Chat(Base):
+    __tablename__ = 'chats'
+    
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey('users.uid'), index=True)
+    title = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan",
+                            order_by="Message.id")
+
+class Message(Base):
+    __tablename__ = 'messages'
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(String, ForeignKey('chats.id'), index=True)
+    role = Column(String)
+    content = Column(String)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    # Any other message fields (attachment, prompt_tokens, ...) as a JSON object
+    extra = Column(String, nullable=True)
+    
+    # Relationships
+    chat = relationship("Chat", back_populates="messages")
+
+# Sidebar listing: a user's chats ordered by recency
+Index('ix_chats_user_id_updated_at', Chat.user_id, Chat.updated_at)
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a writer commits
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+# Columns added after the first release; create_all() won't add them to existing
+# tables. SQLite can't add a UNIQUE column, so those get a unique index instead.
+_ADDED_COLUMNS = [
+    ('messages', 'extra', 'VARCHAR', None),
+    ('users', 'uid', 'VARCHAR', 'ix_users_uid'),
+]
+
+def _add_missing_columns(engine):
+    inspector = inspect(engine)
+    for table, column, type_, unique_index in _ADDED_COLUMNS:
+        if column not in {c['name'] for c in inspector.get_columns(table)}:
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {type_}"))
+                if unique_index:
+                    connection.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {unique_index} "
+                                            f"ON {table} ({column})"))
+
+def get_engine(url=DATABASE_URL):
+    """Return the process-wide engine for ``url``, creating tables on first use"""
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            if url.startswith('sqlite'):
+                engine = create_engine(url, connect_args={'check_same_thread': False})
+                event.listen(engine, 'connect', _configure_sqlite)
+            else:
+                engine = create_engine(url)
+            Base.metadata.create_all(engine)
+            _add_missing_columns(engine)
+            _engines[url] = engine
+        return engine
+
+def get_sessionmaker(url=DATABASE_URL):
+    return sessionmaker(bind=get_engine(url), expire_on_commit=False)
+
 # Create database and tables
-def init_db():
-    engine = create_engine('sqlite:///app.db')
-    Base.metadata.create_all(engine)
+def init_db(url=DATABASE_URL):
+    return get_engine(url)
 
 if __name__ == '__main__':
     init_db() 
\ No newline at end of file
@@ -0,0 +1,163 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# Questions kept ready per category, and the per-user unseen count that triggers a refill
+BANK_TARGET = 60
+BANK_LOW_WATER = 20
+
+
+def question_key(category, question):
+    return f"{category}:{' '.join(question['question'].split()).casefold()}"
+
+
+class QuizBank:
+    """Persistent pool of validated quiz questions per category.
+
+    Questions live in a small SQLite file. Each user is served questions
+    they haven't seen before, so starting a quiz on a fixed category is a
+    local query instead of a Gemini round trip. A background thread
+    (start_filler) tops categories up whenever the pool runs low.
+    """
+
+    def __init__(self, path, target=BANK_TARGET, low_water=BANK_LOW_WATER):
+        self.path = path
+        self.target = target
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY,
+            category TEXT,
+            key TEXT UNIQUE,
+            payload TEXT,
+            created_at REAL
+        )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_questions_category ON questions (category)")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS served (
+            user_id TEXT,
+            question_id INTEGER,
+            served_at REAL,
+            PRIMARY KEY (user_id, question_id)
+        )""")
+        self._conn.commit()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._filler = None
+
+    def add(self, category, questions):
+        """Store questions, skipping ones already in the bank; returns how many were new"""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions (category, key, payload, created_at) VALUES (?, ?, ?, ?)",
+                [(category, question_key(category, question), json.dumps(question), now)
+                 for question in questions])
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def _unseen(self, user_id, category):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM questions WHERE category = ? AND id NOT IN "
+            "(SELECT question_id FROM served WHERE user_id = ?)", (category, user_id)).fetchone()[0]
+
+    def sample(self, user_id, category, count):
+        """Return ``count`` questions the user hasn't seen, or None if the bank is short"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM questions WHERE category = ? AND id NOT IN "
+                "(SELECT question_id FROM served WHERE user_id = ?) ORDER BY RANDOM() LIMIT ?",
+                (category, user_id, count)).fetchall()
+            if len(rows) < count:
+                rows = None
+            else:
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO served (user_id, question_id, served_at) VALUES (?, ?, ?)",
+                    [(user_id, row[0], now) for row in rows])
+                self._conn.commit()
+            unseen = self._unseen(user_id, category)
+        if unseen < self.low_water:
+            self.request_refill(category)
+        if rows is None:
+            metrics.incr("quiz_bank_misses_total", category=category)
+            return None
+        metrics.incr("quiz_bank_hits_total", category=category)
+        return [json.loads(row[1]) for row in rows]
+
+    def size(self, category):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE category = ?", (category,)).fetchone()[0]
+
+    def stats(self, categories):
+        """Bank size, hits, misses and hit rate per category"""
+        hits = metrics.snapshot().get("quiz_bank_hits_total", {})
+        misses = metrics.snapshot().get("quiz_bank_misses_total", {})
+        stats = {}
+        for category in categories:
+            h = hits.get((("category", category),), 0)
+            m = misses.get((("category", category),), 0)
+            stats[category] = {'size': self.size(category), 'hits': h, 'misses': m,
+                               'hit_rate': h / (h + m) if h + m else 0.0}
+        return stats
+
+    def request_refill(self, category):
+        """Queue a category for the filler thread (no-op if already queued)"""
+        with self._lock:
+            if category in self._queued:
+                return
+            self._queued.add(category)
+        self._queue.put(category)
+
+    def start_filler(self, generate, categories):
+        """Start the background thread that tops up ``categories``.
+
+        ``generate(category)`` returns a list of validated questions. Safe to
+        call on every rerun; only the first call starts the thread.
+        """
+        with self._lock:
+            if self._filler is not None:
+                return
+            self._filler = threading.Thread(target=self._fill, args=(generate,),
+                                            name="quiz-bank-filler", daemon=True)
+        for category in categories:
+            if self.size(category) < self.target:
+                self.request_refill(category)
+        self._filler.start()
+
+    def _fill(self, generate):
+        while True:
+            category = self._queue.get()
+            try:
+                added = self.add(category, generate(category))
+                metrics.incr("quiz_bank_generated_total", added, category=category)
+            except Exception:
+                metrics.incr("quiz_bank_fill_errors_total", category=category)
+                added = 0
+            with self._lock:
+                self._queued.discard(category)
+            # Keep going until the category reaches its target (unless the model
+            # stopped producing new questions)
+            if added and self.size(category) < self.target:
+                self.request_refill(category)
+
+
+_quiz_banks = {}
+_quiz_banks_lock = threading.Lock()
+
+
+def get_quiz_bank(path):
+    with _quiz_banks_lock:
+        bank = _quiz_banks.get(path)
+        if bank is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            bank = _quiz_banks[path] = QuizBank(path)
+        return bank
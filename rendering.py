@@ -0,0 +1,165 @@
+import functools
+import hashlib
+import html
+import os
+import re
+import textwrap
+import time
+
+from markdown_it import MarkdownIt
+
+import metrics
+
+# Gen Z substitutions applied to assistant replies (after lowercasing)
+SLANG = {
+    "i'm": "im",
+    "i am": "im",
+    "you are": "ur",
+    "you're": "ur",
+    "what's up": "wassup",
+    "okay": "aight",
+    "alright": "aight",
+    "brother": "bro",
+    "sister": "sis",
+    "thank you": "ty",
+    "thanks": "ty",
+    "no problem": "np",
+    "for real": "fr",
+    "to be honest": "tbh",
+    "in my opinion": "imo",
+    "just kidding": "jk",
+    "laughing out loud": "lol",
+    "right now": "rn",
+    "by the way": "btw",
+}
+
+# One alternation, longest phrases first, so a reply is rewritten in a single pass
+_SLANG_PATTERN = re.compile("|".join(re.escape(phrase) for phrase in sorted(SLANG, key=len, reverse=True)))
+
+
+def genz_style(text):
+    return _SLANG_PATTERN.sub(lambda match: SLANG[match.group(0)], text.lower())
+
+
+class FrameRenderer:
+    """Batch streamed text into a bounded number of UI updates.
+
+    Every update re-sends the whole message, so rendering each chunk costs
+    O(n^2) bytes for an n-character reply. Here a frame is drawn at most
+    once per ``interval`` seconds, and only while the bytes already sent
+    stay under ``(byte_budget - 1)`` times the current length. The final
+    frame from close() is always drawn, so the total sent is at most
+    ``byte_budget`` times the size of the reply.
+    """
+
+    def __init__(self, render, interval=0.05, byte_budget=4.0, style=genz_style, clock=time.monotonic):
+        self.render = render
+        self.interval = interval
+        self.byte_budget = byte_budget
+        self.style = style
+        self.clock = clock
+        self.text = ""
+        self.frames = 0
+        self.bytes_emitted = 0
+        self._last_frame = None
+        self._last_length = 0
+
+    def _draw(self):
+        styled = self.style(self.text)
+        self.render(styled)
+        self.frames += 1
+        self.bytes_emitted += len(styled.encode('utf-8'))
+        self._last_frame = self.clock()
+        self._last_length = len(self.text)
+
+    def feed(self, chunk):
+        self.text += chunk
+        now = self.clock()
+        if self._last_frame is not None and now - self._last_frame < self.interval:
+            return
+        size = len(self.text.encode('utf-8'))
+        if self.bytes_emitted + size > self.byte_budget * size - size:
+            return
+        self._draw()
+
+    def close(self):
+        """Draw the final frame (if anything changed) and return the raw text"""
+        if self.frames == 0 or self._last_length != len(self.text):
+            self._draw()
+        metrics.incr("render_frames_total", self.frames)
+        metrics.incr("render_bytes_total", self.bytes_emitted)
+        return self.text
+
+
+# CommonMark plus tables, with raw HTML off so tags in a message show as text
+_MARKDOWN = MarkdownIt("commonmark", {"html": False, "breaks": True}).enable(["table", "strikethrough"])
+
+
+_PRE_RE = re.compile(r"(<pre>.*?</pre>)", re.DOTALL)
+
+
+def markdown_html(text):
+    """Render ``text`` as markdown into HTML with no line breaks in it.
+
+    Outside code blocks the newlines only separate tags and are dropped;
+    inside them they become ``&#10;``. Either way the result can't end the
+    surrounding HTML block in st.markdown early.
+    """
+    parts = _PRE_RE.split(_MARKDOWN.render(text or ""))
+    return "".join(part.replace("\n", "&#10;") if n % 2 else part.replace("\n", "")
+                   for n, part in enumerate(parts))
+
+
+def message_html(role, content):
+    """HTML for one chat message, from its stored (raw) content.
+
+    This is the one renderer for chat messages: history and replies that are
+    still streaming both go through it, so a reply looks the same before and
+    after the rerun that saves it. Assistant replies get the genz style.
+    ``content`` is rendered as markdown with raw HTML escaped; every block is
+    closed, and the markup is dedented and stripped the same way st.markdown
+    cleans its input, so each message stays a single self-contained HTML
+    block. A stray tag or an unclosed code fence in one message can't spill
+    into the ones after it.
+    """
+    if role == 'user':
+        markup = f"""
+        <div class="chat-message user-message">
+            <strong>You:</strong>
+            {markdown_html(content)}
+        </div>
+        """
+    else:
+        markup = f"""
+        <div class="chat-message assistant-message">
+            <span style="font-size: 24px;">🤖</span>
+            <strong>sigma:</strong>
+            {markdown_html(genz_style(content or ""))}
+        </div>
+        """
+    return textwrap.dedent(markup).strip()
+
+
+# Past messages never change, so their markup is built once and reused on every rerun
+_stored_message_html = functools.lru_cache(maxsize=4096)(message_html)
+
+
+def history_html(messages):
+    return "\n\n".join(_stored_message_html(message['role'], message['content']) for message in messages)
+
+
+@functools.lru_cache(maxsize=32)
+def _asset_version(path, mtime):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def stylesheet_html(path, base_url):
+    """A <link> to the stylesheet at ``path``, served from ``base_url``.
+
+    The URL carries a hash of the file's content, so the browser fetches
+    it once, reuses it across reruns, reloads and sessions, and only
+    refetches when the file changes.
+    """
+    version = _asset_version(path, os.stat(path).st_mtime_ns)
+    return f'<link rel="stylesheet" href="{base_url}/{os.path.basename(path)}?v={version}">'
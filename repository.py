@@ -0,0 +1,299 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import Chat, Message, User, get_sessionmaker
+from storage import file_signature, get_chat_store, json_cache, save_json, update_json
+
+# Storage backend used by the app: "json" (data/*.json files) or "sqlite"
+BACKEND = os.getenv("SIGMABOT_BACKEND", "json")
+
+
+class EmailTakenError(Exception):
+    """Raised by create_user when another account already uses the email"""
+
+
+class JsonRepository:
+    """Repository backed by users.json and the per-chat segment store.
+
+    A username -> user id index is kept next to users.json (users.index.json)
+    so sign-in and sign-up don't scan every user. The index records the
+    users.json signature it was built from and is rebuilt if the two drift
+    apart, e.g. after users.json was edited by hand.
+    """
+
+    def __init__(self, users_file, chats_dir):
+        self.users_file = users_file
+        self.index_file = f"{os.path.splitext(users_file)[0]}.index.json"
+        self.chats = get_chat_store(chats_dir)
+
+    def _users(self):
+        try:
+            return json_cache.get(self.users_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _username_index(self):
+        """Return the frozen username -> user id mapping for the current users.json"""
+        try:
+            signature = list(file_signature(self.users_file))
+        except OSError:
+            return {}
+        try:
+            index = json_cache.get(self.index_file)
+        except (OSError, ValueError):
+            index = None
+        if index is None or list(index.get('source', ())) != signature:
+            metrics.incr("username_index_rebuilds_total")
+            usernames = {user.get('username'): uid for uid, user in self._users().items()
+                         if user.get('username') is not None}
+            index = save_json(self.index_file, {'source': signature, 'usernames': usernames})
+        return index['usernames']
+
+    def get_user_by_username(self, username):
+        """Return (user_id, user) for ``username``, or None"""
+        metrics.incr("repository_queries_total", backend="json", query="user_by_username")
+        user_id = self._username_index().get(username)
+        if user_id is None:
+            return None
+        user = self._users().get(user_id)
+        return (user_id, user) if user is not None else None
+
+    def create_user(self, username, password_hash, email, user_id, created_at):
+        """Add a user; returns False if the username is already taken"""
+        usernames = {}
+
+        def add_user(users):
+            # Runs under the users.json lock, so the index is current here
+            usernames.update(self._username_index())
+            if username in usernames:
+                return False
+            users[user_id] = {
+                'username': username,
+                'password': password_hash,
+                'email': email,
+                'created_at': created_at
+            }
+            return True
+
+        def write_index(users):
+            # Still under the users.json lock: the signature and the index
+            # both describe the file we just wrote
+            usernames[username] = user_id
+            save_json(self.index_file, {'source': list(file_signature(self.users_file)),
+                                        'usernames': usernames})
+
+        return update_json(self.users_file, add_user, after=write_index)
+
+    def list_chats(self, user_id, offset=0, limit=None):
+        """Return a page of chat summaries (id, title, updated_at, message_count), newest first"""
+        metrics.incr("repository_queries_total", backend="json", query="list_chats")
+        return self.chats.list_user_chats(user_id, offset, limit)
+
+    def count_chats(self, user_id):
+        return self.chats.count_user_chats(user_id)
+
+    def load_chat(self, chat_id):
+        return self.chats.load_chat(chat_id)
+
+    def save_chat(self, chat_id, chat, base_count=None):
+        self.chats.save_chat(chat_id, chat, base_count=base_count)
+
+    def delete_chat(self, chat_id):
+        self.chats.delete_chat(chat_id)
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _to_iso(value):
+    return value.isoformat() if value is not None else None
+
+
+# Message fields with a column of their own; the rest go to Message.extra
+MESSAGE_COLUMNS = {'role', 'content', 'timestamp'}
+
+
+class SqlRepository:
+    """Repository backed by the SQLAlchemy models (SQLite in WAL mode by default).
+
+    User lookups hit the unique index on ``users.username`` and chat listing
+    uses the ``(user_id, updated_at)`` index instead of scanning every record.
+    """
+
+    def __init__(self, url=None):
+        self.Session = get_sessionmaker(url) if url else get_sessionmaker()
+
+    def get_user_by_username(self, username):
+        metrics.incr("repository_queries_total", backend="sql", query="user_by_username")
+        with self.Session() as session:
+            user = session.execute(select(User).where(User.username == username)).scalar_one_or_none()
+            if user is None:
+                return None
+            return user.uid, {
+                'username': user.username,
+                'password': user.password_hash,
+                'email': user.email,
+                'created_at': _to_iso(user.created_at)
+            }
+
+    def create_user(self, username, password_hash, email, user_id, created_at):
+        """Add a user; returns False if the username is already taken.
+
+        Emails are unique in the schema too: a clash on the email alone
+        raises EmailTakenError so callers can tell the two apart.
+        """
+        with self.Session() as session:
+            session.add(User(uid=user_id, username=username, password_hash=password_hash,
+                             email=email or None, created_at=_to_datetime(created_at)))
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                taken = session.execute(select(User.id).where(User.username == username)).first()
+                if taken is None and email:
+                    raise EmailTakenError(email)
+                return False
+            return True
+
+    def list_chats(self, user_id, offset=0, limit=None):
+        metrics.incr("repository_queries_total", backend="sql", query="list_chats")
+        message_count = (select(func.count(Message.id))
+                         .where(Message.chat_id == Chat.id)
+                         .scalar_subquery())
+        with self.Session() as session:
+            rows = session.execute(
+                select(Chat.id, Chat.title, Chat.created_at, Chat.updated_at,
+                       message_count.label('message_count'))
+                .where(Chat.user_id == user_id)
+                .order_by(Chat.updated_at.desc())
+                .offset(offset)
+                .limit(limit)
+            ).all()
+            return [{
+                'id': row.id,
+                'title': row.title,
+                'created_at': _to_iso(row.created_at),
+                'updated_at': _to_iso(row.updated_at),
+                'message_count': row.message_count
+            } for row in rows]
+
+    def count_chats(self, user_id):
+        with self.Session() as session:
+            return session.scalar(select(func.count(Chat.id)).where(Chat.user_id == user_id))
+
+    def load_chat(self, chat_id):
+        with self.Session() as session:
+            chat = session.get(Chat, chat_id)
+            if chat is None:
+                return None
+            return {
+                'user_id': chat.user_id,
+                'title': chat.title,
+                'created_at': _to_iso(chat.created_at),
+                'updated_at': _to_iso(chat.updated_at),
+                'messages': [{
+                    'role': message.role,
+                    'content': message.content,
+                    'timestamp': _to_iso(message.timestamp),
+                    **(json.loads(message.extra) if message.extra else {})
+                } for message in chat.messages]
+            }
+
+    def save_chat(self, chat_id, chat, base_count=None):
+        """Upsert the chat row and insert only the messages after ``base_count``"""
+        messages = chat.get('messages', [])
+        with self.Session() as session:
+            row = session.get(Chat, chat_id)
+            if row is None:
+                if base_count:
+                    # Deleted since this session last saved it
+                    return
+                row = Chat(id=chat_id, user_id=chat.get('user_id'),
+                           created_at=_to_datetime(chat.get('created_at')))
+                session.add(row)
+                base_count = 0
+            elif base_count is None:
+                base_count = session.scalar(
+                    select(func.count(Message.id)).where(Message.chat_id == chat_id))
+            if 'title' in chat:
+                row.title = chat['title']
+            if 'updated_at' in chat:
+                row.updated_at = _to_datetime(chat['updated_at'])
+            for message in messages[base_count:]:
+                extra = {key: value for key, value in message.items() if key not in MESSAGE_COLUMNS}
+                session.add(Message(chat_id=chat_id, role=message.get('role'),
+                                    content=message.get('content'),
+                                    timestamp=_to_datetime(message.get('timestamp')),
+                                    extra=json.dumps(extra) if extra else None))
+            session.commit()
+
+    def delete_chat(self, chat_id):
+        with self.Session() as session:
+            chat = session.get(Chat, chat_id)
+            if chat is not None:
+                session.delete(chat)
+                session.commit()
+
+
+def get_repository(users_file, chats_dir, backend=BACKEND):
+    if backend == "sqlite":
+        return SqlRepository()
+    return JsonRepository(users_file, chats_dir)
+
+
+def import_json_data(repo, users_file, chats_dir):
+    """One-shot import of users.json and the chat store into a SqlRepository.
+
+    Users already present (same username) and chats already present are
+    skipped, so the import can be re-run safely. A user whose email is
+    already used by another account is imported without it, with a warning
+    on stderr. Returns (users, chats) imported.
+    """
+    source = JsonRepository(users_file, chats_dir)
+    users = json_cache.get(users_file) if os.path.exists(users_file) else {}
+    imported_users = 0
+    for key, user in users.items():
+        # Older files are keyed by username and keep the uuid under 'id'
+        if 'username' in user:
+            user_id, username = key, user['username']
+        else:
+            user_id, username = user.get('id', key), key
+        try:
+            created = repo.create_user(username, user.get('password'), user.get('email'),
+                                       user_id, user.get('created_at'))
+        except EmailTakenError:
+            print(f"{username}: email {user['email']} is already used by another account, "
+                  f"importing without it", file=sys.stderr)
+            created = repo.create_user(username, user.get('password'), None,
+                                       user_id, user.get('created_at'))
+        if created:
+            imported_users += 1
+
+    imported_chats = 0
+    for chat_id in source.chats.chat_ids():
+        if repo.load_chat(chat_id) is not None:
+            continue
+        repo.save_chat(chat_id, source.load_chat(chat_id), base_count=0)
+        imported_chats += 1
+    return imported_users, imported_chats
+
+
+if __name__ == '__main__':
+    # python repository.py [data_dir]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    chats_dir = os.path.join(data_dir, "chats")
+    get_chat_store(chats_dir).migrate(os.path.join(data_dir, "chats.json"))
+    users, chats = import_json_data(SqlRepository(), os.path.join(data_dir, "users.json"), chats_dir)
+    print(f"Imported {users} users and {chats} chats")
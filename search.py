@@ -0,0 +1,31 @@
+import json
+
+import metrics
+from llm import ResponseCache
+
+# Search results go stale faster than model output
+SEARCH_TTL = 24 * 3600
+SEARCH_MAX_ENTRIES = 2000
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a search query"""
+    return " ".join(query.split()).casefold()
+
+
+def cached_search(query, fetch, cache, provider="serper"):
+    """Return ``fetch(query)`` through the on-disk search cache.
+
+    Queries that only differ in case or spacing share an entry. Results
+    containing an error are returned but not cached.
+    """
+    key = ResponseCache.make_key(provider, normalize_query(query))
+    cached = cache.get(key)
+    if cached is not None:
+        metrics.incr("search_cache_hits_total", feature="search")
+        return json.loads(cached)
+    metrics.incr("search_cache_misses_total", feature="search")
+    results = fetch(query)
+    if results and not any('error' in result for result in results):
+        cache.put(key, "search", json.dumps(results))
+    return results
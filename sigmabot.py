@@ -7,22 +7,43 @@ import hashlib
 import uuid
 import google.generativeai as genai
 from dotenv import load_dotenv
-import requests
 from bs4 import BeautifulSoup
 import time
 import re
 import random
+import functools
 from streamlit.components.v1 import html
+from storage import get_chat_store, json_cache, save_json, thaw
+import metrics
+from repository import EmailTakenError, get_repository
+from llm import MockModel, generate_text, get_response_cache, stream_content
+from rendering import FrameRenderer, history_html, message_html, stylesheet_html
+from fanout import fan_out, submit
+from httpclient import get_client
+from context import ContextWindow, estimate_tokens, format_turn
+from decks import GRADES, get_deck_store, source_key
+from flashcards import MAP_TOKENS, document_units, map_reduce_cards, text_units
+from ingest import IngestError, document_text, ingest
+from structured import CARD_SCHEMA, QUIZ_SCHEMA, generate_items, json_config, parse_flashcards, parse_questions
+from quizbank import get_quiz_bank
+from search import SEARCH_MAX_ENTRIES, SEARCH_TTL, cached_search
+from weather import dummy_weather, format_weather, get_weather
+from jobs import get_job_runner
+from images import analysis_key, cached_image_analysis
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Gemini API
 try:
-    # Try to load from environment variable first
-    api_key = os.getenv("GEMINI_API_KEY")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    if os.getenv("SIGMABOT_MOCK_LLM"):
+        # Offline mode: canned streaming replies, no API key needed
+        model = MockModel(chunk_delay=0.02)
+    else:
+        # Try to load from environment variable first
+        api_key = os.getenv("GEMINI_API_KEY")
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel('gemini-2.0-flash')
 except Exception as e:
     st.error(f"Error initializing Gemini API: {str(e)}")
     st.stop()
@@ -31,56 +52,126 @@ except Exception as e:
 DATA_DIR = "data"
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 CHATS_FILE = os.path.join(DATA_DIR, "chats.json")
+CHATS_DIR = os.path.join(DATA_DIR, "chats")
+
+# Persistent cache for repeatable Gemini calls (flashcards, quizzes, itineraries)
+LLM_CACHE_FILE = os.path.join(DATA_DIR, "llm_cache.db")
+# Image analyses are cached there too, by SHA-256 of the image plus this prompt
+IMAGE_PROMPT = "yo, check out this pic and tell me what you see in a chill way, like you're talking to a friend. use gen z slang and keep it casual"
+# Token budget for recent chat turns sent with each message; older turns are summarized
+CHAT_CONTEXT_BUDGET = 1500
+SUMMARY_MESSAGE_CHARS = 2000
+CHAT_INSTRUCTION = "respond to the user's latest message in a chill, gen z way using slang like 'bro', 'aight', 'cool', etc. keep it casual and lowercase."
+
+# Uploaded documents are chunked into this directory; prompts get at most
+# DOCUMENT_CONTEXT_BUDGET tokens of their most relevant chunks, in total
+UPLOADS_DIR = os.path.join(DATA_DIR, "uploads")
+# Per-user flashcard decks with their review schedules
+DECKS_DIR = os.path.join(DATA_DIR, "decks")
+DOCUMENT_CONTEXT_BUDGET = 2000
+
+# Persistent cache of web search results
+SEARCH_CACHE_FILE = os.path.join(DATA_DIR, "search_cache.db")
+
+# Seconds to wait for the itinerary's side lookups and for the itinerary itself
+FANOUT_TIMEOUT = 10
+ITINERARY_TIMEOUT = 90
+
+# Seconds between checks on a running background job (itinerary, flashcards, image analysis)
+JOB_POLL_INTERVAL = 0.25
+
+# Questions per generated quiz
+QUIZ_LENGTH = 5
+QUIZ_CATEGORIES = ["Science", "History", "Sports", "Music", "Movies", "Geography", "Technology", "Art"]
+
+# Question bank for the fixed categories, filled by a background thread
+# (set SIGMABOT_QUIZ_BANK=0 to turn the filler off)
+QUIZ_BANK_FILE = os.path.join(DATA_DIR, "quiz_bank.db")
+QUIZ_BANK_BATCH = 10
+QUIZ_BANK_ENABLED = os.getenv("SIGMABOT_QUIZ_BANK", "1") != "0"
+
+# Number of chat messages rendered at first (and added per "Load earlier messages")
+CHAT_WINDOW_SIZE = 30
+
+# Number of chats listed in the sidebar per page
+SIDEBAR_PAGE_SIZE = 20
+
+# Stylesheet and other files served to the browser
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
 
 # Create data directory if it doesn't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Chats are stored one append-only segment per chat; the monolithic
+# chats.json is imported once and kept as chats.json.migrated
+chat_store = get_chat_store(CHATS_DIR)
+chat_store.migrate(CHATS_FILE)
+
+# Users and chats are read and written through the repository layer;
+# set SIGMABOT_BACKEND=sqlite to use the SQLAlchemy models instead
+repo = get_repository(USERS_FILE, CHATS_DIR)
+
+response_cache = get_response_cache(LLM_CACHE_FILE)
+deck_store = get_deck_store(DECKS_DIR)
+quiz_bank = get_quiz_bank(QUIZ_BANK_FILE)
+search_cache = get_response_cache(SEARCH_CACHE_FILE, ttl=SEARCH_TTL, max_entries=SEARCH_MAX_ENTRIES)
+# Long Gemini tasks run here so reruns don't cancel or repeat them
+job_runner = get_job_runner()
+
 # Initialize data files if they don't exist
 def init_data_files():
     initial_data = {
-        USERS_FILE: {},
-        CHATS_FILE: {}
+        USERS_FILE: {}
     }
     
     for file_path, default_data in initial_data.items():
         try:
             if not os.path.exists(file_path):
-                with open(file_path, 'w') as f:
-                    json.dump(default_data, f, indent=2)
+                save_json(file_path, default_data)
             else:
                 # Verify the file is valid JSON and has correct structure
                 with open(file_path, 'r') as f:
                     data = json.load(f)
-                    if not isinstance(data, dict):
-                        # Reset file if data structure is incorrect
-                        with open(file_path, 'w') as f:
-                            json.dump(default_data, f, indent=2)
+                if not isinstance(data, dict):
+                    raise ValueError("expected a JSON object")
         except Exception as e:
             print(f"Error with {file_path}: {str(e)}")
-            # Reset file if there's any error
-            with open(file_path, 'w') as f:
-                json.dump(default_data, f, indent=2)
+            # Keep the unreadable file around instead of silently dropping it
+            backup_path = f"{file_path}.corrupt-{datetime.now():%Y%m%d%H%M%S}"
+            os.replace(file_path, backup_path)
+            print(f"Moved {file_path} to {backup_path}")
+            save_json(file_path, default_data)
 
 init_data_files()
 
 # Data management functions
-def load_data(file_path):
+def load_data(file_path, readonly=False):
+    """Load a JSON data file through the process-wide cache.
+
+    Pass ``readonly=True`` to get the shared frozen view without copying;
+    by default callers get a mutable copy they are free to modify.
+    """
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            # Ensure we always return a dictionary
-            if not isinstance(data, dict):
-                data = {}
-            return data
+        if file_path == CHATS_FILE:
+            return chat_store.load_all(readonly=readonly)
+        data = json_cache.get(file_path)
+        return data if readonly else thaw(data)
     except:
         return {}
 
-def save_data(data, file_path):
+def save_data(data, file_path, base=None):
+    """Atomically save a data file.
+
+    Pass the dict originally returned by load_data as ``base`` to merge
+    this session's changes into the latest file instead of overwriting it.
+    """
     # Ensure we're saving a dictionary
     if not isinstance(data, dict):
         data = {}
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    if file_path == CHATS_FILE:
+        chat_store.save_all(data)
+        return
+    save_json(file_path, data, base=base)
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -93,543 +184,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS with animations and effects
-st.markdown("""
-<style>
-/* Main theme - pitch black with neon effects */
-.stApp {
-    background-color: #000000 !important;
-    color: #ffffff;
-    transition: all 0.3s ease;
-    max-width: 1200px !important;
-    margin: 0 auto !important;
-    padding: 1rem !important;
-}
-
-/* Animated gradient background for headers */
-h1, h2, h3 {
-    background: linear-gradient(
-        45deg,
-        #1e88e5,
-        #1976d2,
-        #2196f3,
-        #64b5f6
-    );
-    background-size: 300% 300%;
-    color: white !important;
-    -webkit-background-clip: text;
-    background-clip: text;
-    -webkit-text-fill-color: transparent;
-    animation: gradient 5s ease infinite;
-    margin-bottom: 1rem;
-    text-shadow: 0 0 10px rgba(33, 150, 243, 0.5);
-}
-
-/* Animated gradient background */
-@keyframes gradient {
-    0% { background-position: 0% 50%; }
-    50% { background-position: 100% 50%; }
-    100% { background-position: 0% 50%; }
-}
-
-/* Glowing text inputs */
-.stTextInput input, .stTextArea textarea {
-    background-color: #1a1a1a !important;
-    color: white !important;
-    border: 2px solid #333 !important;
-    border-radius: 8px !important;
-    padding: 12px !important;
-    transition: all 0.3s ease !important;
-    box-shadow: 0 0 10px rgba(30, 136, 229, 0.1) !important;
-}
-
-.stTextInput input:focus, .stTextArea textarea:focus {
-    border-color: #1e88e5 !important;
-    box-shadow: 0 0 20px rgba(30, 136, 229, 0.3) !important;
-    transform: translateY(-2px);
-}
-
-/* Fancy buttons with glow and ripple */
-.stButton > button {
-    background: linear-gradient(45deg, #1e88e5, #1976d2) !important;
-    color: white !important;
-    border: none !important;
-    padding: 0.6rem 1.2rem !important;
-    border-radius: 8px !important;
-    font-weight: 600 !important;
-    letter-spacing: 0.5px !important;
-    text-transform: uppercase !important;
-    transition: all 0.3s ease !important;
-    position: relative !important;
-    overflow: hidden !important;
-    box-shadow: 0 0 15px rgba(30, 136, 229, 0.3) !important;
-}
-
-.stButton > button:hover {
-    transform: translateY(-2px) !important;
-    box-shadow: 0 0 30px rgba(30, 136, 229, 0.5) !important;
-    animation: button-glow 1.5s ease-in-out infinite alternate;
-}
-
-@keyframes button-glow {
-    from {
-        box-shadow: 0 0 15px rgba(30, 136, 229, 0.3);
-    }
-    to {
-        box-shadow: 0 0 30px rgba(30, 136, 229, 0.8);
-    }
-}
-
-/* Ripple effect */
-.ripple {
-    position: absolute;
-    border-radius: 50%;
-    background-color: rgba(255, 255, 255, 0.7);
-    animation: ripple 0.8s ease-out;
-    pointer-events: none;
-}
-
-@keyframes ripple {
-    to {
-        transform: scale(15);
-        opacity: 0;
-    }
-}
-
-/* Sidebar styling */
-.css-1d391kg, .css-1e5imcs {
-    background-color: #111111 !important;
-    border-right: 1px solid #333 !important;
-}
-
-/* Chat message styling */
-.chat-message {
-    padding: 0.75rem !important;
-    margin: 0.25rem 0 !important;
-    border-radius: 8px !important;
-    animation: message-appear 0.3s ease-out !important;
-    max-width: 90% !important;
-}
-
-@keyframes message-appear {
-    from {
-        opacity: 0;
-        transform: translateY(10px);
-    }
-    to {
-        opacity: 1;
-        transform: translateY(0);
-    }
-}
-
-.user-message {
-    background-color: #1a1a1a;
-    border: 1px solid #333;
-}
-
-.assistant-message {
-    background-color: #1e1e1e;
-    border: 1px solid #1e88e5;
-    box-shadow: 0 0 15px rgba(30, 136, 229, 0.2);
-}
-
-/* Loading animation */
-@keyframes loading-glow {
-    0% {
-        box-shadow: 0 0 5px #1e88e5;
-    }
-    50% {
-        box-shadow: 0 0 20px #1e88e5;
-    }
-    100% {
-        box-shadow: 0 0 5px #1e88e5;
-    }
-}
-
-.stProgress > div > div {
-    background-color: #1e88e5 !important;
-    animation: loading-glow 1.5s ease-in-out infinite;
-}
-
-/* Scrollbar styling */
-::-webkit-scrollbar {
-    width: 8px;
-    height: 8px;
-}
-
-::-webkit-scrollbar-track {
-    background: #1a1a1a;
-}
-
-::-webkit-scrollbar-thumb {
-    background: #333;
-    border-radius: 4px;
-}
-
-::-webkit-scrollbar-thumb:hover {
-    background: #1e88e5;
-    box-shadow: 0 0 10px rgba(30, 136, 229, 0.5);
-}
-
-/* Robot profile picture */
-.robot-avatar {
-    width: 32px !important;
-    height: 32px !important;
-    border-radius: 50% !important;
-    margin-right: 8px !important;
-    vertical-align: middle !important;
-}
-
-/* Loading dots animation */
-@keyframes loading-dots {
-    0%, 20% { transform: translateY(0); }
-    50% { transform: translateY(-10px); }
-    80%, 100% { transform: translateY(0); }
-}
-
-.loading-dots {
-    display: inline-flex;
-    align-items: center;
-    gap: 4px;
-}
-
-.loading-dots span {
-    width: 8px;
-    height: 8px;
-    background: #1e88e5;
-    border-radius: 50%;
-    animation: loading-dots 1.4s infinite;
-}
-
-.loading-dots span:nth-child(2) { animation-delay: 0.2s; }
-.loading-dots span:nth-child(3) { animation-delay: 0.4s; }
-
-/* Compact input area */
-.stTextArea textarea {
-    height: 60px !important;
-    padding: 8px !important;
-    font-size: 14px !important;
-}
-
-/* File upload styling */
-.stFileUploader {
-    margin: 0.5rem 0 !important;
-}
-
-.stFileUploader > div {
-    background-color: #1a1a1a !important;
-    border: 2px solid #333 !important;
-    border-radius: 8px !important;
-    padding: 8px !important;
-}
-
-/* Search bar styling */
-.search-bar {
-    display: flex;
-    gap: 8px;
-    margin-bottom: 1rem;
-}
-
-.search-bar input {
-    flex: 1;
-    background-color: #1a1a1a !important;
-    color: white !important;
-    border: 2px solid #333 !important;
-    border-radius: 8px !important;
-    padding: 8px !important;
-}
-
-.search-bar button {
-    background: linear-gradient(45deg, #1e88e5, #1976d2) !important;
-    color: white !important;
-    border: none !important;
-    padding: 8px 16px !important;
-    border-radius: 8px !important;
-    font-weight: 600 !important;
-}
-
-/* Flashcard styling */
-.quizlet-card {
-    background: linear-gradient(45deg, #1e88e5, #1976d2);
-    border-radius: 15px;
-    padding: 30px;
-    margin: 20px auto;
-    max-width: 600px;
-    box-shadow: 0 4px 15px rgba(0,0,0,0.2);
-    font-family: 'Helvetica Neue', Arial, sans-serif;
-    position: relative;
-    min-height: 200px;
-    display: flex;
-    flex-direction: column;
-    justify-content: center;
-    align-items: center;
-    text-align: center;
-    color: white;
-    transition: transform 0.6s;
-    transform-style: preserve-3d;
-}
-
-.quizlet-card-front, .quizlet-card-back {
-    position: absolute;
-    width: 100%;
-    height: 100%;
-    backface-visibility: hidden;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    font-size: 32px;
-    font-weight: 600;
-    padding: 20px;
-}
-
-.quizlet-card-back {
-    transform: rotateY(180deg);
-}
-
-.quizlet-card.flipped {
-    transform: rotateY(180deg);
-}
-
-.quizlet-button {
-    background: rgba(255, 255, 255, 0.2);
-    color: white;
-    border: 2px solid white;
-    border-radius: 25px;
-    padding: 10px 25px;
-    font-size: 16px;
-    font-weight: 600;
-    cursor: pointer;
-    transition: all 0.3s ease;
-    margin: 10px;
-}
-
-.quizlet-button:hover {
-    background: rgba(255, 255, 255, 0.3);
-    transform: translateY(-2px);
-}
-
-.quizlet-progress {
-    color: white;
-    font-size: 16px;
-    margin: 15px 0;
-    text-align: center;
-}
-
-/* Balloon animation */
-@keyframes balloon-rise {
-    0% { transform: translateY(100vh) scale(0.5); opacity: 0; }
-    10% { transform: translateY(80vh) scale(1); opacity: 1; }
-    100% { transform: translateY(-100vh) scale(0.5); opacity: 0; }
-}
-
-.balloon {
-    position: fixed;
-    width: 40px;
-    height: 50px;
-    background: linear-gradient(45deg, #ff69b4, #ff1493);
-    border-radius: 50%;
-    animation: balloon-rise 3s ease-out;
-    z-index: 1000;
-    box-shadow: 0 0 20px rgba(255, 105, 180, 0.5);
-}
-
-.balloon::before {
-    content: '';
-    position: absolute;
-    bottom: -10px;
-    left: 50%;
-    transform: translateX(-50%);
-    width: 2px;
-    height: 20px;
-    background: #ff69b4;
-}
-
-/* Timer styles */
-.timer-container {
-    position: fixed;
-    top: 20px;
-    right: 20px;
-    background: rgba(30, 42, 69, 0.8);
-    padding: 10px 20px;
-    border-radius: 10px;
-    border: 1px solid #2D3B58;
-    box-shadow: 0 4px 20px rgba(59, 130, 246, 0.2);
-    z-index: 1000;
-}
-
-.timer-text {
-    font-size: 24px;
-    color: white;
-    text-align: center;
-    margin: 0;
-}
-
-/* Star animation */
-@keyframes star-spin {
-    0% { transform: rotate(0deg) scale(0); opacity: 0; }
-    50% { transform: rotate(180deg) scale(1); opacity: 1; }
-    100% { transform: rotate(360deg) scale(0); opacity: 0; }
-}
-
-.star {
-    position: fixed;
-    width: 30px;
-    height: 30px;
-    background: gold;
-    clip-path: polygon(50% 0%, 61% 35%, 98% 35%, 68% 57%, 79% 91%, 50% 70%, 21% 91%, 32% 57%, 2% 35%, 39% 35%);
-    animation: star-spin 1.5s ease-out;
-    z-index: 1000;
-}
-
-/* X animation */
-@keyframes x-appear {
-    0% { transform: scale(0) rotate(0deg); opacity: 0; }
-    50% { transform: scale(1.2) rotate(45deg); opacity: 1; }
-    100% { transform: scale(1) rotate(45deg); opacity: 1; }
-}
-
-@keyframes x-shatter {
-    0% { transform: scale(1) rotate(45deg); opacity: 1; }
-    20% { transform: scale(1.2) rotate(45deg); opacity: 1; }
-    100% { transform: scale(0) rotate(45deg) translateY(100vh); opacity: 0; }
-}
-
-.x-mark {
-    position: fixed;
-    width: 150px;
-    height: 150px;
-    color: #ff0000;
-    font-size: 150px;
-    z-index: 1000;
-    text-align: center;
-    line-height: 150px;
-    left: 50%;
-    top: 50%;
-    transform: translate(-50%, -50%);
-    text-shadow: 0 0 20px rgba(255, 0, 0, 0.5);
-}
-
-.x-mark.appear {
-    animation: x-appear 0.5s ease-out forwards;
-}
-
-.x-mark.shatter {
-    animation: x-shatter 1s ease-in forwards;
-}
-</style>
-
-<script>
-// Ripple effect for buttons
-document.addEventListener('DOMContentLoaded', function() {
-    function createRipple(event) {
-        const button = event.currentTarget;
-        const ripple = document.createElement('span');
-        const rect = button.getBoundingClientRect();
-        
-        ripple.className = 'ripple';
-        ripple.style.left = event.clientX - rect.left + 'px';
-        ripple.style.top = event.clientY - rect.top + 'px';
-        
-        button.appendChild(ripple);
-        
-        ripple.addEventListener('animationend', () => {
-            ripple.remove();
-        });
-    }
-
-    document.querySelectorAll('.stButton > button').forEach(button => {
-        button.addEventListener('click', createRipple);
-    });
-});
-
-// Hover glow effect
-document.addEventListener('mousemove', function(e) {
-    const x = e.clientX;
-    const y = e.clientY;
-    const buttons = document.querySelectorAll('.stButton > button');
-    
-    buttons.forEach(button => {
-        const rect = button.getBoundingClientRect();
-        const buttonX = rect.left + rect.width / 2;
-        const buttonY = rect.top + rect.height / 2;
-        const distance = Math.sqrt(Math.pow(x - buttonX, 2) + Math.pow(y - buttonY, 2));
-        
-        if (distance < 100) {
-            const intensity = 1 - distance / 100;
-            button.style.boxShadow = `0 0 ${30 * intensity}px rgba(30, 136, 229, ${0.5 * intensity})`;
-        } else {
-            button.style.boxShadow = '';
-        }
-    });
-});
-
-function createBalloon() {
-    const colors = ['#ff69b4', '#ff1493', '#ff00ff', '#ff69b4', '#ff1493'];
-    for(let i = 0; i < 5; i++) {
-        setTimeout(() => {
-            const balloon = document.createElement('div');
-            balloon.className = 'balloon';
-            balloon.style.left = (Math.random() * (window.innerWidth - 40)) + 'px';
-            balloon.style.background = colors[i % colors.length];
-            document.body.appendChild(balloon);
-            setTimeout(() => balloon.remove(), 3000);
-        }, i * 200);
-    }
-}
-
-function createStar() {
-    const star = document.createElement('div');
-    star.className = 'star';
-    star.style.left = Math.random() * window.innerWidth + 'px';
-    star.style.top = Math.random() * window.innerHeight + 'px';
-    document.body.appendChild(star);
-    setTimeout(() => star.remove(), 1500);
-}
-
-function showX() {
-    const x = document.createElement('div');
-    x.className = 'x-mark appear';
-    x.innerHTML = '✕';
-    document.body.appendChild(x);
-    
-    setTimeout(() => {
-        x.classList.remove('appear');
-        x.classList.add('shatter');
-        setTimeout(() => x.remove(), 1000);
-    }, 500);
-}
-
-function flipCard() {
-    const card = document.querySelector('.quizlet-card');
-    card.classList.toggle('flipped');
-}
-
-// Timer update function
-function updateTimer() {
-    const timerElement = document.getElementById('quiz-timer');
-    if (timerElement) {
-        const startTime = parseInt(timerElement.getAttribute('data-start-time'));
-        const duration = parseInt(timerElement.getAttribute('data-duration'));
-        const now = Math.floor(Date.now() / 1000);
-        const elapsed = now - startTime;
-        const remaining = Math.max(0, duration * 60 - elapsed);
-        
-        const minutes = Math.floor(remaining / 60);
-        const seconds = remaining % 60;
-        
-        timerElement.textContent = `${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`;
-        
-        if (remaining > 0) {
-            setTimeout(updateTimer, 1000);
-        } else {
-            // Time's up - trigger quiz submission
-            const submitEvent = new Event('timeUp');
-            document.dispatchEvent(submitEvent);
-        }
-    }
-}
-</script>
-""", unsafe_allow_html=True)
+# Custom CSS with animations and effects. Registering assets/ as a component
+# directory makes Streamlit serve its files (with the right content type) at
+# component/<name>/, so each rerun only sends a short <link>
+assets = components.declare_component("assets", path=ASSETS_DIR)
+st.markdown(stylesheet_html(os.path.join(ASSETS_DIR, "sigmabot.css"), f"component/{assets.name}"),
+            unsafe_allow_html=True)
 
 # Initialize session state
 if 'user' not in st.session_state:
@@ -638,9 +198,63 @@ if 'current_chat' not in st.session_state:
     st.session_state.current_chat = None
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'chat_saved_count' not in st.session_state:
+    st.session_state.chat_saved_count = 0
+
+def summarize_turns(summary, messages):
+    """Fold older chat messages into the running conversation summary"""
+    # Cap each message so a pasted file can't blow up the summary prompt
+    turns = "\n".join(format_turn(message, max_chars=SUMMARY_MESSAGE_CHARS) for message in messages)
+    prompt = f"""update this running summary of a conversation between a user and sigmabot.
+    keep names, facts, preferences and open questions; stay under 150 words.
+    current summary: {summary or '(none yet)'}
+    new messages:
+    {turns}"""
+    return generate_text(model, prompt, "summary", response_cache)
+
+def chat_instruction(history, question):
+    """Chat persona prompt plus the uploaded-document excerpts relevant to ``question``.
+
+    DOCUMENT_CONTEXT_BUDGET is shared evenly by the chat's attachments, so
+    more uploads mean shorter excerpts rather than a longer prompt.
+    """
+    documents = {}
+    for message in history:
+        document = message.get('attachment')
+        if document and os.path.exists(document.get('path', '')):
+            documents.setdefault(document['sha256'], document)
+    excerpts = []
+    for document in documents.values():
+        text = document_text(document, question, budget=DOCUMENT_CONTEXT_BUDGET // len(documents))
+        excerpts.append(f"excerpts from {document['name']}:\n{text}")
+    if not excerpts:
+        return CHAT_INSTRUCTION
+    return CHAT_INSTRUCTION + "\n\n" + "\n\n".join(excerpts)
+
+def get_chat_context():
+    """Summary state for the active chat, reset when the chat changes.
+
+    A chat that is opened again picks up the summary saved on its latest
+    assistant message that carries one, so old turns aren't folded again.
+    """
+    context_state = st.session_state.get('chat_context')
+    if context_state is None or context_state.get('chat_id') != st.session_state.current_chat:
+        saved = next((message['context'] for message in reversed(st.session_state.chat_history)
+                      if message.get('context')), {})
+        context_state = st.session_state.chat_context = {
+            'chat_id': st.session_state.current_chat,
+            'upto': saved.get('upto', 0), 'summary': saved.get('summary', '')
+        }
+    return context_state
+
+context_window = ContextWindow(summarize_turns, budget=CHAT_CONTEXT_BUDGET)
 
 # Web search function
 def search_web(query):
+    """Search the web, reusing cached results for repeated queries"""
+    return cached_search(query, fetch_search_results, search_cache)
+
+def fetch_search_results(query):
     try:
         # Use Serper.dev API
         url = "https://google.serper.dev/search"
@@ -653,7 +267,7 @@ def search_web(query):
             'num': 5  # Number of results to return
         }
         
-        response = requests.post(url, headers=headers, json=payload)
+        response = get_client().post(url, upstream="serper", headers=headers, json=payload)
         data = response.json()
         
         results = []
@@ -680,47 +294,66 @@ def search_web(query):
     except Exception as e:
         return [{'error': str(e)}]
 
-# Typing animation function
-def type_text(text, container):
-    # Clear the container first
+def reply_renderer(container):
+    """FrameRenderer drawing a streamed reply into ``container`` the way history shows it"""
+    return FrameRenderer(lambda markup: container.markdown(markup, unsafe_allow_html=True),
+                         style=functools.partial(message_html, 'assistant'))
+
+# Streaming reply renderer
+def stream_reply(chunks, container):
+    """Render model output as the chunks arrive; returns the full raw reply.
+
+    Updates are batched into ~50 ms frames under a per-message byte budget,
+    so websocket traffic stays roughly linear in the reply size.
+    """
     container.empty()
-    
-    # Create a placeholder for the full text
-    full_text = ""
-    
-    # Convert text to lowercase and add Gen Z style
-    text = text.lower()
-    text = text.replace("i'm", "im")
-    text = text.replace("i am", "im")
-    text = text.replace("you are", "ur")
-    text = text.replace("you're", "ur")
-    text = text.replace("what's up", "wassup")
-    text = text.replace("okay", "aight")
-    text = text.replace("alright", "aight")
-    text = text.replace("brother", "bro")
-    text = text.replace("sister", "sis")
-    text = text.replace("thank you", "ty")
-    text = text.replace("thanks", "ty")
-    text = text.replace("no problem", "np")
-    text = text.replace("for real", "fr")
-    text = text.replace("to be honest", "tbh")
-    text = text.replace("in my opinion", "imo")
-    text = text.replace("just kidding", "jk")
-    text = text.replace("laughing out loud", "lol")
-    text = text.replace("right now", "rn")
-    text = text.replace("by the way", "btw")
-    
-    # Type out the text character by character
-    for char in text:
-        full_text += char
-        container.markdown(f"""
-        <div class="chat-message assistant-message">
-            <span style="font-size: 24px;">🤖</span>
-            <strong>sigma:</strong><br>
-            {full_text}
-        </div>
-        """, unsafe_allow_html=True)
-        time.sleep(0.01)  # Adjust speed as needed
+    renderer = reply_renderer(container)
+    for chunk in chunks:
+        renderer.feed(chunk)
+    return renderer.close()
+
+# Background jobs: the session keeps only the job id per slot
+def start_job(slot, kind, key, fn, *args):
+    """Submit ``fn(job, *args)`` (or join the identical job already running) and remember it"""
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = {}
+    job = job_runner.submit(kind, key, fn, *args)
+    st.session_state.jobs[slot] = job.id
+    return job
+
+def current_job(slot):
+    job_id = st.session_state.get('jobs', {}).get(slot)
+    return job_runner.get(job_id) if job_id else None
+
+def finish_job(slot):
+    st.session_state.jobs.pop(slot, None)
+
+def follow_job(job, container=None):
+    """Wait for a background job, rendering its streamed text into ``container``.
+
+    The loop touches the page on every poll, so a rerun (any widget
+    interaction) interrupts the wait but not the job; the next run finds
+    the job id in session state and picks up where this one left off.
+    """
+    started = time.monotonic()
+    status = st.empty()
+    renderer = reply_renderer(container) if container is not None else None
+    seen = 0
+    while True:
+        finished = job.wait(JOB_POLL_INTERVAL)
+        if renderer is not None:
+            chunks = job.partial[seen:]
+            seen += len(chunks)
+            for chunk in chunks:
+                renderer.feed(chunk)
+        else:
+            status.caption(f"still working... {int(time.monotonic() - started)}s")
+        if finished:
+            break
+    if renderer is not None:
+        renderer.close()
+    status.empty()
+    return job
 
 def show_auth_ui():
     st.title("welcome to sigmabot")
@@ -739,11 +372,7 @@ def show_auth_ui():
                 
                 if submitted:
                     if username and password:
-                        users = load_data(USERS_FILE)
-                        user_entry = next((
-                            (uid, user) for uid, user in users.items()
-                            if user.get('username') == username
-                        ), None)
+                        user_entry = repo.get_user_by_username(username)
                         
                         if user_entry and user_entry[1]['password'] == hash_password(password):
                             st.session_state.user = {
@@ -771,37 +400,67 @@ def show_auth_ui():
                             st.error("Passwords do not match!")
                             return
                         
-                        users = load_data(USERS_FILE)
-                        
-                        # Check if username already exists
-                        if any(user.get('username') == new_username for user in users.values()):
+                        # Create new user (fails if the username is taken)
+                        try:
+                            created = repo.create_user(
+                                new_username,
+                                hash_password(new_password),
+                                email,
+                                str(uuid.uuid4()),
+                                datetime.now().isoformat()
+                            )
+                        except EmailTakenError:
+                            st.error("That email is already used by another account!")
+                            return
+                        if not created:
                             st.error("Username already exists!")
                             return
                         
-                        # Create new user
-                        user_id = str(uuid.uuid4())
-                        users[user_id] = {
-                            'username': new_username,
-                            'password': hash_password(new_password),
-                            'email': email,
-                            'created_at': datetime.now().isoformat()
-                        }
-                        
-                        save_data(users, USERS_FILE)
                         st.success("Account created successfully! Please sign in.")
                         st.rerun()
                     else:
                         st.warning("Please fill in all required fields")
 
+def handled_images():
+    """Keys of the images already added to the active chat; empty for another chat"""
+    handled = st.session_state.get('handled_images')
+    if handled is None or handled['chat'] != st.session_state.current_chat:
+        handled = st.session_state.handled_images = {'chat': st.session_state.current_chat, 'keys': set()}
+    return handled['keys']
+
+def save_current_chat(title):
+    """Persist the active chat, appending only the new messages"""
+    now = datetime.now().isoformat()
+    if not st.session_state.current_chat:
+        st.session_state.current_chat = str(uuid.uuid4())
+        # Images handled before the first save belong to the chat just created
+        handled = st.session_state.get('handled_images')
+        if handled is not None and handled['chat'] is None:
+            handled['chat'] = st.session_state.current_chat
+        chat = {
+            'user_id': st.session_state.user['id'],
+            'title': title,
+            'messages': st.session_state.chat_history,
+            'created_at': now,
+            'updated_at': now
+        }
+    else:
+        chat = {
+            'messages': st.session_state.chat_history,
+            'updated_at': now
+        }
+    # Only append what this session added so concurrent sessions merge
+    repo.save_chat(st.session_state.current_chat, chat,
+                   base_count=st.session_state.chat_saved_count)
+    st.session_state.chat_saved_count = len(st.session_state.chat_history)
+
 def delete_chat(chat_id):
-    chats = load_data(CHATS_FILE)
-    if chat_id in chats:
-        del chats[chat_id]
-        save_data(chats, CHATS_FILE)
-        if st.session_state.current_chat == chat_id:
-            st.session_state.current_chat = None
-            st.session_state.chat_history = []
-        st.rerun()
+    repo.delete_chat(chat_id)
+    if st.session_state.current_chat == chat_id:
+        st.session_state.current_chat = None
+        st.session_state.chat_history = []
+        st.session_state.chat_saved_count = 0
+    st.rerun()
 
 def show_sidebar():
     st.sidebar.title("🤖 sigmabot")
@@ -819,24 +478,34 @@ def show_sidebar():
     if st.sidebar.button("New Chat", key="new_chat_btn"):
         st.session_state.current_chat = None
         st.session_state.chat_history = []
+        st.session_state.chat_saved_count = 0
         st.rerun()
     
     # Chat history
     st.sidebar.markdown("### Chat History")
-    chats = load_data(CHATS_FILE)
-    user_chats = {cid: chat for cid, chat in chats.items() 
-                 if chat['user_id'] == st.session_state.user['id']}
-    
-    for chat_id, chat in user_chats.items():
+    # Only the user's chat manifest is read here; messages load on click
+    if 'sidebar_chat_limit' not in st.session_state:
+        st.session_state.sidebar_chat_limit = SIDEBAR_PAGE_SIZE
+    user_id = st.session_state.user['id']
+    user_chats = repo.list_chats(user_id, limit=st.session_state.sidebar_chat_limit)
+    
+    for chat in user_chats:
+        chat_id = chat['id']
         col1, col2 = st.sidebar.columns([4, 1])
         with col1:
             if st.button(f"💬 {chat['title']}", key=f"chat_{chat_id}"):
                 st.session_state.current_chat = chat_id
-                st.session_state.chat_history = chat['messages']
+                st.session_state.chat_history = repo.load_chat(chat_id)['messages']
+                st.session_state.chat_saved_count = len(st.session_state.chat_history)
                 st.rerun()
         with col2:
             if st.button("🗑️", key=f"delete_{chat_id}"):
                 delete_chat(chat_id)
+    
+    if repo.count_chats(user_id) > st.session_state.sidebar_chat_limit:
+        if st.sidebar.button("Load more chats", key="load_more_chats_btn"):
+            st.session_state.sidebar_chat_limit += SIDEBAR_PAGE_SIZE
+            st.rerun()
 
 def show_chat_ui():
     st.title("chat with sigmabot")
@@ -848,102 +517,71 @@ def show_chat_ui():
         # Chat history display
         chat_container = st.container()
         with chat_container:
-            for message in st.session_state.chat_history:
-                if message['role'] == 'user':
-                    st.markdown(f"""
-                    <div class="chat-message user-message">
-                        <strong>You:</strong><br>
-                        {message['content']}
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""
-                    <div class="chat-message assistant-message">
-                        <span style="font-size: 24px;">🤖</span>
-                        <strong>sigma:</strong><br>
-                        {message['content']}
-                    </div>
-                    """, unsafe_allow_html=True)
+            # Only the newest messages are rendered; older ones load on demand
+            if ('chat_window_size' not in st.session_state
+                    or st.session_state.chat_window_for != st.session_state.current_chat):
+                st.session_state.chat_window_for = st.session_state.current_chat
+                st.session_state.chat_window_size = CHAT_WINDOW_SIZE
+            history = st.session_state.chat_history
+            hidden = max(0, len(history) - st.session_state.chat_window_size)
+            if hidden:
+                if st.button(f"Load earlier messages ({hidden} more)", key="load_earlier_messages"):
+                    st.session_state.chat_window_size += CHAT_WINDOW_SIZE
+                    st.rerun()
+            # One markdown block for the whole window, built from cached per-message HTML
+            if history:
+                st.markdown(history_html(history[hidden:]), unsafe_allow_html=True)
         
         # File upload
         uploaded_file = st.file_uploader("Upload a file", type=['txt', 'pdf', 'docx', 'csv', 'png', 'jpg', 'jpeg', 'gif'])
         if uploaded_file is not None:
             if uploaded_file.type.startswith('image/'):
-                # Handle image upload
+                # Handle image upload: analyzed once per image, in a background job
                 st.image(uploaded_file, caption=uploaded_file.name)
-                st.session_state.chat_history.append({
-                    'role': 'user',
-                    'content': f"I've uploaded an image: {uploaded_file.name}",
-                    'timestamp': datetime.now().isoformat()
-                })
+                image_bytes = uploaded_file.getvalue()
+                key = analysis_key(getattr(model, "model_name", "unknown"), image_bytes, IMAGE_PROMPT)
+                # Handled once per image per chat, however many reruns keep it selected
+                handled = handled_images()
+                if key not in handled:
+                    handled.add(key)
+                    st.session_state.chat_history.append({
+                        'role': 'user',
+                        'content': f"I've uploaded an image: {uploaded_file.name}",
+                        'timestamp': datetime.now().isoformat()
+                    })
+                    start_job('image', 'image', key, analyze_image, image_bytes, uploaded_file.type)
                 
-                # Get AI response for the image
-                try:
-                    with st.spinner(""):
-                        st.markdown("""
-                        <div class="loading-dots">
-                            <span></span>
-                            <span></span>
-                            <span></span>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Create a temporary file to save the image
-                        temp_file = f"temp_{uploaded_file.name}"
-                        with open(temp_file, "wb") as f:
-                            f.write(uploaded_file.getvalue())
-                        
-                        # Generate response for the image
-                        response = model.generate_content([
-                            "yo, check out this pic and tell me what you see in a chill way, like you're talking to a friend. use gen z slang and keep it casual",
-                            temp_file
-                        ])
-                        
-                        # Clean up the temporary file
-                        os.remove(temp_file)
-                        
-                        ai_response = response.text
-                        
-                        # Create a container for the typing animation
-                        response_container = st.empty()
-                        
-                        # Type out the response
-                        type_text(ai_response, response_container)
-                        
+                # Stream the response for the image (resumed after a rerun)
+                job = current_job('image')
+                if job is not None:
+                    follow_job(job, st.empty())
+                    finish_job('image')
+                    if job.status == 'failed':
+                        st.error(f"Error processing image: {str(job.error)}")
+                    else:
                         st.session_state.chat_history.append({
                             'role': 'assistant',
-                            'content': ai_response,
+                            'content': job.result,
                             'timestamp': datetime.now().isoformat()
                         })
                         
                         # Save chat
-                        chats = load_data(CHATS_FILE)
-                        if not st.session_state.current_chat:
-                            st.session_state.current_chat = str(uuid.uuid4())
-                            chats[st.session_state.current_chat] = {
-                                'user_id': st.session_state.user['id'],
-                                'title': f"Image Analysis: {uploaded_file.name}",
-                                'messages': st.session_state.chat_history,
-                                'created_at': datetime.now().isoformat(),
-                                'updated_at': datetime.now().isoformat()
-                            }
-                        else:
-                            chats[st.session_state.current_chat]['messages'] = st.session_state.chat_history
-                            chats[st.session_state.current_chat]['updated_at'] = datetime.now().isoformat()
-                        
-                        save_data(chats, CHATS_FILE)
+                        save_current_chat(f"Image Analysis: {uploaded_file.name}")
                         st.rerun()
-                        
-                except Exception as e:
-                    st.error(f"Error processing image: {str(e)}")
-            else:
-                # Handle text file upload
-                file_content = uploaded_file.getvalue().decode()
-                st.session_state.chat_history.append({
-                    'role': 'user',
-                    'content': f"I've uploaded a file: {uploaded_file.name}\n\nContent:\n{file_content}",
-                    'timestamp': datetime.now().isoformat()
-                })
+            elif st.session_state.get('chat_upload_key') != (uploaded_file.name, uploaded_file.size):
+                # Handle document upload: the text is chunked to disk and only the
+                # chunks relevant to each question are sent with the prompt
+                st.session_state.chat_upload_key = (uploaded_file.name, uploaded_file.size)
+                try:
+                    document = ingest(uploaded_file, uploaded_file.name, UPLOADS_DIR)
+                    st.session_state.chat_history.append({
+                        'role': 'user',
+                        'content': f"I've uploaded a file: {uploaded_file.name} ({document['chunks']} chunks, ~{document['tokens']} tokens)",
+                        'timestamp': datetime.now().isoformat(),
+                        'attachment': document
+                    })
+                except IngestError as e:
+                    st.error(f"Error reading file: {str(e)}")
         
         # Web search
         with st.expander("Search the Web", expanded=False):
@@ -952,19 +590,22 @@ def show_chat_ui():
                 if search_query:
                     # Show loading state
                     with st.spinner("Searching..."):
-                        results = search_web(search_query)
-                        
-                        if results and not any('error' in r for r in results):
-                            st.markdown("### Search Results")
-                            for result in results:
-                                st.markdown(f"""
-                                <div class="search-result">
-                                    <h4><a href="{result['url']}" target="_blank">{result['title']}</a></h4>
-                                    <p>{result['snippet']}</p>
-                                </div>
-                                """, unsafe_allow_html=True)
-                        else:
-                            st.error("No results found or an error occurred.")
+                        # Kept in session state so reruns show them without searching again
+                        st.session_state.search_results = (search_query, search_web(search_query))
+            
+            if st.session_state.get('search_results'):
+                _, results = st.session_state.search_results
+                if results and not any('error' in r for r in results):
+                    st.markdown("### Search Results")
+                    for result in results:
+                        st.markdown(f"""
+                        <div class="search-result">
+                            <h4><a href="{result['url']}" target="_blank">{result['title']}</a></h4>
+                            <p>{result['snippet']}</p>
+                        </div>
+                        """, unsafe_allow_html=True)
+                else:
+                    st.error("No results found or an error occurred.")
         
         # Chat input
         with st.form("chat_form", clear_on_submit=True):
@@ -981,6 +622,7 @@ def show_chat_ui():
                     'timestamp': datetime.now().isoformat()
                 })
                 
+                folded_upto = get_chat_context()['upto']
                 # Get AI response using Gemini
                 try:
                     with st.spinner(""):
@@ -992,42 +634,36 @@ def show_chat_ui():
                         </div>
                         """, unsafe_allow_html=True)
                         
-                        # Add personality prompt
-                        prompt = f"respond to this in a chill, gen z way using slang like 'bro', 'aight', 'cool', etc. keep it casual and lowercase: {user_input}"
-                        response = model.generate_content(prompt)
-                        ai_response = response.text
+                        # Add personality prompt plus a bounded window of the conversation so far
+                        context_state = get_chat_context()
+                        prompt, prompt_tokens = context_window.build_prompt(
+                            chat_instruction(st.session_state.chat_history, user_input),
+                            st.session_state.chat_history[:-1], user_input, context_state
+                        )
                         
-                        # Create a container for the typing animation
+                        # Render the reply chunk by chunk as it streams in
                         response_container = st.empty()
-                        
-                        # Type out the response
-                        type_text(ai_response, response_container)
+                        ai_response = stream_reply(stream_content(model, prompt), response_container)
                         
                 except Exception as e:
                     ai_response = f"yo bro, something went wrong: {str(e)}"
+                    prompt_tokens = None
                 
-                st.session_state.chat_history.append({
+                reply = {
                     'role': 'assistant',
                     'content': ai_response,
-                    'timestamp': datetime.now().isoformat()
-                })
+                    'timestamp': datetime.now().isoformat(),
+                    'prompt_tokens': prompt_tokens
+                }
+                # Save a new summary with the chat so reopening it doesn't start over
+                context_state = get_chat_context()
+                if context_state['upto'] != folded_upto:
+                    reply['context'] = {'upto': context_state['upto'], 'summary': context_state['summary']}
+                st.session_state.chat_history.append(reply)
                 
                 # Save chat
-                chats = load_data(CHATS_FILE)
-                if not st.session_state.current_chat:
-                    st.session_state.current_chat = str(uuid.uuid4())
-                    chats[st.session_state.current_chat] = {
-                        'user_id': st.session_state.user['id'],
-                        'title': user_input[:30] + "..." if len(user_input) > 30 else user_input,
-                        'messages': st.session_state.chat_history,
-                        'created_at': datetime.now().isoformat(),
-                        'updated_at': datetime.now().isoformat()
-                    }
-                else:
-                    chats[st.session_state.current_chat]['messages'] = st.session_state.chat_history
-                    chats[st.session_state.current_chat]['updated_at'] = datetime.now().isoformat()
-                
-                save_data(chats, CHATS_FILE)
+                save_current_chat(user_input[:30] + "..." if len(user_input) > 30 else user_input)
+                st.session_state.chat_context['chat_id'] = st.session_state.current_chat
                 st.rerun()
 
     with tab2:
@@ -1039,56 +675,113 @@ def show_chat_ui():
     with tab4:
         show_itinerary_ui()
 
+def analyze_image(job, image_bytes, mime_type):
+    """Background job: stream Gemini's take on an uploaded image into ``job``"""
+    # The upload goes to the model as an inline blob, downscaled in memory;
+    # an image already analyzed (by anyone) is answered from the cache
+    return cached_image_analysis(model, image_bytes, mime_type, IMAGE_PROMPT, response_cache, job.emit)
+
 # Add these functions after the existing functions
-def generate_flashcards(content):
-    try:
-        prompt = f"""create 5 flashcards from this content. format each as a term and definition pair.
-        make the definitions clear and concise. content: {content}"""
-        response = model.generate_content(prompt)
-        cards = []
-        for line in response.text.split('\n'):
-            line = line.strip()
-            if ':' in line:
-                term, definition = line.split(':', 1)
-                cards.append({
-                    'term': term.strip(),
-                    'definition': definition.strip(),
-                    'mastered': False,
-                    'last_reviewed': None
-                })
-        return cards
-    except Exception as e:
-        return []
+def generate_chunk_flashcards(content):
+    prompt = f"""create 5 flashcards from this content. return a json array of objects with
+        "term" and "definition"; make the definitions clear and concise. content: {content}"""
+    generate = lambda text: generate_text(model, text, "flashcards", response_cache,
+                                          generation_config=json_config(CARD_SCHEMA))
+    return generate_items(generate, prompt, parse_flashcards, 5, "flashcards",
+                          describe=lambda card: card['term'])
+
+def generate_flashcards(content=None, document=None):
+    """Flashcards for typed content or an ingested document.
+
+    Small inputs take a single prompt; larger ones are map-reduced over
+    units of chunks so the number of cards grows with the document.
+    """
+    if document is None and estimate_tokens(content) <= MAP_TOKENS:
+        return generate_chunk_flashcards(content)
+    units = document_units(document) if document is not None else text_units(content)
+    return map_reduce_cards(units, generate_chunk_flashcards)
+
+def build_flashcard_deck(job, user_id, source, title, generate):
+    """Background job: generate cards and save them as a deck; returns the deck id.
+
+    Errors (including an empty result) fail the job, so the next request
+    for the same source builds it again instead of reusing the failure.
+    """
+    cards = generate()
+    if not cards:
+        raise ValueError("no flashcards were generated")
+    return deck_store.create_deck(user_id, title, cards, source).id
+
+def open_flashcard_deck(kind, content, title, generate):
+    """Load the user's deck for this source, generating (and saving) it only once"""
+    user_id = st.session_state.user['id']
+    source = source_key(kind, content)
+    deck_id = deck_store.find_by_source(user_id, source)
+    if deck_id is None:
+        start_job('flashcards', 'flashcards', f"{user_id}:{source}",
+                  build_flashcard_deck, user_id, source, title, generate)
+        return
+    st.session_state.flashcard_deck = deck_id
+    st.session_state.show_definition = False
 
 def show_flashcards_ui():
     st.markdown("### 🎴 Flashcards")
     
     # Initialize session state
-    if 'flashcards' not in st.session_state:
-        st.session_state.flashcards = []
-    if 'current_card' not in st.session_state:
-        st.session_state.current_card = 0
+    if 'flashcard_deck' not in st.session_state:
+        st.session_state.flashcard_deck = None
     if 'show_definition' not in st.session_state:
         st.session_state.show_definition = False
+    user_id = st.session_state.user['id']
     
     # File upload
     uploaded_file = st.file_uploader("Upload content for flashcards", type=['txt', 'pdf', 'docx'])
-    if uploaded_file is not None:
-        content = uploaded_file.getvalue().decode()
-        st.session_state.flashcards = generate_flashcards(content)
-        st.session_state.current_card = 0
-        st.session_state.show_definition = False
+    if uploaded_file is not None and st.session_state.get('flashcard_upload_key') != (uploaded_file.name, uploaded_file.size):
+        st.session_state.flashcard_upload_key = (uploaded_file.name, uploaded_file.size)
+        try:
+            document = ingest(uploaded_file, uploaded_file.name, UPLOADS_DIR)
+            open_flashcard_deck("document", document['sha256'], uploaded_file.name,
+                                lambda: generate_flashcards(document=document))
+        except IngestError as e:
+            st.error(f"Error reading file: {str(e)}")
     
     # Manual content input
     content = st.text_area("Or type content for flashcards")
     if st.button("Generate Flashcards") and content:
-        st.session_state.flashcards = generate_flashcards(content)
-        st.session_state.current_card = 0
-        st.session_state.show_definition = False
+        open_flashcard_deck("text", content, content[:40], lambda: generate_flashcards(content))
+    
+    # Deck being generated (resumed after a rerun)
+    job = current_job('flashcards')
+    if job is not None:
+        with st.spinner("making your flashcards..."):
+            follow_job(job)
+        finish_job('flashcards')
+        if job.status == 'failed':
+            st.error("couldn't make any flashcards from that, bro")
+        else:
+            st.session_state.flashcard_deck = job.result
+            st.session_state.show_definition = False
+    
+    # Saved decks
+    decks = deck_store.list_decks(user_id)
+    if decks:
+        deck_ids = list(decks)
+        current_index = deck_ids.index(st.session_state.flashcard_deck) if st.session_state.flashcard_deck in decks else 0
+        selected = st.selectbox("Your decks", deck_ids, index=current_index,
+                                format_func=lambda deck_id: f"{decks[deck_id]['title']} ({decks[deck_id]['cards']} cards)")
+        if selected != st.session_state.flashcard_deck:
+            st.session_state.flashcard_deck = selected
+            st.session_state.show_definition = False
+        if st.button("🗑️ Delete deck", key="delete_deck_btn"):
+            deck_store.delete_deck(user_id, selected)
+            st.session_state.flashcard_deck = None
+            st.session_state.show_definition = False
+            st.rerun()
     
-    # Display current flashcard
-    if st.session_state.flashcards:
-        current = st.session_state.flashcards[st.session_state.current_card]
+    # Display the most-due card
+    due = deck_store.next_due(user_id, st.session_state.flashcard_deck) if st.session_state.flashcard_deck else None
+    if due:
+        deck, card_id, current = due
         
         st.markdown(f"""
         <div class="quizlet-card {'flipped' if st.session_state.show_definition else ''}">
@@ -1102,72 +795,128 @@ def show_flashcards_ui():
         """, unsafe_allow_html=True)
         
         # Controls
-        col1, col2 = st.columns(2)
-        with col1:
-            if not st.session_state.show_definition:
-                if st.button("Flip", key="flip_btn"):
-                    st.session_state.show_definition = True
-                    st.rerun()
-            else:
-                if st.button("Next", key="next_btn"):
-                    st.session_state.current_card = (st.session_state.current_card + 1) % len(st.session_state.flashcards)
-                    st.session_state.show_definition = False
-                    st.rerun()
+        if not st.session_state.show_definition:
+            if st.button("Flip", key="flip_btn"):
+                st.session_state.show_definition = True
+                st.rerun()
+        else:
+            # Grading schedules the card and moves on to the next most-due one
+            grade_cols = st.columns(len(GRADES))
+            for col, (label, quality) in zip(grade_cols, GRADES.items()):
+                with col:
+                    if st.button(label, key=f"grade_{label}"):
+                        deck_store.review(user_id, deck.id, card_id, quality)
+                        st.session_state.show_definition = False
+                        st.rerun()
         
+        if current['due'] > time.time():
+            next_review = datetime.fromtimestamp(current['due']).strftime('%b %d, %H:%M')
+            due_note = f"all caught up, next review {next_review}"
+        else:
+            due_note = "due now"
         st.markdown(f"""
         <div class="quizlet-progress">
-            Card {st.session_state.current_card + 1} of {len(st.session_state.flashcards)}
+            {deck.mastered} of {len(deck.cards)} mastered · {due_note}
         </div>
         """, unsafe_allow_html=True)
 
-def generate_quiz(category, context=None):
+def generate_quiz_questions(category, context=None, regenerate=False, count=QUIZ_LENGTH):
+    """Generate and validate ``count`` questions; raises on model errors"""
+    prompt = f"""create a quiz with {count} multiple choice questions about {category}"""
+    if context:
+        prompt += f" specifically focusing on {context}"
+    prompt += """. 
+    return a json array; each question has "question", exactly 4 "options"
+    (the option texts, without letters) and "correct" (the letter A, B, C or D
+    of the correct option).
+    
+    make the questions challenging but fair."""
+    
+    # Only the first call skips the cache on "Try Another Quiz"; repairs are
+    # new prompts anyway
+    bypass = [regenerate]
+    def generate(text):
+        response = generate_text(model, text, "quiz", response_cache, bypass=bypass[0],
+                                 generation_config=json_config(QUIZ_SCHEMA))
+        bypass[0] = False
+        return response
+    
+    return generate_items(generate, prompt, parse_questions, count, "questions",
+                          describe=lambda question: question['question'])
+
+def generate_quiz(category, context=None, regenerate=False):
     try:
-        prompt = f"""create a quiz with 5 multiple choice questions about {category}"""
-        if context:
-            prompt += f" specifically focusing on {context}"
-        prompt += """. 
-        format each question as:
-        Q: [question text]
-        A) [option A]
-        B) [option B]
-        C) [option C]
-        D) [option D]
-        Correct: [letter of correct answer]
-        
-        make the questions challenging but fair, and ensure each question has exactly 4 options."""
-        
-        response = model.generate_content(prompt)
-        questions = []
-        current_question = None
-        
-        for line in response.text.split('\n'):
-            line = line.strip()
-            if line.startswith('Q:'):
-                if current_question:
-                    questions.append(current_question)
-                current_question = {
-                    'question': line[2:].strip(),
-                    'options': [],
-                    'correct': None
-                }
-            elif line.startswith(('A)', 'B)', 'C)', 'D)')):
-                option_letter = line[0]
-                option_text = line[2:].strip()
-                current_question['options'].append({
-                    'letter': option_letter,
-                    'text': option_text
-                })
-            elif line.startswith('Correct:'):
-                current_question['correct'] = line[8:].strip()
-        
-        if current_question:
-            questions.append(current_question)
-            
-        return questions
+        return generate_quiz_questions(category, context, regenerate)
     except Exception as e:
         st.error(f"Error generating quiz: {str(e)}")
         return []
 
+# Pre-generate questions for the fixed categories in the background
+if QUIZ_BANK_ENABLED:
+    quiz_bank.start_filler(
+        lambda category: generate_quiz_questions(category, regenerate=True, count=QUIZ_BANK_BATCH),
+        QUIZ_CATEGORIES
+    )
+
+# Client-side quiz countdown. It runs in the browser (components.html executes
+# scripts, st.markdown does not), so an idle quiz costs the server nothing;
+# the deadline itself is enforced on the server when the user answers.
+def quiz_timer_html(start_time, duration):
+    return f"""
+    <style>
+    .timer-container {{
+        background: rgba(30, 42, 69, 0.8);
+        padding: 10px 20px;
+        border-radius: 10px;
+        border: 1px solid #2D3B58;
+        box-shadow: 0 4px 20px rgba(59, 130, 246, 0.2);
+        font-family: sans-serif;
+    }}
+    .timer-text {{
+        font-size: 24px;
+        color: white;
+        text-align: center;
+        margin: 0;
+    }}
+    </style>
+    <div class="timer-container">
+        <p class="timer-text">⏱️ <span id="quiz-timer" data-start-time="{int(start_time)}" data-duration="{duration}"></span></p>
+    </div>
+    <script>
+    // Timer update function
+    function updateTimer() {{
+        const timerElement = document.getElementById('quiz-timer');
+        if (timerElement) {{
+            const startTime = parseInt(timerElement.getAttribute('data-start-time'));
+            const duration = parseInt(timerElement.getAttribute('data-duration'));
+            const now = Math.floor(Date.now() / 1000);
+            const elapsed = now - startTime;
+            const remaining = Math.max(0, duration * 60 - elapsed);
+            
+            const minutes = Math.floor(remaining / 60);
+            const seconds = remaining % 60;
+            
+            timerElement.textContent = `${{minutes.toString().padStart(2, '0')}}:${{seconds.toString().padStart(2, '0')}}`;
+            
+            if (remaining > 0) {{
+                setTimeout(updateTimer, 1000);
+            }} else {{
+                // Time's up - the server ends the quiz on the next answer
+                timerElement.textContent = "time's up!";
+                const submitEvent = new Event('timeUp');
+                document.dispatchEvent(submitEvent);
+            }}
+        }}
+    }}
+    updateTimer();
+    </script>
+    """
+
+def quiz_time_remaining():
+    """Seconds left before the quiz deadline (server-side source of truth)"""
+    elapsed_time = time.time() - st.session_state.quiz_start_time
+    return max(0, st.session_state.quiz_duration * 60 - elapsed_time)
+
 def show_quiz_ui():
     st.markdown("### 🎯 Quiz Master")
     
@@ -1193,8 +942,10 @@ def show_quiz_ui():
 
     # Quiz setup (only show if quiz not started)
     if not st.session_state.quiz_questions:
-        categories = ["Science", "History", "Sports", "Music", "Movies", "Geography", "Technology", "Art"]
-        selected_category = st.selectbox("Choose a category", categories)
+        selected_category = st.selectbox("Choose a category", QUIZ_CATEGORIES)
+        bank_stats = quiz_bank.stats([selected_category])[selected_category]
+        st.caption(f"{bank_stats['size']} {selected_category.lower()} questions in the bank · "
+                   f"{bank_stats['hit_rate']:.0%} of quizzes served instantly")
         
         context = st.text_area(
             "Optional: Add specific context or topics",
@@ -1205,7 +956,20 @@ def show_quiz_ui():
         
         if st.button("Generate Quiz"):
             with st.spinner("Generating quiz..."):
-                st.session_state.quiz_questions = generate_quiz(selected_category, context if context else None)
+                # Fixed categories come from the question bank (no repeats per user);
+                # custom context, or an empty bank, falls back to live generation
+                questions = None
+                if not context:
+                    questions = quiz_bank.sample(st.session_state.user['id'], selected_category, QUIZ_LENGTH)
+                if questions is None:
+                    # After "Try Another Quiz" fetch fresh questions instead of the cached set
+                    questions = generate_quiz(
+                        selected_category,
+                        context if context else None,
+                        regenerate=st.session_state.get('quiz_regenerate', False)
+                    )
+                st.session_state.quiz_questions = questions
+                st.session_state.quiz_regenerate = False
                 st.session_state.user_answers = {}
                 st.session_state.quiz_submitted = False
                 st.session_state.current_question_index = 0
@@ -1218,26 +982,17 @@ def show_quiz_ui():
     elif not st.session_state.quiz_submitted:
         # --- Timer Logic ---
         if st.session_state.quiz_start_time:
-            elapsed_time = time.time() - st.session_state.quiz_start_time
-            remaining_time = max(0, st.session_state.quiz_duration * 60 - elapsed_time)
-            minutes = int(remaining_time // 60)
-            seconds = int(remaining_time % 60)
-
-            # Update timer display using the placeholder
-            timer_placeholder.markdown(f"""
-            <div class="timer-container">
-                <p class="timer-text">⏱️ {minutes:02d}:{seconds:02d}</p>
-            </div>
-            """, unsafe_allow_html=True)
-
             # Check if time's up
-            if remaining_time <= 0:
+            if quiz_time_remaining() <= 0:
                 st.session_state.quiz_submitted = True
                 st.rerun() # Rerun to show results
 
-            # Force a rerun every second to update the timer
-            time.sleep(1)
-            st.rerun()
+            # The countdown ticks in the browser; no server reruns while idle
+            with timer_placeholder:
+                components.html(
+                    quiz_timer_html(st.session_state.quiz_start_time, st.session_state.quiz_duration),
+                    height=70
+                )
         # --- End Timer Logic ---
 
         # --- Question Display ---
@@ -1312,6 +1067,7 @@ def show_quiz_ui():
         """, unsafe_allow_html=True)
         
         if st.button("Try Another Quiz"):
+            st.session_state.quiz_regenerate = True
             # Reset all quiz state variables
             st.session_state.quiz_questions = []
             st.session_state.user_answers = {}
@@ -1323,6 +1079,11 @@ def show_quiz_ui():
             st.rerun()
 
 def handle_answer(answer, animation_placeholder):
+    # Answers after the deadline don't count; end the quiz instead
+    if st.session_state.quiz_start_time and quiz_time_remaining() <= 0:
+        st.session_state.quiz_submitted = True
+        st.rerun()
+
     st.session_state.user_answers[st.session_state.current_question_index] = answer
     st.session_state.show_correct = True
 
@@ -1741,13 +1502,8 @@ def show_itinerary_ui():
             st.session_state.temperature_unit = "Fahrenheit"
         else:
             st.session_state.temperature_unit = "Celsius"
-        
-        # Convert existing weather data
-        if st.session_state.weather_data:
-            st.session_state.weather_data = convert_weather_units(
-                st.session_state.weather_data, 
-                st.session_state.temperature_unit
-            )
+        # Weather is stored as raw records and formatted on display, so
+        # nothing needs converting here
     
     # Temperature unit selector in sidebar
     with st.sidebar:
@@ -1760,14 +1516,12 @@ def show_itinerary_ui():
             if st.button("°C", type="primary" if celsius_active else "secondary", key="celsius_btn"):
                 if not celsius_active:
                     st.session_state.temperature_unit = "Celsius"
-                    toggle_temperature_unit()
                     st.rerun()
         with temp_col3:
             fahrenheit_active = st.session_state.temperature_unit == "Fahrenheit"
             if st.button("°F", type="primary" if fahrenheit_active else "secondary", key="fahrenheit_btn"):
                 if not fahrenheit_active:
                     st.session_state.temperature_unit = "Fahrenheit"
-                    toggle_temperature_unit()
                     st.rerun()
 
     # Rest of your itinerary UI code would go here
@@ -1968,67 +1722,42 @@ def show_itinerary_ui():
                     Format the output as a structured itinerary with days and locations clearly marked.
                     """
                     
-                    response = model.generate_content(prompt)
-                    
-                    # Parse Gemini's response - this is a simplified example
-                    itinerary_text = response.text
-                    
-                    # Populate itinerary data
-                    st.session_state.itinerary_data = {
+                    # The whole build runs as a background job, so a rerun while it
+                    # works neither cancels it nor starts a second one
+                    # "Regenerate Itinerary" skips the cached plan for the same trip
+                    trip = {
                         "trip_type": st.session_state.trip_type,
                         "destinations": destinations,
-                        "departure_date": departure_date.strftime('%Y-%m-%d'),
-                        "return_date": return_date.strftime('%Y-%m-%d') if st.session_state.trip_type == "Round Trip" else None,
-                        "content": itinerary_text,
+                        "departure_date": departure_date,
+                        "return_date": return_date,
                         "adults": adults,
                         "children": children,
                         "children_ages": st.session_state.children_ages if st.session_state.children > 0 else [],
                         "budget_level": budget_level,
                         "budget_total": budget_total,
-                        "interests": interests,
-                        "created_at": datetime.now().isoformat()
+                        "interests": interests
                     }
-                    
-                    # Generate weather data for each destination
-                    weather_data = {}
-                    for dest in destinations:
-                        weather_data[dest] = fetch_weather_data(dest)
-                    
-                    st.session_state.weather_data = weather_data
-                    
-                    # Generate hotel options for each destination
-                    hotel_options = {}
-                    for dest in destinations:
-                        hotel_options[dest] = generate_hotel_options(dest, budget_level, adults + children)
-                    
-                    st.session_state.hotel_options = hotel_options
-                    
-                    # Generate flight options based on the itinerary
-                    travel_sequence = destinations.copy()
-                    
-                    st.session_state.flight_options = generate_flight_options(
-                        travel_sequence, 
-                        departure_date, 
-                        return_date, 
-                        st.session_state.trip_type, 
-                        adults, 
-                        children,
-                        budget_total
-                    )
-                    
-                    # Generate some reviews for places in the itinerary
-                    place_reviews = {}
-                    # Extract popular attractions from the itinerary using regex or other methods
-                    # For simplicity, here we're just generating reviews for major attractions in destinations
-                    for dest in destinations:
-                        attractions = [f"{dest} Museum", f"{dest} Gardens", f"{dest} Tower", f"{dest} Market"]
-                        for attraction in attractions:
-                            place_reviews[attraction] = generate_dummy_reviews(attraction)
-                    
-                    st.session_state.place_reviews = place_reviews
-                    
-                    # Redirect to the first day tab
-                    st.rerun()
+                    bypass = st.session_state.get('itinerary_regenerate', False)
+                    key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+                    if bypass:
+                        key += f":{uuid.uuid4()}"
+                    start_job('itinerary', 'itinerary', key, build_itinerary, trip, prompt, bypass)
+                    st.session_state.itinerary_regenerate = False
+            
+            # Itinerary being built (resumed after a rerun)
+            job = current_job('itinerary')
+            if job is not None:
+                with st.spinner("Creating your perfect itinerary..."):
+                    follow_job(job)
+                finish_job('itinerary')
+                if job.status == 'failed':
+                    st.error(f"Error generating itinerary: {str(job.error)}")
+                    return
+                for name, value in job.result.items():
+                    st.session_state[name] = value
+                
+                # Redirect to the first day tab
+                st.rerun()
         
         with col2:
             # Map visualization
@@ -2138,8 +1867,9 @@ def show_itinerary_ui():
                 weather_box = st.container(border=True)
                 with weather_box:
                     # Create columns for each destination's weather
-                    cols = st.columns(min(len(st.session_state.weather_data), 3))
-                    for i, (dest, weather) in enumerate(st.session_state.weather_data.items()):
+                    weather_display = convert_weather_units(st.session_state.weather_data, st.session_state.temperature_unit)
+                    cols = st.columns(min(len(weather_display), 3))
+                    for i, (dest, weather) in enumerate(weather_display.items()):
                         col_index = i % len(cols)
                         with cols[col_index]:
                             st.info(f"Weather in {dest}: {weather}")
@@ -2175,7 +1905,7 @@ def show_itinerary_ui():
                         if st.session_state.current_itinerary_destinations and dest_index < len(st.session_state.current_itinerary_destinations):
                             dest = st.session_state.current_itinerary_destinations[dest_index]
                             if dest in st.session_state.weather_data:
-                                weather = st.session_state.weather_data[dest]
+                                weather = format_weather(st.session_state.weather_data[dest], st.session_state.temperature_unit)
                                 w_col1, w_col2 = st.columns([4, 1])
                                 with w_col1:
                                     st.info(f"🌦️ Weather in {dest}: {weather}")
@@ -2272,6 +2002,7 @@ def show_itinerary_ui():
             
             with action_col3:
                 if st.button("Regenerate Itinerary"):
+                    st.session_state.itinerary_regenerate = True
                     st.session_state.itinerary_data = None
                     st.session_state.weather_data = None
                     st.session_state.hotel_options = {}
@@ -2280,6 +2011,62 @@ def show_itinerary_ui():
                     st.session_state.selected_flights = []
                     st.rerun()
 
+def build_itinerary(job, trip, prompt, bypass=False):
+    """Background job: the itinerary plus weather, hotels, reviews and flights for ``trip``.
+
+    Returns the session state values to set once it finishes.
+    """
+    destinations = trip["destinations"]
+    
+    # Start the Gemini call first so the per-destination lookups below overlap with it
+    itinerary_future = submit(generate_text, model, prompt, "itinerary", response_cache, bypass=bypass)
+    
+    # Weather, hotels and reviews for every destination run
+    # concurrently; anything that fails or times out falls back
+    tasks = {}
+    for dest in destinations:
+        tasks[('weather', dest)] = (fetch_weather_data, (dest,), generate_dummy_weather())
+        tasks[('hotels', dest)] = (generate_hotel_options, (dest, trip["budget_level"], trip["adults"] + trip["children"]), [])
+        # Extract popular attractions from the itinerary using regex or other methods
+        # For simplicity, here we're just generating reviews for major attractions in destinations
+        for attraction in [f"{dest} Museum", f"{dest} Gardens", f"{dest} Tower", f"{dest} Market"]:
+            tasks[('reviews', attraction)] = (generate_dummy_reviews, (attraction,), [])
+    results = fan_out(tasks, timeout=FANOUT_TIMEOUT)
+    
+    # Generate flight options based on the itinerary
+    flight_options = generate_flight_options(
+        destinations.copy(),
+        trip["departure_date"],
+        trip["return_date"],
+        trip["trip_type"],
+        trip["adults"],
+        trip["children"],
+        trip["budget_total"]
+    )
+    
+    itinerary_text = itinerary_future.result(timeout=ITINERARY_TIMEOUT)
+    
+    return {
+        "weather_data": {key[1]: value for key, value in results.items() if key[0] == 'weather'},
+        "hotel_options": {key[1]: value for key, value in results.items() if key[0] == 'hotels'},
+        "place_reviews": {key[1]: value for key, value in results.items() if key[0] == 'reviews'},
+        "flight_options": flight_options,
+        "itinerary_data": {
+            "trip_type": trip["trip_type"],
+            "destinations": destinations,
+            "departure_date": trip["departure_date"].strftime('%Y-%m-%d'),
+            "return_date": trip["return_date"].strftime('%Y-%m-%d') if trip["trip_type"] == "Round Trip" else None,
+            "content": itinerary_text,
+            "adults": trip["adults"],
+            "children": trip["children"],
+            "children_ages": trip["children_ages"],
+            "budget_level": trip["budget_level"],
+            "budget_total": trip["budget_total"],
+            "interests": trip["interests"],
+            "created_at": datetime.now().isoformat()
+        }
+    }
+
 def extract_locations(day_content):
     """Extract location names from itinerary text"""
     # Extract text between quotes as potential locations
@@ -2298,86 +2085,16 @@ def extract_locations(day_content):
     return list(set(locations))
 
 def convert_weather_units(weather_data, unit):
-    """Convert weather data between Celsius and Fahrenheit"""
-    converted_weather = {}
-    
-    for location, weather in weather_data.items():
-        if '°C' in weather and unit == "Fahrenheit":
-            # Extract the temperature value
-            temp_parts = weather.split(', ')
-            conditions = temp_parts[0]
-            temp_str = temp_parts[-1]
-            temp_value = float(temp_str.replace('°C', ''))
-            # Convert Celsius to Fahrenheit: (C × 9/5) + 32
-            fahrenheit_temp = (temp_value * 9/5) + 32
-            # Format with 1 decimal place
-            converted_weather[location] = f"{conditions}, {fahrenheit_temp:.1f}°F"
-        elif '°F' in weather and unit == "Celsius":
-            # Extract the temperature value
-            temp_parts = weather.split(', ')
-            conditions = temp_parts[0]
-            temp_str = temp_parts[-1]
-            temp_value = float(temp_str.replace('°F', ''))
-            # Convert Fahrenheit to Celsius: (F - 32) × 5/9
-            celsius_temp = (temp_value - 32) * 5/9
-            # Format with 1 decimal place
-            converted_weather[location] = f"{conditions}, {celsius_temp:.1f}°C"
-        else:
-            # Keep as is if no conversion needed or if format is not recognized
-            converted_weather[location] = weather
-    
-    return converted_weather
+    """Format stored weather records for display in the given unit"""
+    return {location: format_weather(weather, unit) for location, weather in weather_data.items()}
 
 def fetch_weather_data(location):
-    """Fetch weather data for a location using OpenWeatherMap API (with fallback to dummy data)"""
-    try:
-        # Attempt to use a real weather API
-        api_key = os.getenv("OPENWEATHER_API_KEY", "")
-        
-        if not api_key:
-            # Fallback to dummy data if API key not available
-            return generate_dummy_weather()
-            
-        base_url = "https://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "q": location,
-            "appid": api_key,
-            "units": "metric"  # for temperature in Celsius
-        }
-        
-        response = requests.get(base_url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            temp = data["main"]["temp"]
-            condition = data["weather"][0]["main"]
-            description = data["weather"][0]["description"]
-            
-            # Format based on user's preferred temperature unit
-            if 'temperature_unit' in st.session_state and st.session_state.temperature_unit == "Fahrenheit":
-                # Convert Celsius to Fahrenheit
-                temp_f = (temp * 9/5) + 32
-                return f"{condition} ({description}), {temp_f:.1f}°F"
-            else:
-                return f"{condition} ({description}), {temp:.1f}°C"
-        else:
-            # Fallback to dummy data if API call fails
-            return generate_dummy_weather()
-    except Exception as e:
-        # Fallback to dummy data if any error occurs
-        return generate_dummy_weather()
+    """Weather record for a location (OpenWeatherMap through the shared cache, with fallback to dummy data)"""
+    return get_weather(location)
 
 def generate_dummy_weather():
     """Generate dummy weather data for fallback"""
-    conditions = ["Sunny", "Partly Cloudy", "Rainy", "Clear", "Overcast", "Thunderstorms", "Snowy", "Foggy"]
-    condition = random.choice(conditions)
-    
-    # Generate temperature based on user's preferred unit
-    if 'temperature_unit' in st.session_state and st.session_state.temperature_unit == "Fahrenheit":
-        temp = random.randint(59, 86)  # 15-30°C in Fahrenheit
-        return f"{condition}, {temp}°F"
-    else:
-        temp = random.randint(15, 30)
-        return f"{condition}, {temp}°C"
+    return dummy_weather()
 
 def generate_dummy_reviews(place):
     """Generate dummy reviews for a place"""
@@ -2716,6 +2433,7 @@ def main():
     else:
         show_sidebar()
         show_chat_ui()
+    metrics.maybe_write_textfile()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,567 @@
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import metrics
+
+# Chat metadata fields kept alongside the message log
+CHAT_META_FIELDS = ('user_id', 'title', 'created_at', 'updated_at')
+
+# Parsed chat segments kept in memory (most recently used chats)
+CHAT_CACHE_SIZE = int(os.getenv("SIGMABOT_CHAT_CACHE_SIZE", "256"))
+
+
+class FrozenDict(dict):
+    """Read-only dict handed out for cached data shared between sessions"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("cached data is read-only; use thaw() for a mutable copy")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def freeze(value):
+    """Return an immutable view of parsed JSON (dicts and lists become read-only)"""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Return a mutable deep copy of a frozen value"""
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+def file_signature(path):
+    """Cheap change detector: (inode, mtime in ns, size)"""
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class FileCache:
+    """Process-wide cache of parsed files, revalidated with a single os.stat.
+
+    Entries are stored frozen so every session can share them without
+    copying; a changed inode, mtime or size triggers a re-parse. At most
+    ``maxsize`` files are kept, least recently used first out.
+    """
+
+    def __init__(self, name, loader, maxsize=1024):
+        self.name = name
+        self.loader = loader
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> (signature, frozen value)
+
+    def _store(self, path, entry):
+        # The caller holds the lock
+        self._entries[path] = entry
+        self._entries.move_to_end(path)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            metrics.incr("file_cache_evictions_total", cache=self.name)
+
+    def get(self, path):
+        """Return the frozen parsed contents of ``path`` (raises if missing)"""
+        signature = file_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+        if entry is not None and entry[0] == signature:
+            metrics.incr("file_cache_hits_total", cache=self.name)
+            return entry[1]
+        metrics.incr("file_cache_misses_total", cache=self.name)
+        value = freeze(self.loader(path))
+        with self._lock:
+            self._store(path, (signature, value))
+        return value
+
+    def put(self, path, value):
+        """Prime the cache right after writing ``value`` to ``path``"""
+        signature = file_signature(path)
+        with self._lock:
+            self._store(path, (signature, freeze(value)))
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': metrics.get("file_cache_hits_total", cache=self.name),
+            'misses': metrics.get("file_cache_misses_total", cache=self.name),
+            'evictions': metrics.get("file_cache_evictions_total", cache=self.name),
+        }
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive advisory lock on ``<path>.lock``.
+
+    The lock is taken on a separate lock file so it survives the target
+    being replaced with os.replace, and it serializes writers across both
+    threads and processes.
+
+    Deleting a chat or deck removes its lock file while holding it. A
+    writer that was waiting on the removed file would otherwise hold a lock
+    nobody else can see, so after acquiring it we check that the file is
+    still the one at ``<path>.lock`` and start over if it isn't.
+    """
+    lock_path = f"{path}.lock"
+    while True:
+        with open(lock_path, 'a+b') as f:
+            _lock_file(f)
+            try:
+                try:
+                    current = os.fstat(f.fileno()).st_ino == os.stat(lock_path).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    yield
+                    return
+            finally:
+                _unlock_file(f)
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write(path, text):
+    """Write ``text`` to a temp file in the same directory and swap it in.
+
+    Readers see either the old or the new contents, never a truncated file.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def merge_changes(current, base, data):
+    """Three-way merge of top-level keys.
+
+    Keys the caller added or changed relative to ``base`` are applied to
+    ``current`` and keys the caller removed are dropped; everything else
+    keeps whatever other writers stored in the meantime.
+    """
+    merged = dict(current)
+    for key, value in data.items():
+        if key not in base or base[key] != value:
+            merged[key] = value
+    for key in base:
+        if key not in data:
+            merged.pop(key, None)
+    return merged
+
+
+def _load_json_dict(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data if isinstance(data, dict) else {}
+
+
+json_cache = FileCache("json", _load_json_dict)
+
+
+def _read_current(path):
+    try:
+        return thaw(json_cache.get(path))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json(path, data, base=None):
+    """Atomically write ``data`` to ``path`` under the file lock.
+
+    With ``base`` (the dict the caller originally loaded) the write runs in
+    merge mode: only the caller's own changes are applied on top of the
+    latest contents, so concurrent sessions don't clobber each other.
+    Returns what was written.
+    """
+    with file_lock(path):
+        if base is not None:
+            data = merge_changes(_read_current(path), base, data)
+        atomic_write(path, json.dumps(data, indent=2))
+        json_cache.put(path, data)
+    metrics.incr("json_writes_total")
+    return data
+
+
+def update_json(path, fn, after=None):
+    """Run a read-modify-write transaction on a JSON file.
+
+    ``fn`` receives a mutable copy of the latest contents while the file
+    lock is held and modifies it in place; its return value is passed back
+    to the caller. Return False from ``fn`` to skip the write. ``after(data)``
+    runs once the new contents are in place, still under the lock, for
+    derived files that must stay in step with this one.
+    """
+    with file_lock(path):
+        data = _read_current(path)
+        result = fn(data)
+        if result is not False:
+            atomic_write(path, json.dumps(data, indent=2))
+            json_cache.put(path, data)
+            metrics.incr("json_writes_total")
+            if after is not None:
+                after(data)
+    return result
+
+
+class ChatStore:
+    """Append-only storage that keeps every chat in its own segment file.
+
+    Each user also has a small manifest (``_manifests/<user_id>.json``)
+    with one summary per chat, kept in sync on every save, so listing a
+    user's chats never touches message bodies.
+
+    A segment is a JSON-lines file named after the chat id. Each line is
+    either a metadata record (``{"t": "meta", ...}``) or a single message
+    (``{"t": "msg", "m": {...}}``), so saving a turn appends one short line
+    instead of re-serializing every user's conversations. Metadata records
+    accumulate on every save; once a segment has more than
+    ``compact_threshold`` of them it is rewritten in compacted form.
+    """
+
+    def __init__(self, root, compact_threshold=64):
+        self.root = root
+        self.manifest_dir = os.path.join(root, "_manifests")
+        self.compact_threshold = compact_threshold
+        self._cache = FileCache("chat_segments", self._parse_segment, maxsize=CHAT_CACHE_SIZE)
+        # Whole-store operations (rebuild, migrate, save_all) only; saving a
+        # chat takes just that chat's file lock, then its owner's manifest lock
+        self._lock = threading.RLock()
+        # chat_id -> (message count, metadata, metadata record count, file signature)
+        self._state = {}
+        os.makedirs(root, exist_ok=True)
+        if not os.path.isdir(self.manifest_dir):
+            self.rebuild_manifests()
+
+    def _path(self, chat_id):
+        if not chat_id or os.sep in chat_id or chat_id.startswith('.'):
+            raise ValueError(f"Invalid chat id: {chat_id!r}")
+        return os.path.join(self.root, f"{chat_id}.jsonl")
+
+    def _read_segment(self, chat_id):
+        """Replay a segment into frozen (metadata, messages, metadata record count)"""
+        return self._cache.get(self._path(chat_id))
+
+    @staticmethod
+    def _parse_segment(path):
+        meta = {}
+        messages = []
+        meta_records = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from an interrupted append
+                    continue
+                if record.get('t') == 'msg':
+                    messages.append(record['m'])
+                elif record.get('t') == 'meta':
+                    meta.update({k: v for k, v in record.items() if k != 't'})
+                    meta_records += 1
+        return meta, messages, meta_records
+
+    def _write_segment(self, chat_id, meta, messages):
+        """Rewrite a segment in compacted form (one metadata record)"""
+        path = self._path(chat_id)
+        lines = [json.dumps({'t': 'meta', **meta})]
+        lines.extend(json.dumps({'t': 'msg', 'm': message}) for message in messages)
+        atomic_write(path, '\n'.join(lines) + '\n')
+        self._state[chat_id] = (len(messages), dict(meta), 1, file_signature(path))
+        self._sync_manifest(chat_id)
+
+    def _known_state(self, chat_id):
+        """Return (count, metadata, metadata records) for the segment on disk.
+
+        The bookkeeping from our last write is reused only while the file
+        signature still matches, so appends from other processes are seen.
+        """
+        signature = file_signature(self._path(chat_id))
+        state = self._state.get(chat_id)
+        if state is None or state[3] != signature:
+            meta, messages, meta_records = self._read_segment(chat_id)
+            state = (len(messages), dict(meta), meta_records, signature)
+            self._state[chat_id] = state
+        return state[:3]
+
+    def exists(self, chat_id):
+        return os.path.exists(self._path(chat_id))
+
+    def chat_ids(self):
+        return [name[:-len('.jsonl')] for name in os.listdir(self.root) if name.endswith('.jsonl')]
+
+    def load_chat(self, chat_id, readonly=False):
+        """Return the chat as a dict with its messages, or None if missing.
+
+        With ``readonly`` the shared cached view is returned as-is; otherwise
+        the caller gets its own mutable copy.
+        """
+        try:
+            meta, messages, _ = self._read_segment(chat_id)
+        except FileNotFoundError:
+            return None
+        if readonly:
+            return FrozenDict(meta, messages=messages)
+        return {**thaw(meta), 'messages': thaw(messages)}
+
+    def save_chat(self, chat_id, chat, base_count=None):
+        """Persist a chat, appending only what changed since the last save.
+
+        ``chat`` may be a full chat dict or a partial one holding just
+        ``messages`` and the metadata fields that changed.
+
+        ``base_count`` is how many of ``messages`` the caller already saved
+        (merge mode): everything after it is appended to whatever is on
+        disk, so two sessions writing the same chat both keep their turns.
+        If the chat is gone although some messages were already saved, it
+        was deleted in the meantime and the save is dropped. Without it, messages beyond the stored count are appended and a
+        shorter history than what is on disk replaces the segment.
+        """
+        messages = chat.get('messages', [])
+        meta = {k: chat[k] for k in CHAT_META_FIELDS if k in chat}
+        path = self._path(chat_id)
+        with file_lock(path):
+            if not self.exists(chat_id):
+                # Messages were saved before, so the chat was deleted since; keep it deleted
+                if base_count:
+                    return
+                self._write_segment(chat_id, meta, messages)
+                return
+            if base_count is not None:
+                self._append(chat_id, meta, messages[base_count:])
+                return
+            count, stored_meta, _ = self._known_state(chat_id)
+            if len(messages) < count:
+                self._write_segment(chat_id, {**stored_meta, **meta}, messages)
+                return
+            self._append(chat_id, meta, messages[count:])
+
+    def append_message(self, chat_id, message, **meta):
+        """Append a single message (and optional metadata changes) to a chat"""
+        with file_lock(self._path(chat_id)):
+            if not self.exists(chat_id):
+                self._write_segment(chat_id, meta, [message])
+            else:
+                self._append(chat_id, meta, [message])
+
+    def _append(self, chat_id, meta, new_messages):
+        """Append records to an existing segment; the caller holds the locks"""
+        count, stored_meta, meta_records = self._known_state(chat_id)
+        changed = {k: v for k, v in meta.items() if stored_meta.get(k) != v}
+        lines = []
+        if changed:
+            lines.append(json.dumps({'t': 'meta', **changed}))
+            meta_records += 1
+        for message in new_messages:
+            lines.append(json.dumps({'t': 'msg', 'm': message}))
+        if not lines:
+            return
+
+        path = self._path(chat_id)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._state[chat_id] = (count + len(new_messages), {**stored_meta, **changed},
+                                meta_records, file_signature(path))
+
+        if meta_records > self.compact_threshold:
+            meta, messages, _ = self._read_segment(chat_id)
+            self._write_segment(chat_id, meta, messages)
+        else:
+            self._sync_manifest(chat_id)
+
+    def _manifest_path(self, user_id):
+        if not user_id or os.sep in user_id or user_id.startswith('.'):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.manifest_dir, f"{user_id}.json")
+
+    def _update_manifest(self, user_id, chat_id, summary):
+        """Set (or with ``summary=None`` remove) one chat in a user's manifest"""
+        def apply(manifest):
+            if summary is None:
+                if chat_id not in manifest:
+                    return False
+                del manifest[chat_id]
+            else:
+                if manifest.get(chat_id) == summary:
+                    return False
+                manifest[chat_id] = summary
+
+        update_json(self._manifest_path(user_id), apply)
+
+    def _sync_manifest(self, chat_id):
+        """Copy a chat's summary from our bookkeeping into its owner's manifest"""
+        count, meta = self._state[chat_id][:2]
+        if meta.get('user_id'):
+            self._update_manifest(meta['user_id'], chat_id, {
+                'title': meta.get('title'),
+                'created_at': meta.get('created_at'),
+                'updated_at': meta.get('updated_at'),
+                'message_count': count
+            })
+
+    def rebuild_manifests(self):
+        """Regenerate every user's manifest from the segments"""
+        with self._lock:
+            summaries = {}
+            for chat_id in self.chat_ids():
+                # Parsed directly: a rebuild touches every chat and shouldn't
+                # flush the cache of the ones actually in use
+                meta, messages, _ = self._parse_segment(self._path(chat_id))
+                if meta.get('user_id'):
+                    summaries.setdefault(meta['user_id'], {})[chat_id] = {
+                        'title': meta.get('title'),
+                        'created_at': meta.get('created_at'),
+                        'updated_at': meta.get('updated_at'),
+                        'message_count': len(messages)
+                    }
+            os.makedirs(self.manifest_dir, exist_ok=True)
+            for user_id, manifest in summaries.items():
+                save_json(self._manifest_path(user_id), manifest)
+
+    def list_user_chats(self, user_id, offset=0, limit=None):
+        """Return a page of the user's chat summaries, most recent first.
+
+        Only the user's manifest is read, so this doesn't depend on how many
+        chats other users have or on the size of any message history.
+        """
+        try:
+            manifest = json_cache.get(self._manifest_path(user_id))
+        except (OSError, ValueError):
+            return []
+        chats = sorted(({'id': chat_id, **summary} for chat_id, summary in manifest.items()),
+                       key=lambda chat: chat.get('updated_at') or '', reverse=True)
+        end = None if limit is None else offset + limit
+        return chats[offset:end]
+
+    def count_user_chats(self, user_id):
+        try:
+            return len(json_cache.get(self._manifest_path(user_id)))
+        except (OSError, ValueError):
+            return 0
+
+    def delete_chat(self, chat_id):
+        path = self._path(chat_id)
+        with file_lock(path):
+            if os.path.exists(path):
+                user_id = self._read_segment(chat_id)[0].get('user_id')
+                if user_id:
+                    self._update_manifest(user_id, chat_id, None)
+            self._state.pop(chat_id, None)
+            self._cache.invalidate(path)
+            # The lock file goes too, or every deleted chat leaves one behind;
+            # file_lock notices and retries in writers that were waiting on it
+            for leftover in (path, f"{path}.lock"):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+
+    def load_all(self, readonly=False):
+        """Return every chat keyed by id, in the shape of the old chats.json.
+
+        Segments are parsed directly rather than through the cache, so a
+        full dump doesn't evict the chats sessions are working with.
+        """
+        chats = {}
+        for chat_id in self.chat_ids():
+            try:
+                meta, messages, _ = self._parse_segment(self._path(chat_id))
+            except FileNotFoundError:
+                continue
+            chat = {**meta, 'messages': messages}
+            chats[chat_id] = freeze(chat) if readonly else chat
+        return chats
+
+    def save_all(self, chats):
+        """Make the store match ``chats``, appending only new messages"""
+        with self._lock:
+            for chat_id in self.chat_ids():
+                if chat_id not in chats:
+                    self.delete_chat(chat_id)
+            for chat_id, chat in chats.items():
+                self.save_chat(chat_id, chat)
+
+    def migrate(self, json_path):
+        """Import a monolithic chats.json into per-chat segments.
+
+        The original file is renamed to ``<name>.migrated`` afterwards so the
+        import runs only once and the old data stays around as a backup.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        with file_lock(json_path):
+            if not os.path.exists(json_path):
+                return 0
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    chats = json.load(f)
+            except ValueError:
+                chats = {}
+            if not isinstance(chats, dict):
+                chats = {}
+            for chat_id, chat in chats.items():
+                self._write_segment(chat_id, {k: chat[k] for k in CHAT_META_FIELDS if k in chat},
+                                    chat.get('messages', []))
+            os.replace(json_path, f"{json_path}.migrated")
+            return len(chats)
+
+
+# Stores are process-wide so their bookkeeping survives Streamlit reruns
+_chat_stores = {}
+_chat_stores_lock = threading.Lock()
+
+
+def get_chat_store(root):
+    with _chat_stores_lock:
+        store = _chat_stores.get(root)
+        if store is None:
+            store = _chat_stores[root] = ChatStore(root)
+        return store
@@ -0,0 +1,199 @@
+import json
+import re
+
+import metrics
+from flashcards import parse_cards
+
+LETTERS = "ABCD"
+
+# Response schemas for Gemini's JSON mode (OpenAPI subset)
+QUIZ_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "options": {"type": "array", "items": {"type": "string"}},
+            "correct": {"type": "string", "enum": list(LETTERS)},
+        },
+        "required": ["question", "options", "correct"],
+    },
+}
+
+CARD_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "term": {"type": "string"},
+            "definition": {"type": "string"},
+        },
+        "required": ["term", "definition"],
+    },
+}
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+_OPTION_PREFIX = re.compile(r"^\s*\(?([A-Da-d])[).:\]]\s+")
+_QUESTION_PREFIX = re.compile(r"^\s*(?:\d+[.)]\s*)?(?:\*\*)?\s*(?:Q(?:uestion)?\s*\d*\s*[:.])\s*(?:\*\*)?\s*", re.IGNORECASE)
+_CORRECT_PREFIX = re.compile(r"^\s*(?:\*\*)?\s*(?:correct(?: answer)?|answer)\s*[:\-]\s*(?:\*\*)?\s*", re.IGNORECASE)
+
+
+def json_config(schema):
+    """generation_config asking Gemini for JSON matching ``schema``"""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def iter_json_objects(text):
+    """Yield the JSON objects in a model response, tolerating drift.
+
+    Handles code fences, prose around the JSON, a wrapper object
+    ({"questions": [...]}) and truncated output: when the whole document
+    doesn't parse, every complete top-level object found in it is still
+    returned.
+    """
+    text = _FENCE.sub("", text.strip())
+    start = min((i for i in (text.find("["), text.find("{")) if i >= 0), default=-1)
+    if start < 0:
+        return
+    decoder = json.JSONDecoder()
+    try:
+        value, _ = decoder.raw_decode(text, start)
+    except ValueError:
+        value = None
+    if isinstance(value, dict):
+        lists = [v for v in value.values() if isinstance(v, list)]
+        if len(lists) == 1:
+            value = lists[0]
+    if isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict):
+                yield item
+        return
+
+    # Loose objects, or a broken/truncated document: pick out the complete objects
+    position = text.find("{", start)
+    while position >= 0:
+        try:
+            item, end = decoder.raw_decode(text, position)
+        except ValueError:
+            position = text.find("{", position + 1)
+            continue
+        if isinstance(item, dict):
+            yield item
+        position = text.find("{", end)
+
+
+def _clean(value):
+    return value.strip().strip("*_").strip() if isinstance(value, str) else ""
+
+
+def normalize_question(item):
+    """Validate one quiz question and convert it to the UI's format, or return None"""
+    question = _clean(item.get('question'))
+    options = item.get('options')
+    if isinstance(options, dict):
+        options = [options.get(letter) or options.get(letter.lower()) for letter in LETTERS]
+    if not question or not isinstance(options, list) or len(options) != 4:
+        return None
+    texts = []
+    for option in options:
+        if isinstance(option, dict):
+            option = option.get('text')
+        option = _OPTION_PREFIX.sub("", _clean(option))
+        if not option:
+            return None
+        texts.append(option)
+
+    correct = item.get('correct')
+    if isinstance(correct, int) and 0 <= correct < 4:
+        correct = LETTERS[correct]
+    correct = _clean(correct)
+    match = _OPTION_PREFIX.match(correct + " ") or re.match(r"^([A-Da-d])$", correct)
+    if match:
+        correct = match.group(1).upper()
+    elif correct in texts:
+        correct = LETTERS[texts.index(correct)]
+    if correct not in LETTERS:
+        return None
+    return {
+        'question': question,
+        'options': [{'letter': letter, 'text': text} for letter, text in zip(LETTERS, texts)],
+        'correct': correct
+    }
+
+
+def parse_quiz_lines(text):
+    """Parse the legacy "Q: / A) / Correct:" format without assuming line order"""
+    questions = []
+    current = None
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if _QUESTION_PREFIX.match(line):
+            current = {'question': _QUESTION_PREFIX.sub("", line), 'options': [], 'correct': None}
+            questions.append(current)
+        elif current is None:
+            # Options or answers before any question have nothing to attach to
+            continue
+        elif _CORRECT_PREFIX.match(line):
+            current['correct'] = _CORRECT_PREFIX.sub("", line)
+        elif _OPTION_PREFIX.match(line):
+            current['options'].append(line)
+    return questions
+
+
+def parse_questions(text):
+    """Valid quiz questions from a response (JSON, or the legacy line format)"""
+    items = list(iter_json_objects(text)) or parse_quiz_lines(text)
+    questions, seen = [], set()
+    for item in items:
+        question = normalize_question(item)
+        if question is not None and question['question'].casefold() not in seen:
+            seen.add(question['question'].casefold())
+            questions.append(question)
+    return questions
+
+
+def parse_flashcards(text):
+    """Valid flashcards from a response (JSON, or "term: definition" lines)"""
+    items = list(iter_json_objects(text))
+    if not items:
+        return parse_cards(text)
+    cards = []
+    for item in items:
+        term, definition = _clean(item.get('term')), _clean(item.get('definition'))
+        if term and definition:
+            cards.append({'term': term, 'definition': definition,
+                          'mastered': False, 'last_reviewed': None})
+    return cards
+
+
+def repair_prompt(prompt, kind, have, missing):
+    """Ask only for the items that are still missing"""
+    return (f"{prompt}\n\nyou already gave these {kind}, do not repeat them: "
+            f"{json.dumps(have)}\nreturn exactly {missing} more {kind} in the same json format.")
+
+
+def generate_items(generate, prompt, parse, count, kind, describe=None, max_repairs=1):
+    """Generate ``count`` valid items, re-asking only for the shortfall.
+
+    ``generate(prompt)`` returns the raw response text and ``parse(text)``
+    the valid items in it. ``describe(item)`` gives the short form listed in
+    a repair prompt so the model doesn't repeat itself.
+    """
+    describe = describe or json.dumps
+    items = parse(generate(prompt))
+    metrics.incr("structured_calls_total", kind=kind)
+    for _ in range(max_repairs):
+        if len(items) >= count:
+            break
+        metrics.incr("structured_repairs_total", kind=kind)
+        have = [describe(item) for item in items]
+        for item in parse(generate(repair_prompt(prompt, kind, have, count - len(items)))):
+            if describe(item) not in have:
+                have.append(describe(item))
+                items.append(item)
+    if len(items) < count:
+        metrics.incr("structured_short_total", kind=kind)
+    return items[:count]
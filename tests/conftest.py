@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app is a set of top-level modules; make them importable from tests
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
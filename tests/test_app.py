@@ -0,0 +1,52 @@
+import os
+import time
+
+import pytest
+
+from conftest import ROOT
+
+AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+pytest.importorskip("google.generativeai")
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # The app keeps its data under ./data; give each test its own
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SIGMABOT_MOCK_LLM", "1")
+    monkeypatch.setenv("SIGMABOT_QUIZ_BANK", "0")
+    return AppTest.from_file(os.path.join(ROOT, "sigmabot.py"), default_timeout=30)
+
+
+def test_brand_new_chat_renders(app):
+    app.session_state.user = {'id': 'u1', 'username': 'bob'}
+    app.run()
+    assert not app.exception
+    assert app.session_state.chat_window_size > 0
+
+
+def start_quiz(app, started, minutes=5):
+    app.session_state.user = {'id': 'u1', 'username': 'bob'}
+    app.session_state.quiz_questions = [
+        {'question': "2 + 2?", 'options': [{'text': str(n)} for n in range(3, 7)], 'correct': "B"}]
+    app.session_state.quiz_start_time = started
+    app.session_state.quiz_duration = minutes
+
+
+def test_running_quiz_renders_without_server_ticks(app, monkeypatch):
+    import streamlit
+    reruns = []
+    rerun = streamlit.rerun
+    monkeypatch.setattr(streamlit, "rerun", lambda: (reruns.append(1), rerun()))
+    start_quiz(app, time.time())
+    app.run(timeout=5)
+    assert not app.exception
+    assert not reruns
+    assert not app.session_state.quiz_submitted
+
+
+def test_quiz_ends_once_its_time_is_up(app):
+    start_quiz(app, time.time() - 61, minutes=1)
+    app.run()
+    assert not app.exception
+    assert app.session_state.quiz_submitted
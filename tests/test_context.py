@@ -0,0 +1,49 @@
+from context import ContextWindow, estimate_tokens, format_turn
+
+
+def make_history(turns, words=40):
+    return [{'role': 'user' if n % 2 == 0 else 'assistant', 'content': f"message {n} " + "word " * words}
+            for n in range(turns)]
+
+
+def recording_window(**kwargs):
+    calls = []
+
+    def summarize(summary, messages):
+        calls.append(messages)
+        return f"summary after {len(messages)} messages"
+    return ContextWindow(summarize, **kwargs), calls
+
+
+def test_recent_turns_fit_the_budget_and_older_ones_are_summarized():
+    window, calls = recording_window(budget=500)
+    history = make_history(40)
+    state = {}
+    summary, recent = window.window(history, state)
+    assert len(calls) == 1 and summary == state['summary']
+    assert state['upto'] + len(recent) == len(history)
+    assert sum(estimate_tokens(format_turn(message)) for message in recent) <= 500
+    # The next turn fits without another fold
+    window.window(history + make_history(1), state)
+    assert len(calls) == 1
+
+
+def test_a_long_unsummarized_history_is_folded_in_one_bounded_call():
+    window, calls = recording_window(budget=500, fold_budget=1000)
+    history = make_history(2000)
+    state = {}
+    window.window(history, state)
+    [folded] = calls
+    assert sum(estimate_tokens(format_turn(message)) for message in folded) <= 1000
+    # The folded turns are the newest ones that left the window
+    assert folded[-1] is history[state['upto'] - 1]
+
+
+def test_saved_state_resumes_without_refolding():
+    window, calls = recording_window(budget=500)
+    history = make_history(40)
+    state = {}
+    window.window(history, state)
+    resumed = {'upto': state['upto'], 'summary': state['summary']}
+    assert window.window(history, resumed) == window.window(history, state)
+    assert len(calls) == 1
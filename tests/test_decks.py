@@ -0,0 +1,85 @@
+import random
+import threading
+
+import pytest
+
+from decks import DAY, Deck, DeckStore, schedule
+
+NOW = 1_700_000_000
+
+
+def new_card(**fields):
+    return {'term': "t", 'definition': "d", 'ease': 2.5, 'interval': 0, 'reps': 0, 'due': NOW, **fields}
+
+
+def test_schedule_follows_sm2_intervals():
+    card = new_card()
+    intervals = []
+    for _ in range(4):
+        card.update(schedule(card, 4, NOW))
+        intervals.append(card['interval'])
+    # 1 day, 6 days, then interval * ease (quality 4 keeps the ease at 2.5)
+    assert intervals == [1, 6, 15, 38]
+    assert card['ease'] == 2.5 and card['reps'] == 4 and card['mastered']
+    assert card['due'] == NOW + 38 * DAY
+
+
+@pytest.mark.parametrize("quality, ease", [(5, 2.6), (4, 2.5), (3, 2.36)])
+def test_schedule_adjusts_ease_by_grade(quality, ease):
+    assert schedule(new_card(), quality, NOW)['ease'] == ease
+
+
+def test_failed_review_restarts_the_card():
+    fields = schedule(new_card(reps=3, interval=15), 1, NOW)
+    assert (fields['reps'], fields['interval'], fields['due']) == (0, 0, NOW + 60)
+    assert not fields['mastered']
+    # Ease never drops below 1.3
+    assert schedule(new_card(ease=1.3), 0, NOW)['ease'] == 1.3
+
+
+def test_next_due_matches_a_full_scan_after_reviews():
+    rng = random.Random(0)
+    deck = Deck({'id': "d1"}, [new_card(due=NOW + rng.randrange(1000)) for _ in range(50)])
+    for step in range(500):
+        card_id, card = deck.next_due()
+        assert card['due'] == min(c['due'] for c in deck.cards)
+        # Reschedule either the top card or a random one, leaving stale heap entries behind
+        target = card_id if step % 2 else rng.randrange(len(deck.cards))
+        deck.apply(target, {'due': NOW + rng.randrange(100000), 'mastered': rng.random() < 0.3})
+    # Stale entries are compacted away rather than accumulating
+    assert len(deck._heap) <= 2 * len(deck.cards) + 64
+    assert deck.mastered == sum(1 for card in deck.cards if card['mastered'])
+
+
+def test_reviews_are_persisted_and_reloaded(tmp_path):
+    store = DeckStore(str(tmp_path))
+    deck = store.create_deck("u1", "deck", [{'term': f"t{n}", 'definition': "d"} for n in range(3)])
+    _, card_id, _ = store.next_due("u1", deck.id)
+    fields = store.review("u1", deck.id, card_id, 5, now=NOW)
+    reloaded = DeckStore(str(tmp_path)).load_deck("u1", deck.id)
+    assert reloaded.cards[card_id] == deck.cards[card_id]
+    assert reloaded.cards[card_id]['due'] == fields['due']
+
+
+def test_a_slow_deck_does_not_block_other_decks(tmp_path, monkeypatch):
+    store = DeckStore(str(tmp_path))
+    slow = store.create_deck("u1", "slow", [{'term': "a", 'definition': "b"}])
+    fast = store.create_deck("u1", "fast", [{'term': "a", 'definition': "b"}])
+    parsing, release = threading.Event(), threading.Event()
+    parse = DeckStore._parse
+
+    def slow_parse(path):
+        if slow.id in path:
+            parsing.set()
+            release.wait(5)
+        return parse(path)
+    monkeypatch.setattr(DeckStore, "_parse", staticmethod(slow_parse))
+    store._decks.clear()
+    worker = threading.Thread(target=store.load_deck, args=("u1", slow.id))
+    worker.start()
+    assert parsing.wait(5)
+    try:
+        assert store.next_due("u1", fast.id) is not None
+    finally:
+        release.set()
+        worker.join()
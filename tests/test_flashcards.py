@@ -0,0 +1,44 @@
+import io
+import json
+
+import flashcards
+from flashcards import document_units, map_reduce_cards, text_units
+from ingest import ingest, iter_document_chunks
+
+
+def make_document(tmp_path, paragraphs=200):
+    text = "\n\n".join(f"paragraph {n} " + "word " * 70 for n in range(paragraphs))
+    return ingest(io.BytesIO(text.encode()), "doc.txt", str(tmp_path), max_tokens=100)
+
+
+def test_document_units_are_spread_and_only_selected_chunks_are_decoded(tmp_path, monkeypatch):
+    document = make_document(tmp_path)
+    texts = [chunk['text'] for chunk in iter_document_chunks(document)]
+    monkeypatch.setattr(flashcards, "MAP_TOKENS", 300)
+    decoded = []
+    loads = json.loads
+    monkeypatch.setattr(json, "loads", lambda line: decoded.append(line) or loads(line))
+    units = list(document_units(document, limit=4))
+    monkeypatch.undo()
+
+    per_unit = 300 * document['chunks'] // document['tokens']
+    all_units = ["\n\n".join(texts[i:i + per_unit]) for i in range(0, len(texts), per_unit)]
+    step = len(all_units) / 4
+    assert units == [all_units[int(i * step)] for i in range(4)]
+    assert len(decoded) == 4 * per_unit
+
+
+def test_small_documents_use_every_unit(tmp_path):
+    document = make_document(tmp_path, paragraphs=20)
+    texts = [chunk['text'] for chunk in iter_document_chunks(document)]
+    assert "\n\n".join(document_units(document)) == "\n\n".join(texts)
+
+
+def test_map_reduce_merges_cards_from_every_unit():
+    content = "\n\n".join(f"topic {n} " + "word " * 2000 for n in range(5))
+    units = text_units(content, limit=3)
+    assert len(units) == 3
+    cards = map_reduce_cards(units, lambda text: [{'term': f"unit {units.index(text)}", 'definition': "d"},
+                                                  {'term': "shared", 'definition': "d"}])
+    # The term every unit produced ranks first
+    assert cards[0]['term'] == "shared" and len(cards) == 4
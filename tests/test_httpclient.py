@@ -0,0 +1,70 @@
+import pytest
+import requests
+
+from httpclient import CircuitBreaker, CircuitOpenError, HttpClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+def make_client(responses, clock):
+    """HttpClient whose session replays ``responses`` (exceptions are raised)"""
+    client = HttpClient(retries=0, backoff=0)
+    client._breakers["api"] = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+
+    def request(method, url, **kwargs):
+        outcome = responses.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+    client.session.request = request
+    return client
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ChunkedEncodingError("broken body"),
+    requests.exceptions.TooManyRedirects("loop"),
+    ValueError("unexpected"),
+])
+def test_half_open_probe_failing_with_other_errors_reopens_then_recovers(error):
+    clock = FakeClock()
+    client = make_client([requests.exceptions.ConnectionError(), requests.exceptions.ConnectionError(),
+                          error, FakeResponse(200)], clock)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.get("http://example.test/", upstream="api")
+    assert client.breaker("api").state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get("http://example.test/", upstream="api")
+
+    # The probe fails with a non-retryable error: the circuit opens again...
+    clock.now += 31
+    with pytest.raises(type(error)):
+        client.get("http://example.test/", upstream="api")
+    assert client.breaker("api").state == "open"
+
+    # ...and the next probe is still let through once the timeout passes
+    clock.now += 31
+    assert client.get("http://example.test/", upstream="api").status_code == 200
+    assert client.breaker("api").state == "closed"
+
+
+def test_retryable_status_is_retried_then_returned():
+    clock = FakeClock()
+    client = make_client([FakeResponse(503), FakeResponse(200)], clock)
+    client.retries = 1
+    assert client.get("http://example.test/", upstream="api").status_code == 200
+    assert client.breaker("api").state == "closed"
@@ -0,0 +1,63 @@
+import io
+import os
+import random
+
+from ingest import _terms, index_path, ingest, iter_document_chunks, relevant_chunks
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+         "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa"]
+
+
+def make_document(tmp_path, paragraphs=300, seed=1):
+    rng = random.Random(seed)
+    text = "\n\n".join(" ".join(rng.choice(WORDS) + str(rng.randrange(40)) for _ in range(60))
+                       for _ in range(paragraphs))
+    return ingest(io.BytesIO(text.encode()), "words.txt", str(tmp_path), max_tokens=100)
+
+
+def scan_relevant_chunks(document, query, budget):
+    """Reference: score every chunk in the file, as relevant_chunks did before the index"""
+    terms = _terms(query) if query else set()
+    keep = max(1, budget // 100)
+    scored = sorted(((len(terms & _terms(chunk['text'])), -chunk['i'], chunk)
+                     for chunk in iter_document_chunks(document)),
+                    key=lambda item: item[:2], reverse=True)[:keep]
+    selected, used = [], 0
+    for _, _, chunk in scored:
+        if used + chunk['tokens'] <= budget:
+            selected.append(chunk)
+            used += chunk['tokens']
+    return sorted(selected, key=lambda chunk: chunk['i'])
+
+
+def test_indexed_lookup_matches_a_full_scan(tmp_path):
+    document = make_document(tmp_path)
+    assert os.path.exists(index_path(document))
+    rng = random.Random(2)
+    queries = [None, "nothing matches here"] + [
+        " ".join(rng.choice(WORDS) + str(rng.randrange(40)) for _ in range(rng.randrange(1, 6)))
+        for _ in range(30)]
+    for query in queries:
+        for budget in (300, 1000):
+            assert relevant_chunks(document, query, budget) == scan_relevant_chunks(document, query, budget)
+
+
+def test_index_built_in_small_batches_matches_a_full_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr("ingest.INDEX_BATCH_CHUNKS", 7)
+    document = make_document(tmp_path)
+    for query in ("alpha3 kilo7", "echo5 golf12 mike30", None):
+        assert relevant_chunks(document, query, 1000) == scan_relevant_chunks(document, query, 1000)
+
+
+def test_index_is_built_for_documents_ingested_without_one(tmp_path):
+    document = make_document(tmp_path)
+    os.unlink(index_path(document))
+    expected = scan_relevant_chunks(document, "alpha3 kilo7", 1000)
+    assert relevant_chunks(document, "alpha3 kilo7", 1000) == expected
+    assert os.path.exists(index_path(document))
+
+
+def test_budget_smaller_than_a_chunk_truncates_the_best_one(tmp_path):
+    document = make_document(tmp_path)
+    [chunk] = relevant_chunks(document, "echo5", budget=10)
+    assert chunk['tokens'] == 10 and len(chunk['text']) <= 40
@@ -0,0 +1,32 @@
+from jobs import JobRunner
+
+
+def test_failed_job_is_run_again_on_resubmit():
+    runner = JobRunner(max_workers=2)
+    calls = []
+
+    def build(job):
+        calls.append(job.id)
+        if len(calls) == 1:
+            raise ValueError("no flashcards were generated")
+        return "deck-1"
+
+    first = runner.submit("flashcards", "u1:text:abc", build)
+    assert first.wait(5)
+    assert first.status == "failed"
+
+    second = runner.submit("flashcards", "u1:text:abc", build)
+    assert second is not first
+    assert second.wait(5)
+    assert second.status == "done" and second.result == "deck-1"
+    assert len(calls) == 2
+
+
+def test_finished_job_is_reused():
+    runner = JobRunner(max_workers=2)
+    first = runner.submit("flashcards", "u1:text:abc", lambda job: "deck-1")
+    assert first.wait(5)
+    assert runner.submit("flashcards", "u1:text:abc", lambda job: "deck-2") is first
+    runner.forget(first)
+    second = runner.submit("flashcards", "u1:text:abc", lambda job: "deck-2")
+    assert second.wait(5) and second.result == "deck-2"
@@ -0,0 +1,39 @@
+import time
+
+import metrics
+from llm import MockModel, stream_content
+
+
+def first_chunk_histogram():
+    return metrics.histogram("llm_first_chunk_seconds") or {'count': 0, 'sum': 0.0}
+
+
+def test_streamed_reply_arrives_in_chunks():
+    model = MockModel(reply="aight bro " * 20, chunk_size=16)
+    chunks = list(stream_content(model, "hi"))
+    assert "".join(chunks) == "aight bro " * 20
+    assert len(chunks) == 13
+    assert model.calls == ["hi"]
+
+
+def test_first_chunk_wait_is_timed_from_the_request():
+    before = first_chunk_histogram()
+    model = MockModel(reply="hello", first_chunk_delay=0.05)
+    stream = stream_content(model, "hi")
+    time.sleep(0.05)  # the caller's own work before iterating counts too
+    assert list(stream) == ["hello"]
+    after = first_chunk_histogram()
+    assert after['count'] == before['count'] + 1
+    assert after['sum'] - before['sum'] >= 0.1
+
+
+def test_first_chunk_wait_includes_time_inside_generate_content():
+    class EagerModel(MockModel):
+        # The real client sends the request (and may read a chunk) inside the call
+        def generate_content(self, contents, stream=False, **kwargs):
+            time.sleep(0.05)
+            return super().generate_content(contents, stream=stream, **kwargs)
+
+    before = first_chunk_histogram()
+    assert list(stream_content(EagerModel(reply="hey"), "hi")) == ["hey"]
+    assert first_chunk_histogram()['sum'] - before['sum'] >= 0.05
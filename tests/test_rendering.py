@@ -0,0 +1,45 @@
+import functools
+
+from rendering import FrameRenderer, history_html, message_html
+
+
+def test_message_html_is_one_block():
+    markup = message_html('assistant', "first\n\n```python\nprint('x')\n\n<div>unclosed")
+    assert "\n\n" not in markup
+    assert "<div>unclosed" not in markup
+    assert "&lt;div&gt;unclosed" in markup
+    assert markup.count("<div") == markup.count("</div>") == 1
+
+
+def test_bad_message_does_not_leak_into_next():
+    blocks = history_html([
+        {'role': 'user', 'content': "<div><b>```"},
+        {'role': 'assistant', 'content': "fine"},
+    ]).split("\n\n")
+    assert len(blocks) == 2
+    assert blocks[1].startswith('<div class="chat-message assistant-message">')
+
+
+def test_frame_renderer_close_returns_raw_text():
+    frames = []
+    renderer = FrameRenderer(frames.append, interval=0)
+    for chunk in ["hello ", "there"]:
+        renderer.feed(chunk)
+    assert renderer.close() == "hello there"
+    assert frames[-1] == "hello there"
+
+
+def test_markdown_renders_and_html_is_escaped():
+    markup = message_html('user', "**bold** and <script>alert(1)</script>\nnext line")
+    assert "<strong>bold</strong>" in markup
+    assert "<script>" not in markup and "&lt;script&gt;" in markup
+    assert "<br />next line" in markup
+
+
+def test_streamed_reply_ends_as_it_shows_in_history():
+    frames = []
+    renderer = FrameRenderer(frames.append, interval=0, style=functools.partial(message_html, 'assistant'))
+    for chunk in ["Okay, **here", "** is `code`\n\n", "- one\n- two"]:
+        renderer.feed(chunk)
+    text = renderer.close()
+    assert frames[-1] == history_html([{'role': 'assistant', 'content': text}])
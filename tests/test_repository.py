@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import repository
+from repository import JsonRepository, SqlRepository
+from storage import save_json
+
+
+def delay_after_users_write(monkeypatch, username, delay=0.1):
+    """Stall ``username``'s sign-up right after users.json is written"""
+    update_json = repository.update_json
+
+    def slow_update_json(path, fn, **kwargs):
+        result = update_json(path, fn, **kwargs)
+        if threading.current_thread().name == username:
+            time.sleep(delay)
+        return result
+    monkeypatch.setattr(repository, "update_json", slow_update_json)
+
+
+def sign_up_concurrently(repo, names, threads=8):
+    results = {}
+    barrier = threading.Barrier(threads)
+
+    def worker(offset):
+        barrier.wait()
+        for i in range(offset, len(names), threads):
+            results[i] = repo.create_user(names[i], "hash", "", f"id-{i}", "2024-01-01T00:00:00")
+
+    workers = [threading.Thread(target=worker, args=(n,), name=names[n]) for n in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return results
+
+
+def test_concurrent_sign_ups_are_all_indexed(tmp_path):
+    repo = JsonRepository(str(tmp_path / "users.json"), str(tmp_path / "chats"))
+    names = [f"user{i}" for i in range(64)]
+    results = sign_up_concurrently(repo, names)
+    assert all(results.values())
+    for i, name in enumerate(names):
+        assert repo.get_user_by_username(name) == (f"id-{i}", {
+            'username': name, 'password': "hash", 'email': "", 'created_at': "2024-01-01T00:00:00"})
+
+
+def test_sign_up_during_another_keeps_both_in_index(tmp_path, monkeypatch):
+    # alice's users.json write lands, then bob signs up before alice's
+    # sign-up finishes; the index must end up with both
+    delay_after_users_write(monkeypatch, "alice")
+    repo = JsonRepository(str(tmp_path / "users.json"), str(tmp_path / "chats"))
+    alice = threading.Thread(target=repo.create_user, name="alice",
+                             args=("alice", "hash", "", "id-alice", "2024-01-01T00:00:00"))
+    alice.start()
+    time.sleep(0.03)
+    assert repo.create_user("bob", "hash", "", "id-bob", "2024-01-01T00:00:00")
+    alice.join()
+    assert repo.get_user_by_username("alice")[0] == "id-alice"
+    assert repo.get_user_by_username("bob")[0] == "id-bob"
+    assert not repo.create_user("bob", "hash", "", "id-bob-2", "2024-01-01T00:00:00")
+
+
+def test_concurrent_duplicate_sign_up_only_one_wins(tmp_path):
+    repo = JsonRepository(str(tmp_path / "users.json"), str(tmp_path / "chats"))
+    results = sign_up_concurrently(repo, ["bob"] * 16)
+    assert sum(results.values()) == 1
+    assert repo.get_user_by_username("bob") is not None
+
+
+def make_repositories(tmp_path):
+    return [JsonRepository(str(tmp_path / "users.json"), str(tmp_path / "chats")),
+            SqlRepository(f"sqlite:///{tmp_path / 'app.db'}")]
+
+
+def test_chats_round_trip_the_same_through_both_backends(tmp_path):
+    attachment = {'name': "notes.pdf", 'sha256': "ab" * 32, 'chunks': 3, 'tokens': 1200}
+    chat = {
+        'user_id': "u1",
+        'title': "notes",
+        'created_at': "2024-01-01T10:00:00",
+        'updated_at': "2024-01-01T10:01:00",
+        'messages': [
+            {'role': "user", 'content': "I've uploaded a file: notes.pdf",
+             'timestamp': "2024-01-01T10:00:00", 'attachment': attachment},
+            {'role': "assistant", 'content': "got it", 'timestamp': "2024-01-01T10:00:05",
+             'prompt_tokens': {'total': 1450, 'history': 200, 'documents': 1250}},
+        ]
+    }
+    followup = {'role': "assistant", 'content': "more", 'timestamp': "2024-01-01T10:01:00",
+                'prompt_tokens': None}
+    loaded = []
+    for repo in make_repositories(tmp_path):
+        repo.save_chat("c1", chat)
+        repo.save_chat("c1", {**chat, 'messages': chat['messages'] + [followup]}, base_count=2)
+        loaded.append(repo.load_chat("c1")['messages'])
+    assert loaded[0] == loaded[1] == chat['messages'] + [followup]
+
+
+def test_existing_database_gains_the_extra_column(tmp_path):
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, chat_id VARCHAR, "
+                           "role VARCHAR, content VARCHAR, timestamp DATETIME)")
+    repo = SqlRepository(f"sqlite:///{path}")
+    repo.save_chat("c1", {'user_id': "u1", 'messages': [
+        {'role': "user", 'content': "hi", 'timestamp': "2024-01-01T10:00:00", 'attachment': {'name': "a.txt"}}]})
+    assert repo.load_chat("c1")['messages'][0]['attachment'] == {'name': "a.txt"}
+
+
+def test_baseline_users_table_gains_the_uid_column(tmp_path):
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR UNIQUE, "
+                           "email VARCHAR UNIQUE, password_hash VARCHAR, created_at DATETIME)")
+    repo = SqlRepository(f"sqlite:///{path}")
+    assert repo.create_user("ann", "hash", "", "id-1", "2024-01-01T00:00:00")
+    assert repo.get_user_by_username("ann")[0] == "id-1"
+    with pytest.raises(sqlite3.IntegrityError), sqlite3.connect(path) as connection:
+        connection.execute("INSERT INTO users (username, uid) VALUES ('bob', 'id-1')")
+
+
+def test_duplicate_email_is_reported_separately(tmp_path):
+    repo = SqlRepository(f"sqlite:///{tmp_path / 'app.db'}")
+    assert repo.create_user("ann", "hash", "a@example.com", "id-1", "2024-01-01T00:00:00")
+    assert not repo.create_user("ann", "hash", "b@example.com", "id-2", "2024-01-01T00:00:00")
+    with pytest.raises(repository.EmailTakenError):
+        repo.create_user("bob", "hash", "a@example.com", "id-3", "2024-01-01T00:00:00")
+    assert repo.get_user_by_username("bob") is None
+
+
+def test_import_keeps_users_whose_email_is_taken(tmp_path):
+    users = {"id-1": {'username': "ann", 'password': "hash", 'email': "a@example.com"},
+             "id-2": {'username': "bob", 'password': "hash", 'email': "a@example.com"}}
+    save_json(str(tmp_path / "users.json"), users)
+    repo = SqlRepository(f"sqlite:///{tmp_path / 'app.db'}")
+    assert repository.import_json_data(repo, str(tmp_path / "users.json"), str(tmp_path / "chats")) == (2, 0)
+    assert repo.get_user_by_username("bob")[1]['email'] is None
@@ -0,0 +1,160 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from conftest import ROOT
+from storage import ChatStore, FileCache, file_lock
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    loads = []
+
+    def loader(path):
+        loads.append(path)
+        with open(path) as f:
+            return {'text': f.read()}
+
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(str(i))
+        paths.append(str(path))
+    cache = FileCache("test", loader, maxsize=2)
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])  # 0 is now the most recently used
+    cache.get(paths[2])  # evicts 1
+    assert cache.stats()['entries'] == 2
+    loads.clear()
+    cache.get(paths[0])
+    assert loads == []
+    cache.get(paths[1])
+    assert loads == [paths[1]]
+
+
+def make_chat(user_id, n):
+    return {'user_id': user_id, 'title': f"chat {n}", 'created_at': "2024-01-01T00:00:00",
+            'updated_at': f"2024-01-01T00:00:{n:02d}",
+            'messages': [{'role': 'user', 'content': f"hi {n}", 'timestamp': "2024-01-01T00:00:00"}]}
+
+
+def test_rebuild_and_load_all_leave_cache_alone(tmp_path):
+    store = ChatStore(str(tmp_path / "chats"))
+    for n in range(20):
+        store.save_chat(f"c{n}", make_chat("u1", n))
+    store._cache.maxsize = 5
+    store._cache._entries.clear()
+    store.rebuild_manifests()
+    assert len(store.load_all()) == 20
+    assert store._cache.stats()['entries'] == 0
+    assert store.count_user_chats("u1") == 20
+    for n in range(20):
+        store.load_chat(f"c{n}")
+    assert store._cache.stats()['entries'] == 5
+
+
+def test_saves_to_other_chats_do_not_wait_for_a_busy_chat(tmp_path):
+    store = ChatStore(str(tmp_path / "chats"))
+    store.save_chat("busy", make_chat("u1", 0))
+    inside, release, done = threading.Event(), threading.Event(), threading.Event()
+    sync_manifest = store._sync_manifest
+
+    def stalled_sync_manifest(chat_id):
+        # Park the "busy" save while it holds everything a save holds
+        if chat_id == "busy":
+            inside.set()
+            release.wait(5)
+        sync_manifest(chat_id)
+    store._sync_manifest = stalled_sync_manifest
+
+    busy = threading.Thread(target=store.append_message, args=("busy", {'role': 'user', 'content': "x"}))
+    busy.start()
+    assert inside.wait(5)
+
+    def save_other():
+        store.save_chat("other", make_chat("u2", 1))
+        done.set()
+    threading.Thread(target=save_other).start()
+    try:
+        assert done.wait(2)
+    finally:
+        release.set()
+        busy.join()
+
+
+# Run in separate interpreters: args are the store root, worker number,
+# comma-separated chat ids and message count
+APPEND_SCRIPT = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from storage import ChatStore
+root, worker, chats, count = sys.argv[2], sys.argv[3], sys.argv[4].split(","), int(sys.argv[5])
+store = ChatStore(root)
+for i in range(count):
+    store.append_message(chats[i % len(chats)],
+                         {'role': 'user', 'content': f"{worker}:{i}", 'timestamp': "2024-01-01T00:00:00"},
+                         user_id="u1", updated_at=f"2024-01-01T00:00:{i % 60:02d}")
+"""
+
+
+def test_multi_process_appends_keep_every_message(tmp_path):
+    root = str(tmp_path / "chats")
+    ChatStore(root)
+    chats = ["shared", "a", "b"]
+    workers, count = 4, 30
+    processes = [subprocess.Popen([sys.executable, "-c", APPEND_SCRIPT, ROOT, root, str(w),
+                                   ",".join(chats), str(count)])
+                 for w in range(workers)]
+    for process in processes:
+        assert process.wait(60) == 0
+
+    store = ChatStore(root)
+    contents = []
+    for chat_id in chats:
+        contents.extend(message['content'] for message in store.load_chat(chat_id)['messages'])
+    assert sorted(contents) == sorted(f"{w}:{i}" for w in range(workers) for i in range(count))
+    manifest = {chat['id']: chat['message_count'] for chat in store.list_user_chats("u1")}
+    assert manifest == {chat_id: len(store.load_chat(chat_id)['messages']) for chat_id in chats}
+
+
+def test_delete_chat_removes_segment_and_lock(tmp_path):
+    store = ChatStore(str(tmp_path / "chats"))
+    store.save_chat("c1", make_chat("u1", 0))
+    store.append_message("c1", {'role': 'user', 'content': "more"})
+    store.delete_chat("c1")
+    assert sorted(os.listdir(tmp_path / "chats")) == ["_manifests"]
+    assert store.count_user_chats("u1") == 0
+
+
+def test_file_lock_is_exclusive_when_its_file_is_removed_while_held(tmp_path):
+    path = str(tmp_path / "chat.jsonl")
+    holders, overlaps = [], []
+
+    def hold():
+        with file_lock(path):
+            holders.append(1)
+            overlaps.append(len(holders) > 1)
+            time.sleep(0.05)
+            holders.pop()
+
+    with file_lock(path):
+        waiting = threading.Thread(target=hold)
+        waiting.start()
+        time.sleep(0.05)
+        os.remove(f"{path}.lock")
+    hold()
+    waiting.join()
+    assert overlaps == [False, False]
+
+
+def test_save_after_delete_does_not_recreate_the_chat(tmp_path):
+    store = ChatStore(str(tmp_path / "chats"))
+    chat = make_chat("u1", 0)
+    store.save_chat("c1", chat)
+    store.delete_chat("c1")
+    followup = {'role': 'user', 'content': "still there?"}
+    store.save_chat("c1", {'messages': chat['messages'] + [followup]}, base_count=1)
+    assert store.load_chat("c1") is None
+    assert store.count_user_chats("u1") == 0
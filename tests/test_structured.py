@@ -0,0 +1,77 @@
+import json
+
+from structured import generate_items, parse_questions, parse_quiz_lines
+
+
+def quiz_lines(n):
+    return (f"Q: question {n}?\nA) one\nB) two\nC) three\nD) four\nCorrect: B\n")
+
+
+def make_items(start, count):
+    return [{'question': f"question {n}?", 'options': ["one", "two", "three", "four"], 'correct': "A"}
+            for n in range(start, start + count)]
+
+
+def test_parse_quiz_lines_reads_the_legacy_format():
+    [item] = parse_quiz_lines(quiz_lines(1))
+    assert item['question'] == "question 1?"
+    assert item['options'] == ["A) one", "B) two", "C) three", "D) four"]
+    assert item['correct'] == "B"
+
+
+def test_options_before_any_question_are_ignored():
+    # The old parser crashed here: an option line with no current question
+    text = "A) quick note: answers are below each question\n" + quiz_lines(1)
+    [item] = parse_quiz_lines(text)
+    assert item['question'] == "question 1?" and len(item['options']) == 4
+
+
+def test_parse_quiz_lines_tolerates_drift():
+    text = ("1. **Q:** first?\na) one\nb) two\nc) three\nd) four\n**Correct:** c\n\n"
+            "Question 2: second?\nA. one\nB. two\nC. three\nD. four\nAnswer: D\n")
+    questions = parse_questions(text)
+    assert [q['question'] for q in questions] == ["first?", "second?"]
+    assert [q['correct'] for q in questions] == ["C", "D"]
+    assert [option['text'] for option in questions[0]['options']] == ["one", "two", "three", "four"]
+
+
+def test_incomplete_questions_are_dropped():
+    text = quiz_lines(1) + "Q: no options?\nCorrect: A\n" + quiz_lines(2).replace("D) four\n", "")
+    assert [q['question'] for q in parse_questions(text)] == ["question 1?"]
+
+
+def test_generate_items_repairs_only_the_shortfall():
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            return json.dumps(make_items(0, 3))
+        # The repair answer repeats one question the model already gave
+        return json.dumps(make_items(2, 3))
+    questions = generate_items(generate, "quiz prompt", parse_questions, 5, "quiz",
+                               describe=lambda question: question['question'])
+    assert len(prompts) == 2
+    assert "return exactly 2 more quiz" in prompts[1]
+    assert "question 0?" in prompts[1]
+    assert [q['question'] for q in questions] == [f"question {n}?" for n in range(5)]
+
+
+def test_generate_items_does_not_repair_a_complete_response():
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return json.dumps(make_items(0, 6))
+    assert len(generate_items(generate, "quiz prompt", parse_questions, 5, "quiz")) == 5
+    assert len(prompts) == 1
+
+
+def test_generate_items_returns_what_it_has_after_the_last_repair():
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return json.dumps(make_items(0, 2)) if len(prompts) == 1 else "sorry, can't help"
+    questions = generate_items(generate, "quiz prompt", parse_questions, 5, "quiz", max_repairs=2)
+    assert len(questions) == 2 and len(prompts) == 3
@@ -0,0 +1,116 @@
+import http.server
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+import weather
+from weather import WeatherCache, fetch_openweather
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubOpenWeather(http.server.BaseHTTPRequestHandler):
+    """Answers like the current-weather endpoint; "nowhere" gets a 401"""
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    requests = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        location = parse_qs(urlsplit(self.path).query)['q'][0]
+        with self.lock:
+            self.requests[location] += 1
+        time.sleep(self.delay)
+        if location == "nowhere":
+            status, body = 401, {'cod': 401, 'message': "Invalid API key"}
+        else:
+            status, body = 200, {'weather': [{'main': "Clear", 'description': "clear sky"}],
+                                 'main': {'temp': 21.5}}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    StubOpenWeather.delay = 0.0
+    StubOpenWeather.requests = Counter()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubOpenWeather)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(weather, "OPENWEATHER_URL", f"http://127.0.0.1:{server.server_address[1]}/weather")
+    yield StubOpenWeather
+    server.shutdown()
+    server.server_close()
+
+
+def make_cache(clock=None):
+    return WeatherCache(lambda location: fetch_openweather(location, "test-key"),
+                        ttl=600, clock=clock or FakeClock())
+
+
+def test_concurrent_lookups_share_one_request(stub):
+    stub.delay = 0.2
+    cache = make_cache()
+    barrier = threading.Barrier(8)
+    results = []
+
+    def lookup(location):
+        barrier.wait()
+        results.append(cache.get(location))
+
+    threads = [threading.Thread(target=lookup, args=(name,))
+               for name in ["Paris", "paris", " PARIS "] * 2 + ["Paris"] * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The first caller's spelling goes upstream; the others wait for it
+    assert sum(stub.requests.values()) == 1
+    assert len(results) == 8 and all(result == results[0] for result in results)
+    assert results[0]['temp_c'] == 21.5 and results[0]['source'] == 'openweathermap'
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced']) == (1, 7)
+
+
+def test_records_expire_after_the_ttl(stub):
+    clock = FakeClock()
+    cache = make_cache(clock)
+    cache.get("Rome")
+    clock.now = 599
+    cache.get("Rome")
+    assert stub.requests["Rome"] == 1
+    clock.now = 601
+    cache.get("Rome")
+    assert stub.requests["Rome"] == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_errors_are_not_cached(stub):
+    cache = make_cache()
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            cache.get("nowhere")
+    assert stub.requests["nowhere"] == 2
+    stats = cache.stats()
+    assert stats['errors'] == 2 and stats['entries'] == 0
+    # A failure doesn't stop other locations from being cached
+    cache.get("Oslo")
+    cache.get("Oslo")
+    assert stub.requests["Oslo"] == 1
@@ -0,0 +1,159 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from httpclient import get_client
+
+# Current-weather endpoint; override to point at a local stub server
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+
+# How long a fetched observation is reused for the same location
+WEATHER_TTL = int(os.getenv("SIGMABOT_WEATHER_TTL", "600"))
+
+
+def normalize_location(location):
+    """Cache key for a location: case- and whitespace-insensitive"""
+    return " ".join(str(location).split()).casefold()
+
+
+def celsius_to_fahrenheit(temp):
+    return (temp * 9/5) + 32
+
+
+def format_weather(record, unit="Celsius"):
+    """Format a raw weather record for display in ``unit``.
+
+    Records keep the temperature in Celsius, so switching units is just a
+    different format call. Plain strings (data saved before records were
+    introduced) are returned unchanged.
+    """
+    if not isinstance(record, dict):
+        return record
+    condition = record.get('condition', '')
+    if record.get('description'):
+        condition = f"{condition} ({record['description']})"
+    temp = record['temp_c']
+    if unit == "Fahrenheit":
+        return f"{condition}, {celsius_to_fahrenheit(temp):.1f}°F"
+    return f"{condition}, {temp:.1f}°C"
+
+
+def dummy_weather():
+    """Random weather record used when the API is unavailable"""
+    conditions = ["Sunny", "Partly Cloudy", "Rainy", "Clear", "Overcast", "Thunderstorms", "Snowy", "Foggy"]
+    return {'condition': random.choice(conditions), 'description': None,
+            'temp_c': float(random.randint(15, 30)), 'source': 'dummy'}
+
+
+def fetch_openweather(location, api_key, url=None, timeout=None):
+    """Fetch current weather from OpenWeatherMap and return a raw record.
+
+    Raises on HTTP errors or malformed responses; callers decide on fallbacks.
+    """
+    response = get_client().get(url or OPENWEATHER_URL, upstream="openweathermap",
+                                params={"q": location, "appid": api_key, "units": "metric"},
+                                timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    return {
+        'condition': data["weather"][0]["main"],
+        'description': data["weather"][0]["description"],
+        'temp_c': float(data["main"]["temp"]),
+        'source': 'openweathermap',
+    }
+
+
+class WeatherCache:
+    """Process-wide cache of weather records keyed by normalized location.
+
+    Records are reused for ``ttl`` seconds. Concurrent lookups of the same
+    location while a fetch is in flight wait for that fetch instead of
+    starting their own, so N sessions planning a trip to the same city cost
+    one upstream call. Failed fetches are not cached.
+    """
+
+    def __init__(self, fetch, ttl=WEATHER_TTL, clock=time.monotonic):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    def _count(self, stat):
+        self._stats[stat] += 1
+        metrics.incr("weather_cache_total", result=stat)
+
+    def get(self, location):
+        key = normalize_location(location)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] < self.ttl:
+                self._count('hits')
+                return entry[1]
+            future = self._inflight.get(key)
+            if future is not None:
+                self._count('coalesced')
+                leader = False
+            else:
+                self._count('misses')
+                future = self._inflight[key] = Future()
+                leader = True
+        if not leader:
+            return future.result()
+
+        try:
+            record = self.fetch(location)
+        except Exception as e:
+            with self._lock:
+                self._count('errors')
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = (self.clock(), record)
+            del self._inflight[key]
+        future.set_result(record)
+        return record
+
+    def invalidate(self, location=None):
+        with self._lock:
+            if location is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(normalize_location(location), None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['coalesced']) / lookups if lookups else 0.0
+        return stats
+
+
+_weather_cache = None
+_weather_cache_lock = threading.Lock()
+
+
+def get_weather_cache():
+    global _weather_cache
+    with _weather_cache_lock:
+        if _weather_cache is None:
+            _weather_cache = WeatherCache(
+                lambda location: fetch_openweather(location, os.getenv("OPENWEATHER_API_KEY", "")))
+        return _weather_cache
+
+
+def get_weather(location):
+    """Return a weather record for ``location``, falling back to dummy data"""
+    if not os.getenv("OPENWEATHER_API_KEY", ""):
+        return dummy_weather()
+    try:
+        return get_weather_cache().get(location)
+    except Exception:
+        return dummy_weather()